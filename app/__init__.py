@@ -3,6 +3,7 @@ from apispec import APISpec
 from flask_restful import Api
 from apispec.ext.marshmallow import MarshmallowPlugin
 from flask_apispec.extension import FlaskApiSpec
+from app.serialization import jsonify
 
 """
 Initialiasing application instance with Flask Framework and applying secret key to the application
@@ -23,38 +24,41 @@ application.config.update({
         openapi_version='2.0.0'
     ),
     'APISPEC_SWAGGER_URL': '/swagger/',  # URI to access API Doc JSON
-    'APISPEC_SWAGGER_UI_URL': '/swagger-ui/'  # URI to access UI of API Doc
+    'APISPEC_SWAGGER_UI_URL': '/swagger-ui/',  # URI to access UI of API Doc
+    'APISPEC_FORMAT_RESPONSE': jsonify  # one shared JSON encoder for every response
 })
 docs = FlaskApiSpec(application)
 
+from app import metrics
+metrics.install(application)  # first, so the request time includes the other before_request functions
+from app import compression
+compression.install(application)
+
 from app.models import *
+from app.migrations import migrate
+from app import explain
+from app.provisioning import has_users, provision_users, seed_users
+from app.leaderboard import leaderboard
+from app.search import question_search
+from app.gradingqueue import grading_queue
 
 def add_user():
+    """
+    Seed the development users on the very first start. The emptiness check is an EXISTS probe
+    so startup cost does not grow with the size of user_master. Their passwords are left in plain
+    text, which keeps the first start fast, and are hashed on each user's first login.
+    """
     try:
-        users = UserMaster.query.all()
-        if users:
+        if has_users():
             return
-        users = [
-            {
-                'id': str(i),
-                'name': 'admin' if i == 10000 else 'user' + str(i),
-                'username': 'admin' if i == 10000 else 'user' + str(i),
-                'password': 'admin' if i == 10000 else 'user' + str(i),
-                'is_admin': 1 if i == 10000 else 0
-            } for i in range(10000, 11001)
-        ]
-        for user in users:
-            user_entry = UserMaster(
-                id=user['id'],
-                name=user['name'],
-                username=user['username'],
-                password=user['password'],
-                is_admin=user['is_admin']
-            )
-            db.session.add(user_entry)
-        db.session.commit()
+        report = provision_users(seed_users(), hashed=False)
+        print(f'users seed: {report}')
     except Exception as e:
         print(f'{e}')
 
 with application.app_context():
+    migrate()
     add_user()
+    leaderboard.rebuild()
+    question_search.rebuild()
+    grading_queue.recover()
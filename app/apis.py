@@ -1,10 +1,17 @@
-from app.models import UserSession
+import io
 from app import *
+from app import metrics
+from flask import Response, request, stream_with_context
 from flask_restful import Resource
 from flask_apispec.views import MethodResource
 from flask_apispec import marshal_with, doc, use_kwargs
-from app.schemas import (QuestionMasterSchema, CreateQuizSchema, UserMasterSchema, AssignQuizSchema, UserResponseSchema, LoginSchema, UnifiedAPIResponseSchema, ViewQuizSchema, UnifiedViewResponseSchema)
-from app.services import session, add_user, add_session, add_question, list_questions, add_quiz, assign_quiz, view_quiz, list_assigned_quizzes, list_quizzes, attempt_quiz, all_quiz_result
+from app.schemas import (QuestionMasterSchema, CreateQuizSchema, UserMasterSchema, AssignQuizSchema, UserResponseSchema, LoginSchema, ViewQuizSchema,
+                         BulkQuestionUploadSchema, BulkUserSchema, api_response_schema, bulk_report_response_schema,
+                         PageSchema, QuizResultPageSchema, ExportResultSchema,
+                         LeaderboardSchema, UserSchema, UserRoleSchema, GroupSchema, GroupMembersSchema,
+                         GroupMemberPageSchema, SearchQuestionSchema, AutosaveSchema, SubmissionStatusSchema)
+from app.conditional import entity_tag, not_modified, validator_headers
+from app.services import session, add_user, bulk_add_users, login, end_session, revoke_user_sessions, set_user_role, add_question, bulk_add_questions, list_questions, questions_version, search_questions, add_quiz, assign_quiz, view_quiz, quiz_version, list_assigned_quizzes, list_quizzes, quizzes_version, attempt_quiz, submit_quiz, submission_status, autosave_answers, regrade_quiz, all_quiz_result, export_quiz_results, quiz_leaderboard, quiz_statistics, create_group, add_group_members, list_group_members, list_groups
 
 
 def _view_generator(status, _response, *messages):
@@ -13,7 +20,7 @@ def _view_generator(status, _response, *messages):
 
     Args:
         status (int): The status of the response.
-        _response (int or list): The response data.
+        _response (int, list or dict): The response data.
         *messages (str): The optional messages to include in the response.
 
     Returns:
@@ -27,24 +34,46 @@ def _view_generator(status, _response, *messages):
             - If the response is an integer:
                 - If the response is 1, the message at index 0 will be included in the response.
                 - If the response is not 1, the message at index 1 will be included in the response.
-            - If the response is a list, the response will be serialized using UnifiedViewResponseSchema.
+            - If the response is a list, it is returned as is under 'response' and encoded by app.serialization,
+              keeping the native types of the values (UnifiedViewResponseSchema documents the shape).
+            - If the response is a page (dict with response and next_cursor), it is returned the same way
+              (UnifiedPageResponseSchema documents the shape).
         - If the status is not 1, an exception will be raised with the given status.
 
     """
     if status == 1:
         if type(_response) == type(1):
             if _response == 1:
-                return UnifiedAPIResponseSchema().dump(dict(message=messages[0])), 200
+                return api_response_schema.dump(dict(message=messages[0])), 200
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message=messages[1])), 404
+                return api_response_schema.dump(dict(message=messages[1])), 404
         elif type(_response) == type([]):
-            return UnifiedViewResponseSchema().dump(dict(response=_response)), 200
+            return dict(response=_response), 200
+        elif type(_response) == type({}):
+            return dict(response=_response['response'], next_cursor=_response['next_cursor']), 200
         else:
-            return UnifiedAPIResponseSchema().dump(dict(message=messages[0])), 200
+            return api_response_schema.dump(dict(message=messages[0])), 200
     else:
         raise Exception(status)
 
 
+def _with_validators(view, tag, version):
+    """
+    Add the ETag and Last-Modified headers of a result to its response, when the result was found.
+    """
+    body, status = view
+    return (body, status, validator_headers(tag, version)) if status == 200 else view
+
+
+def _not_modified(tag, version):
+    """
+    The 304 response to a request whose copy of the result is still valid, None otherwise.
+    """
+    if not_modified(request.headers, tag, version):
+        return Response(status=304, headers=validator_headers(tag, version))
+    return None
+
+
 """
 [Sign Up API] : Its responsibility is to perform the signup activity for the user.
 """
@@ -52,19 +81,57 @@ def _view_generator(status, _response, *messages):
 class SignUpAPI(MethodResource, Resource):
     @doc(description="Sign Up API", tags=["RIO APIs"])
     @use_kwargs(UserMasterSchema, location=('json'))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(api_response_schema)
     def post(self, **kwargs):
         try:
             status, _response = add_user(**kwargs)
             message_success=f"User {kwargs['username']} is created successfully"
             return _view_generator(status, _response, message_success)
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while creating USER, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while creating USER, error:{str(e)}")), 500
             
 
 api.add_resource(SignUpAPI, '/signup')
 docs.register(SignUpAPI)
 
+"""
+[Bulk User API] : Its responsibility is to onboard a whole cohort of users in one call.
+Admin has only the rights to perform this activity.
+"""
+class BulkUserAPI(MethodResource, Resource):
+    @doc(description="""
+         [Bulk User API] : Its responsibility is to onboard a whole cohort of users in one call.
+         Users whose username already exists are skipped. Admin has only the rights to perform this activity.
+         [Input Format] :   {
+                                "users": [
+                                    {"name": "name", "username": "username", "password": "password", "is_admin": 0},
+                                    ...
+                                ],
+                                "chunk_size": 500
+                            }
+                            or multipart/form-data with a csv in the file field having
+                            name, username, password and is_admin columns
+         """, tags=["RIO APIs"])
+    @use_kwargs(BulkUserSchema, location=('json_or_form'))
+    @marshal_with(bulk_report_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                upload = request.files.get('file')
+                if upload is not None:
+                    kwargs['file'] = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+                status, _response = bulk_add_users(**kwargs)
+                _response['message'] = f"Users are provisioned, {_response['failed']} rows failed"
+                return bulk_report_response_schema.dump(_response), 200
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can provision users")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while provisioning USERS, error:{str(e)}")), 500
+
+
+api.add_resource(BulkUserAPI, '/bulk.users')
+docs.register(BulkUserAPI)
+
 """
 [Login API] : Its responsibility is to perform the login activity for the user and 
 create session id which will be used for all subsequent operations.
@@ -72,18 +139,15 @@ create session id which will be used for all subsequent operations.
 class LoginAPI(MethodResource, Resource):
     @doc(descrition="Login API", tags=["RIO APIs"])
     @use_kwargs(LoginSchema, location=('json'))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(api_response_schema)
     def post(self, **kwargs):
         try:
-            user = UserMaster.query.filter_by(username=kwargs['username'], password=kwargs['password']).first()
-            if user:
-                status, _response = add_session(user=user)
-                message=f"User {kwargs['username']} is logged in successfully"
-                return _view_generator(status, _response, message)
-            else:
-                return UnifiedAPIResponseSchema().dump(dict(message=f"User {kwargs['username']} does not exist")), 404
+            status, _response = login(**kwargs)
+            message=f"User {kwargs['username']} is logged in successfully"
+            message_not_exist = f"User {kwargs['username']} does not exist"
+            return _view_generator(status, _response, message, message_not_exist)
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while logging USER, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while logging USER, error:{str(e)}")), 500
         
 
 api.add_resource(LoginAPI, '/login')
@@ -94,24 +158,76 @@ docs.register(LoginAPI)
 """
 class LogoutAPI(MethodResource, Resource):
    @doc(description="Logout API", tags=["RIO APIs"])
-   @marshal_with(UnifiedAPIResponseSchema)
+   @marshal_with(api_response_schema)
    def post(self):
         try:
             if session.get('user_id') and session.get('session_id'):
-                user = UserMaster.query.filter_by(id=session['user_id']).first()
-                user.is_active = 0
-                user_session = UserSession.query.filter_by(session_id=session['session_id']).first()
-                user_session.is_active = 0
-                db.session.commit()
+                status, _response = end_session()
             session.clear()
-            return UnifiedAPIResponseSchema().dump(dict(message="User has logged out successfully")), 200
+            return api_response_schema.dump(dict(message="User has logged out successfully")), 200
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while logging out USER, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while logging out USER, error:{str(e)}")), 500
             
 
 api.add_resource(LogoutAPI, '/logout')
 docs.register(LogoutAPI)
 
+"""
+[Revoke Sessions API] : Its responsibility is to log a user out of every session. Only Admin can perform this API call.
+"""
+class RevokeSessionAPI(MethodResource, Resource):
+    @doc(description="""
+         [Revoke Sessions API] : Its responsibility is to log a user out of every session. Only Admin can perform this API call.
+         [Input Format] :   {
+                                "user_id": "id of the user"
+                            }
+         """, tags=["RIO APIs"])
+    @use_kwargs(UserSchema, location=('json'))
+    @marshal_with(api_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = revoke_user_sessions(**kwargs)
+                return _view_generator(status, _response, f"Sessions of user {kwargs['user_id']} are revoked")
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can revoke sessions")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while revoking sessions, error:{str(e)}")), 500
+
+
+api.add_resource(RevokeSessionAPI, '/revoke.sessions')
+docs.register(RevokeSessionAPI)
+
+"""
+[User Role API] : Its responsibility is to grant or withdraw the admin role of a user. Only Admin can perform this API call.
+"""
+class UserRoleAPI(MethodResource, Resource):
+    @doc(description="""
+         [User Role API] : Its responsibility is to grant or withdraw the admin role of a user.
+         Live sessions of the user pick the change up on their next request. Only Admin can perform this API call.
+         [Input Format] :   {
+                                "user_id": "id of the user",
+                                "is_admin": 0 or 1
+                            }
+         """, tags=["RIO APIs"])
+    @use_kwargs(UserRoleSchema, location=('json'))
+    @marshal_with(api_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = set_user_role(**kwargs)
+                message_success = f"Role of user {kwargs['user_id']} is updated"
+                message_not_exist = f"User {kwargs['user_id']} does not exist"
+                return _view_generator(status, _response, message_success, message_not_exist)
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can change roles")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while changing role, error:{str(e)}")), 500
+
+
+api.add_resource(UserRoleAPI, '/user.role')
+docs.register(UserRoleAPI)
+
 """
 [Add Question API] : Its responsibility is to add question to the question bank.
 Admin has only the rights to perform this activity.
@@ -122,7 +238,7 @@ class AddQuestionAPI(MethodResource, Resource):
          Admin has only the rights to perform this activity.
          """, tags=["Questions"])
     @use_kwargs(QuestionMasterSchema, location=('json'))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(api_response_schema)
     def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
@@ -130,14 +246,49 @@ class AddQuestionAPI(MethodResource, Resource):
                 message=f"Question {kwargs['question']} has created successfully"
                 return _view_generator(status, _response, message)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can add the questions")), 404
+                return api_response_schema.dump(dict(message="Only Admin can add the questions")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while creating QUESTION, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while creating QUESTION, error:{str(e)}")), 500
 
 
 api.add_resource(AddQuestionAPI, '/add.question')
 docs.register(AddQuestionAPI)
 
+"""
+[Bulk Question Upload API] : Its responsibility is to import a whole csv question bank in one call.
+Admin has only the rights to perform this activity.
+"""
+class BulkQuestionUploadAPI(MethodResource, Resource):
+    @doc(description="""
+         [Bulk Question Upload API] : Its responsibility is to import a whole csv question bank in one call.
+         Questions already present (same question text and choices) are updated or skipped depending on the mode.
+         Admin has only the rights to perform this activity.
+         [Input Format] :   multipart/form-data with
+                                file: csv with Question, Choice1..Choice4, Answer, Marks, Remarks columns
+                                chunk_size: rows written per statement (default 500)
+                                mode: "update" or "skip" (default "update")
+         """, tags=["Questions"])
+    @use_kwargs(BulkQuestionUploadSchema, location=('form'))
+    @marshal_with(bulk_report_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                upload = request.files.get('file')
+                if upload is None:
+                    return api_response_schema.dump(dict(message="csv file is required in the file field")), 400
+                csvfile = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+                status, _response = bulk_add_questions(file=csvfile, **kwargs)
+                _response['message'] = f"Questions are imported, {_response['failed']} rows failed"
+                return bulk_report_response_schema.dump(_response), 200
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can upload the questions")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while uploading QUESTIONS, error:{str(e)}")), 500
+
+
+api.add_resource(BulkQuestionUploadAPI, '/bulk.questions')
+docs.register(BulkQuestionUploadAPI)
+
 """
 [List Questions API] : Its responsibility is to list all questions present activly in the question bank.
 Here only Admin can access all the questions.
@@ -146,21 +297,68 @@ class ListQuestionAPI(MethodResource, Resource):
     @doc(description="""
          [List Questions API] : Its responsibility is to list all questions present activly in the question bank.
          only Admin can access all the questions.
+         Results are paginated, pass the returned next_cursor to fetch the next page.
+         Pages carry ETag and Last-Modified, send them back in If-None-Match or If-Modified-Since
+         to get a 304 without a body when the page did not change.
+         [Input Format] :   {
+                                "cursor": "next_cursor of the previous page",
+                                "limit": 100,
+                                "is_active": 1
+                            }
          """, tags=["Questions"])
-    def post(self):
+    @use_kwargs(PageSchema, location=('json'))
+    def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
-                status, _response = list_questions() # return list of questions
-                return _view_generator(status, _response, "Questions are listed successfully")
+                status, version = questions_version(**kwargs) # aggregate of the page's updated_ts
+                tag = entity_tag(request.path, kwargs, version)
+                unchanged = _not_modified(tag, version)
+                if unchanged is not None:
+                    return unchanged
+                status, _response = list_questions(**kwargs) # return page of questions
+                return _with_validators(_view_generator(status, _response, "Questions are listed successfully"),
+                                        tag, version)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can access all the questions")), 404
+                return api_response_schema.dump(dict(message="Only Admin can access all the questions")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while listing questions, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while listing questions, error:{str(e)}")), 500
 
 
 api.add_resource(ListQuestionAPI, '/list.questions')
 docs.register(ListQuestionAPI)
 
+"""
+[Search Questions API] : Its responsibility is to search the question bank. Only Admin can search the questions.
+"""
+class SearchQuestionAPI(MethodResource, Resource):
+    @doc(description="""
+         [Search Questions API] : Its responsibility is to search the question bank by the words of the question,
+         its choices and remarks. Only Admin can search the questions.
+         Every word must match and the last one also matches as a prefix; results are ranked best first
+         and carry the total number of matches. Pass offset to fetch the next page.
+         [Input Format] :   {
+                                "query": "words to search",
+                                "min_marks": 1,
+                                "max_marks": 5,
+                                "offset": 0,
+                                "limit": 20
+                            }
+         """, tags=["Questions"])
+    @use_kwargs(SearchQuestionSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = search_questions(**kwargs) # return ranked page of questions
+                return _view_generator(status, _response, "Questions are searched successfully")
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can search the questions")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while searching questions, error:{str(e)}")), 500
+
+
+api.add_resource(SearchQuestionAPI, '/search.questions')
+docs.register(SearchQuestionAPI)
+
 """
 [Create Quiz API] : Its responsibility is to create quiz and only admin can create quiz using this API.
 """
@@ -175,7 +373,7 @@ class CreateQuizAPI(MethodResource, Resource):
                             }
          """, tags=["Quiz"])
     @use_kwargs(CreateQuizSchema, location=('json'))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(api_response_schema)
     def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
@@ -183,9 +381,9 @@ class CreateQuizAPI(MethodResource, Resource):
                 message = f"Quiz {kwargs['quiz_name']} has created successfully"
                 return _view_generator(status, _response, message)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can create the quiz")), 404
+                return api_response_schema.dump(dict(message="Only Admin can create the quiz")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while creating quiz, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while creating quiz, error:{str(e)}")), 500
 
 
 api.add_resource(CreateQuizAPI, '/create.quiz')
@@ -197,32 +395,156 @@ docs.register(CreateQuizAPI)
 class AssignQuizAPI(MethodResource, Resource):
     @doc(description="""
          [Assign Quiz API] : Its responsibility is to assign quiz to the user. Only Admin can perform this API call.
-         assign quiz to different users at a time.
+         assign quiz to different users at a time, to every user who is not an admin, or to groups of users.
+         Unknown users and groups are reported as failed rows, those which already have the quiz are skipped.
          [Input Format] :   {
-                                "quiz_id": "id of the quiz",
-                                "user_ids": [
-                                    "id1", "id2", "id3"...
-                                ]
+                                "instance": {
+                                    "id of the quiz": ["id1", "id2", "id3"...]
+                                },
+                                "all_users": ["id of a quiz to assign to every non-admin user"...],
+                                "groups": {
+                                    "id of the quiz": ["group id1", "group id2"...]
+                                },
+                                "chunk_size": 500
                             }
          """, tags=["Quiz"])
     @use_kwargs(AssignQuizSchema, location=('json'))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(bulk_report_response_schema)
     def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
-                status, _response = assign_quiz(**kwargs)
-                message_success="Quiz has been assigned respectively to the Users"
-                message_not_exist="Quiz does not exist Please check the quiz id"
-                return _view_generator(status, _response, message_success, message_not_exist)
+                status, _response = assign_quiz(**kwargs) # returns the assignment report
+                if _response == 0:
+                    return api_response_schema.dump(dict(message="Quiz does not exist Please check the quiz id")), 404
+                _response['message'] = f"Quiz has been assigned respectively to the Users, {_response['failed']} rows failed"
+                return bulk_report_response_schema.dump(_response), 200
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can assign the quiz")), 404
+                return api_response_schema.dump(dict(message="Only Admin can assign the quiz")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while assigning quiz, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while assigning quiz, error:{str(e)}")), 500
 
 
 api.add_resource(AssignQuizAPI, '/assign.quiz')
 docs.register(AssignQuizAPI)
 
+"""
+[Create Group API] : Its responsibility is to create a group of users that quizzes can be assigned to.
+                        Only Admin can create a group.
+"""
+class CreateGroupAPI(MethodResource, Resource):
+    @doc(description="""
+         [Create Group API] : Its responsibility is to create a group of users that quizzes can be assigned to.
+         Only Admin can create a group. The message carries the id of the new group.
+         [Input Format] :   {
+                                "group_name": "name of the group"
+                            }
+         """, tags=["Group"])
+    @use_kwargs(GroupSchema, location=('json'))
+    @marshal_with(api_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = create_group(**kwargs) # returns the id of the group
+                message = f"Group {kwargs['group_name']} has created successfully with id {_response}"
+                return _view_generator(status, _response, message)
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can create the group")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while creating group, error:{str(e)}")), 500
+
+
+api.add_resource(CreateGroupAPI, '/create.group')
+docs.register(CreateGroupAPI)
+
+"""
+[Add Group Members API] : Its responsibility is to add users to a group in bulk. Only Admin can add members.
+"""
+class AddGroupMembersAPI(MethodResource, Resource):
+    @doc(description="""
+         [Add Group Members API] : Its responsibility is to add users to a group in bulk. Only Admin can add members.
+         The members get the quizzes assigned to the group. Unknown users are reported as failed rows,
+         users who are already members are skipped.
+         [Input Format] :   {
+                                "group_id": "id of the group",
+                                "user_ids": ["id1", "id2", "id3"...],
+                                "chunk_size": 500
+                            }
+         """, tags=["Group"])
+    @use_kwargs(GroupMembersSchema, location=('json'))
+    @marshal_with(bulk_report_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = add_group_members(**kwargs) # returns the membership report
+                if _response == 0:
+                    return api_response_schema.dump(dict(message="Group does not exist Please check the group id")), 404
+                _response['message'] = f"Users have been added to the group, {_response['failed']} rows failed"
+                return bulk_report_response_schema.dump(_response), 200
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can add group members")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while adding group members, error:{str(e)}")), 500
+
+
+api.add_resource(AddGroupMembersAPI, '/add.members')
+docs.register(AddGroupMembersAPI)
+
+"""
+[Group Members API] : Its responsibility is to list the members of a group. Only Admin can list the members.
+"""
+class GroupMembersAPI(MethodResource, Resource):
+    @doc(description="""
+         [Group Members API] : Its responsibility is to list the members of a group. Only Admin can list the members.
+         Results are paginated, pass the returned next_cursor to fetch the next page.
+         [Input Format] :   {
+                                "group_id": "id of the group",
+                                "cursor": "next_cursor of the previous page",
+                                "limit": 100
+                            }
+         """, tags=["Group"])
+    @use_kwargs(GroupMemberPageSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = list_group_members(**kwargs) # return page of members
+                return _view_generator(status, _response, "Group members are listed successfully")
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can view the group members")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while listing group members, error:{str(e)}")), 500
+
+
+api.add_resource(GroupMembersAPI, '/group.members')
+docs.register(GroupMembersAPI)
+
+"""
+[View All Group API] : Its responsibility is to list all the groups. Admin can only list all groups.
+"""
+class ViewAllGroupAPI(MethodResource, Resource):
+    @doc(description="""
+         [View All Group API] : Its responsibility is to list all the groups.
+         Admin can only list all groups.
+         Results are paginated, pass the returned next_cursor to fetch the next page.
+         [Input Format] :   {
+                                "cursor": "next_cursor of the previous page",
+                                "limit": 100
+                            }
+         """, tags=["Group"])
+    @use_kwargs(PageSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = list_groups(**kwargs) # return page of groups
+                return _view_generator(status, _response, "Groups are listed successfully")
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can view the groups")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while listing groups, error:{str(e)}")), 500
+
+
+api.add_resource(ViewAllGroupAPI, '/all.groups')
+docs.register(ViewAllGroupAPI)
+
 """
 [View Quiz API] : Its responsibility is to view the quiz details.
 Only Admin and the assigned users to this quiz can access the quiz details.
@@ -231,19 +553,27 @@ class ViewQuizAPI(MethodResource, Resource):
     @doc(description="""
          [View Quiz API] : Its responsibility is to view the quiz details.
          Only Admin and the assigned users to this quiz can access the quiz details.
+         The questions carry ETag and Last-Modified, send them back in If-None-Match or If-Modified-Since
+         to get a 304 without a body when the quiz did not change.
          """, tags=["Quiz"])
     @use_kwargs(ViewQuizSchema, location=('json'))
     def post(self, **kwargs):
         try:
             if session.get('user_id'):
-                status, _response = view_quiz(**kwargs) #  returns list of questions for the quiz
+                status, version = quiz_version(**kwargs) # aggregate of the quiz's updated_ts, 0 if not assigned
+                tag = entity_tag(request.path, kwargs, version) if version != 0 else None
+                unchanged = _not_modified(tag, version)
+                if unchanged is not None:
+                    return unchanged
+                status, _response = view_quiz(version=version or None, **kwargs) #  returns list of questions for the quiz
                 message_success = "Quiz has been viewed successfully"
                 message_not_exist="Quiz does not exist or you are not assigned to this quiz"
-                return _view_generator(status, _response, message_success, message_not_exist)
+                return _with_validators(_view_generator(status, _response, message_success, message_not_exist),
+                                        tag, version)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Login to view the quiz details")), 404
+                return api_response_schema.dump(dict(message="Login to view the quiz details")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while viewing quiz, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while viewing quiz, error:{str(e)}")), 500
 
 
 api.add_resource(ViewQuizAPI, '/view.quiz')
@@ -264,9 +594,9 @@ class ViewAssignedQuizAPI(MethodResource, Resource):
                 status, _response = list_assigned_quizzes() #  returns list of quiz_instances assigned to user
                 return _view_generator(status, _response, "Assigned quizzes are listed successfully")
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Login to view the assigned quizzes")), 404
+                return api_response_schema.dump(dict(message="Login to view the assigned quizzes")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while viewing assigned quizzes, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while viewing assigned quizzes, error:{str(e)}")), 500
 
 
 api.add_resource(ViewAssignedQuizAPI, '/assigned.quizzes')
@@ -280,17 +610,32 @@ class ViewAllQuizAPI(MethodResource, Resource):
     @doc(description="""
          [View All Quiz API] : Its responsibility is to list all the created quizzes.
          Admin can only list all quizzes.
+         Results are paginated, pass the returned next_cursor to fetch the next page.
+         Pages carry ETag and Last-Modified, send them back in If-None-Match or If-Modified-Since
+         to get a 304 without a body when the page did not change.
+         [Input Format] :   {
+                                "cursor": "next_cursor of the previous page",
+                                "limit": 100,
+                                "is_active": 1
+                            }
          """, tags=["Quiz"])
-    # @marshal_with(UnifiedAPIResponseSchema)
-    def post(self):
+    # @marshal_with(api_response_schema)
+    @use_kwargs(PageSchema, location=('json'))
+    def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
-                status, _response = list_quizzes() # return list of quizzes
-                return _view_generator(status, _response, "Quizzes are listed successfully")
+                status, version = quizzes_version(**kwargs) # aggregate of the page's updated_ts
+                tag = entity_tag(request.path, kwargs, version)
+                unchanged = _not_modified(tag, version)
+                if unchanged is not None:
+                    return unchanged
+                status, _response = list_quizzes(version=version, **kwargs) # return page of quizzes
+                return _with_validators(_view_generator(status, _response, "Quizzes are listed successfully"),
+                                        tag, version)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can view the quiz")), 404
+                return api_response_schema.dump(dict(message="Only Admin can view the quiz")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while viewing quiz, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while viewing quiz, error:{str(e)}")), 500
 
 
 api.add_resource(ViewAllQuizAPI, '/all.quizzes')
@@ -316,47 +661,295 @@ class AttemptQuizAPI(MethodResource, Resource):
                             }
          """, tags=["Quiz"])
     @use_kwargs(UserResponseSchema, location=("json"))
-    @marshal_with(UnifiedAPIResponseSchema)
+    @marshal_with(api_response_schema)
     def post(self, **kwargs):
         try:
             if session.get('user_id'):
                 status, _response = attempt_quiz(**kwargs) # return attempted quiz score
                 message_success=f"score achieved: {_response.score_achieved if _response != 0 else 0}"
-                message_not_exist="Quiz is not assigned to you or does not exist"
+                message_not_exist="Quiz is not assigned to you, does not exist or is already submitted"
                 return _view_generator(status, _response, message_success, message_not_exist)
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Users can attempt the quiz")), 404
+                return api_response_schema.dump(dict(message="Only Users can attempt the quiz")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while attempting quiz, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while attempting quiz, error:{str(e)}")), 500
 
 
 api.add_resource(AttemptQuizAPI, '/attempt.quiz')
 docs.register(AttemptQuizAPI)
 
 """
-[Quiz Results API] : Its responsibility is to provide the quiz results in which the users 
-                        having the scores sorted in descending order are displayed, 
-                        also the ones who have not attempted are also shown.
+[Submit Quiz API] : Its responsibility is to take the quiz attempt of the user for asynchronous grading.
+                     The answers are saved at once and a receipt id is returned, the score is read
+                     from the Submission Status API once the grading workers have graded it.
+"""
+class SubmitQuizAPI(MethodResource, Resource):
+    @doc(description="""
+         [Submit Quiz API] : Its responsibility is to take the quiz attempt of the user for asynchronous grading.
+         The answers are saved at once and a receipt id is returned, pass it to /submission.status to read the score.
+         [Input Format] :   {
+                                "quiz_id": "id of attempting quiz",
+                                "responses": [
+                                    {
+                                        "question_id": "choice number",
+                                        ...
+                                    }
+                                ]
+                            }
+         """, tags=["Quiz"])
+    @use_kwargs(UserResponseSchema, location=("json"))
+    @marshal_with(api_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id'):
+                status, _response = submit_quiz(**kwargs) # returns receipt of the submission
+                message_success=f"Submission is queued for grading with receipt id {_response.id if _response != 0 else ''}"
+                message_not_exist="Quiz is not assigned to you, does not exist or is already submitted"
+                return _view_generator(status, _response, message_success, message_not_exist)
+            else:
+                return api_response_schema.dump(dict(message="Only Users can submit the quiz")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while submitting quiz, error:{str(e)}")), 500
+
+
+api.add_resource(SubmitQuizAPI, '/submit.quiz')
+docs.register(SubmitQuizAPI)
+
+"""
+[Submission Status API] : Its responsibility is to report the status of a submission queued for grading,
+                           and its score once graded. Users read their own submissions, Admin any of them.
+"""
+class SubmissionStatusAPI(MethodResource, Resource):
+    @doc(description="""
+         [Submission Status API] : Its responsibility is to report the status of a submission queued for grading: queued, grading, graded or failed, with the score once graded.
+         [Input Format] :   {
+                                "receipt_id": "receipt id returned by /submit.quiz"
+                            }
+         """, tags=["Quiz"])
+    # @marshal_with(api_response_schema)
+    @use_kwargs(SubmissionStatusSchema, location=("json"))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id'):
+                status, _response = submission_status(**kwargs) # returns status of the receipt
+                return _view_generator(status, _response, "Submission status is read successfully",
+                                       "Submission does not exist")
+            else:
+                return api_response_schema.dump(dict(message="Only logged in users can read a submission")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while reading submission, error:{str(e)}")), 500
+
+
+api.add_resource(SubmissionStatusAPI, '/submission.status')
+docs.register(SubmissionStatusAPI)
+
+"""
+[Autosave Answers API] : Its responsibility is to save the answers of the user question by question
+                          during the quiz, so that the final attempt only grades what is already saved.
+"""
+class AutosaveAnswersAPI(MethodResource, Resource):
+    @doc(description="""
+         [Autosave Answers API] : Its responsibility is to save the answers of the user question by question during the quiz.
+         Saving a question again replaces its answer; the saved answers are graded by /attempt.quiz, which may be sent without responses.
+         [Input Format] :   {
+                                "quiz_id": "id of the quiz being attempted",
+                                "answers": {
+                                    "question_id": choice number,
+                                    ...
+                                }
+                            }
+         """, tags=["Quiz"])
+    # @marshal_with(api_response_schema)
+    @use_kwargs(AutosaveSchema, location=("json"))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id'):
+                status, _response = autosave_answers(**kwargs) # returns ids of the saved questions
+                return _view_generator(status, _response, "Answers are saved successfully",
+                                       "Quiz is not assigned to you or is already submitted")
+            else:
+                return api_response_schema.dump(dict(message="Only Users can save answers")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while saving answers, error:{str(e)}")), 500
+
+
+api.add_resource(AutosaveAnswersAPI, '/autosave.answers')
+docs.register(AutosaveAnswersAPI)
+
+"""
+[Regrade Quiz API] : Its responsibility is to re-grade every submission of a quiz after an answer correction.
+Admin has only acess to this functionality.
+"""
+class RegradeQuizAPI(MethodResource, Resource):
+    @doc(description="""
+         [Regrade Quiz API] : Its responsibility is to re-grade every submission of a quiz after an answer correction.
+         Admin has only acess to this functionality.
+         """, tags=["Quiz"])
+    @use_kwargs(ViewQuizSchema, location=('json'))
+    @marshal_with(api_response_schema)
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = regrade_quiz(**kwargs) # returns number of re-graded submissions
+                return api_response_schema.dump(dict(message=f"{_response} submissions are re-graded")), 200
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can re-grade the quiz")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while re-grading quiz, error:{str(e)}")), 500
+
+
+api.add_resource(RegradeQuizAPI, '/regrade.quiz')
+docs.register(RegradeQuizAPI)
+
+"""
+[Quiz Results API] : Its responsibility is to provide the quiz results page by page.
+                        The scores sorted in descending order and the ones who have not
+                        attempted are served by the Quiz Leaderboard API.
                         Admin has only acess to this functionality.
 """
 class QuizResultAPI(MethodResource, Resource):
     @doc(description="""
-         [Quiz Results API] : Its responsibility is to provide the quiz results in which the users having the scores sorted in descending order are displayed.
-         Also the ones who have not attempted are also shown.
+         [Quiz Results API] : Its responsibility is to provide the quiz results page by page, in creation order.
+         The scores sorted in descending order and the ones who have not attempted are served by /quiz.leaderboard.
          Admin has only acess to this functionality.
+         Results are paginated, pass the returned next_cursor to fetch the next page.
+         [Input Format] :   {
+                                "cursor": "next_cursor of the previous page",
+                                "limit": 100,
+                                "quiz_id": "id of the quiz",
+                                "user_id": "id of the user",
+                                "is_submitted": 1,
+                                "is_active": 1
+                            }
          """, tags=["Quiz"])
-    def post(self):
+    @use_kwargs(QuizResultPageSchema, location=('json'))
+    def post(self, **kwargs):
         try:
             if session.get('user_id') and (session['is_admin'] == 1):
-                status, _response = all_quiz_result() #  returns list of all quizzes with details
+                status, _response = all_quiz_result(**kwargs) #  returns page of quiz instances with details
                 return _view_generator(status, _response, "Quiz results are listed successfully")
             else:
-                return UnifiedAPIResponseSchema().dump(dict(message="Only Admin can view all quiz status")), 404
+                return api_response_schema.dump(dict(message="Only Admin can view all quiz status")), 404
         except Exception as e:
-            return UnifiedAPIResponseSchema().dump(dict(message=f"error while viewing quiz status, error:{str(e)}")), 500
+            return api_response_schema.dump(dict(message=f"error while viewing quiz status, error:{str(e)}")), 500
 
 
 api.add_resource(QuizResultAPI, '/quiz.results')
 docs.register(QuizResultAPI)
 
+"""
+[Quiz Leaderboard API] : Its responsibility is to provide the users of a quiz with their scores sorted in
+                            descending order, the rank of a user and the users who have not attempted.
+                            Admin has acess to every mode, users can only ask for their own rank.
+"""
+class QuizLeaderboardAPI(MethodResource, Resource):
+    @doc(description="""
+         [Quiz Leaderboard API] : Its responsibility is to provide the users of a quiz with their scores sorted in descending order.
+         Ties are broken by the earlier submission.
+         Admin has acess to every mode, users can only ask for their own rank.
+         [Input Format] :   {
+                                "quiz_id": "id of the quiz",
+                                "mode": "top" (k best), "rank" (rank and percentile of user_id),
+                                        "around" (window ranks around rank) or "not_attempted" (offset, limit),
+                                "k": 10,
+                                "user_id": "id of the user",
+                                "rank": 1,
+                                "window": 10,
+                                "offset": 0,
+                                "limit": 100
+                            }
+         """, tags=["Quiz"])
+    @use_kwargs(LeaderboardSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and ((session['is_admin'] == 1) or
+                                           (kwargs['mode'] == 'rank' and kwargs.get('user_id', session['user_id']) == session['user_id'])):
+                status, _response = quiz_leaderboard(**kwargs) # returns list of leaderboard entries
+                message_not_exist = "User has not submitted this quiz"
+                return _view_generator(status, _response, "Leaderboard is listed successfully", message_not_exist)
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can view the leaderboard")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while viewing leaderboard, error:{str(e)}")), 500
+
+
+api.add_resource(QuizLeaderboardAPI, '/quiz.leaderboard')
+docs.register(QuizLeaderboardAPI)
+
+"""
+[Quiz Stats API] : Its responsibility is to provide the statistics of the submissions of a quiz: the number of
+                    submissions, mean, variance, minimum and maximum score, pass rate and
+                    the histogram of the scores. They are kept up to date by the gradings.
+                    Admin has only acess to this functionality.
+"""
+class QuizStatsAPI(MethodResource, Resource):
+    @doc(description="""
+         [Quiz Stats API] : Its responsibility is to provide the statistics of the submissions of a quiz.
+         Admin has only acess to this functionality.
+         [Input Format] :   {
+                                "quiz_id": "id of the quiz"
+                            }
+         """, tags=["Quiz"])
+    @use_kwargs(ViewQuizSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, _response = quiz_statistics(**kwargs) # returns list with the statistics of the quiz
+                return _view_generator(status, _response, "Quiz statistics are read successfully",
+                                       "Quiz does not exist")
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can view the quiz statistics")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while reading quiz statistics, error:{str(e)}")), 500
+
+
+api.add_resource(QuizStatsAPI, '/quiz.stats')
+docs.register(QuizStatsAPI)
+
+"""
+[Export Quiz Results API] : Its responsibility is to stream all quiz results as ndjson or csv for reporting.
+                            Admin has only acess to this functionality.
+"""
+class ExportQuizResultAPI(MethodResource, Resource):
+    @doc(description="""
+         [Export Quiz Results API] : Its responsibility is to stream all quiz results as ndjson or csv for reporting.
+         Every row carries the quiz name and the user name. Admin has only acess to this functionality.
+         [Input Format] :   {
+                                "format": "ndjson" or "csv",
+                                "quiz_id": "id of the quiz",
+                                "date_from": "2023-08-01T00:00:00",
+                                "date_to": "2023-09-01T00:00:00"
+                            }
+         """, tags=["Quiz"])
+    @use_kwargs(ExportResultSchema, location=('json'))
+    def post(self, **kwargs):
+        try:
+            if session.get('user_id') and (session['is_admin'] == 1):
+                status, (mimetype, chunks) = export_quiz_results(**kwargs) # returns generator of encoded chunks
+                headers = {'Content-Disposition': f"attachment; filename=quiz_results.{kwargs['format']}"}
+                return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+            else:
+                return api_response_schema.dump(dict(message="Only Admin can export the quiz results")), 404
+        except Exception as e:
+            return api_response_schema.dump(dict(message=f"error while exporting quiz results, error:{str(e)}")), 500
+
+
+api.add_resource(ExportQuizResultAPI, '/export.results')
+docs.register(ExportQuizResultAPI)
+
+"""
+[Metrics API] : Its responsibility is to expose the request, SQL and connection pool metrics of the process
+                in the Prometheus text format, for the Prometheus server to scrape.
+"""
+class MetricsAPI(MethodResource, Resource):
+    @doc(description="""
+         [Metrics API] : Its responsibility is to expose the request, SQL and connection pool metrics of the process
+         in the Prometheus text format: request latency histograms and status codes per endpoint, the number and
+         time of the SQL statements per endpoint and the connection pool checkout wait.
+         """, tags=["Monitoring"])
+    def get(self):
+        return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
 
+api.add_resource(MetricsAPI, '/metrics')
+docs.register(MetricsAPI)
@@ -0,0 +1,340 @@
+import contextlib
+
+from itsdangerous import BadSignature
+from marshmallow import ValidationError
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+from app import application
+from app import async_services, metrics
+from app.async_db import engine, session_scope
+from app.compression import compress_body
+from app.conditional import entity_tag, not_modified, validator_headers
+from app.schemas import (AssignQuizSchema, AutosaveSchema, CreateQuizSchema, LoginSchema, PageSchema,
+                         QuestionMasterSchema, QuizResultPageSchema, SearchQuestionSchema, SubmissionStatusSchema,
+                         UserMasterSchema, UserResponseSchema, ViewQuizSchema, api_response_schema,
+                         bulk_report_response_schema)
+from app.serialization import dumps
+from app.sessions import session_store
+
+"""
+[ASGI Module] The async serving mode: the twelve core endpoints of apis.py as coroutine handlers on
+                the async engine, for exam starts with thousands of concurrent connections served by
+                one event loop instead of one thread per request.
+                Request bodies are loaded with the same marshmallow schemas and responses have the
+                same shape, messages and status codes. The session cookie is Flask's signed cookie,
+                read and written with the Flask application's serializer, and it is validated against
+                the same session store, so a login is valid in both modes.
+
+                usage: uvicorn app.asgi:asgi_app --port 8000   (or python main_asgi.py)
+"""
+
+ROUTES = list()
+
+
+class CookieSession(dict):
+    """
+    The content of the signed session cookie, tracking whether it has to be written back.
+    """
+
+    modified = False
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.modified = True
+
+    def clear(self):
+        super().clear()
+        self.modified = True
+
+
+def _serializer():
+    return application.session_interface.get_signing_serializer(application)
+
+
+def load_cookie(request):
+    """
+    Read the session cookie of a request; a missing, forged or expired cookie reads as empty.
+    """
+    value = request.cookies.get(application.config['SESSION_COOKIE_NAME'])
+    if not value:
+        return CookieSession()
+    try:
+        max_age = int(application.permanent_session_lifetime.total_seconds())
+        return CookieSession(_serializer().loads(value, max_age=max_age))
+    except BadSignature:
+        return CookieSession()
+
+
+def save_cookie(cookie, response):
+    """
+    Write the session cookie back if the request changed it.
+    """
+    if not cookie.modified:
+        return
+    name = application.config['SESSION_COOKIE_NAME']
+    if not cookie:
+        response.delete_cookie(name, path='/')
+        return
+    response.set_cookie(
+        name, _serializer().dumps(dict(cookie)), path='/',
+        httponly=application.config['SESSION_COOKIE_HTTPONLY'],
+        secure=application.config['SESSION_COOKIE_SECURE'],
+        samesite=application.config['SESSION_COOKIE_SAMESITE'],
+    )
+
+
+async def current_user(db_session, cookie):
+    """
+    Validate the session of the cookie against the session store, like sessions.validate_session.
+
+    Returns:
+        dict: The user_id and is_admin of the live session, None if not logged in or revoked.
+    """
+    session_id = cookie.get('session_id')
+    if not session_id:
+        return None
+    record = await session_store.get_async(db_session, session_id, cookie)
+    if record is None:
+        cookie.clear()
+        return None
+    if cookie.get('user_id') != record['user_id'] or cookie.get('is_admin') != record['is_admin']:
+        cookie['user_id'] = record['user_id']
+        cookie['is_admin'] = record['is_admin']
+    return record
+
+
+def _message(message, status):
+    return api_response_schema.dump(dict(message=message)), status
+
+
+def _view(_response, *messages):
+    """
+    The response of a service result, like apis._view_generator.
+    """
+    if type(_response) == type(1):
+        return _message(messages[0], 200) if _response == 1 else _message(messages[1], 404)
+    if type(_response) == type([]):
+        return dict(response=_response), 200
+    if type(_response) == type({}):
+        return dict(response=_response['response'], next_cursor=_response['next_cursor']), 200
+    return _message(messages[0], 200)
+
+
+def endpoint(path, schema=None, access=None, denied=None, error='handling the request', version=None):
+    """
+    Register a coroutine handler for POST requests on a path.
+
+    Args:
+        path (str): The path of the endpoint, the same as in apis.py.
+        schema (Schema): The schema loading the json body into the handler's keyword arguments.
+        access (str): None for anyone, 'user' for logged in users, 'admin' for admins only.
+        denied (str): The message of the 404 answered when the access is denied.
+        error (str): What the endpoint does, for the message of the 500 answered on an error.
+        version (callable): For a conditional endpoint, the coroutine function called like the handler
+                            which returns the version of the result, 0 if it is not found.
+
+    The handler is called with the AsyncSession, the cookie session, the user (or None) and the loaded
+    body, and returns the response body and status code. A conditional endpoint answers 304 when the
+    client's copy is still valid, otherwise its handler is also passed the version and its 200 responses
+    carry the validators. Bodies are compressed as negotiated with the client.
+    """
+    loader = schema() if schema else None
+
+    def decorator(handler):
+        async def view(request):
+            token = metrics.begin(path)
+            cookie = load_cookie(request)
+            try:
+                body = await request.body()
+                kwargs = loader.load(await request.json() if body else {}) if loader else {}
+            except ValidationError as e:
+                metrics.finish(token, request.method, 422)
+                return Response(dumps({'message': 'invalid request', 'errors': e.messages}) + '\n', 422,
+                                media_type='application/json')
+            except ValueError:
+                metrics.finish(token, request.method, 400)
+                return Response(dumps({'message': 'the body is not valid json'}) + '\n', 400,
+                                media_type='application/json')
+            headers = dict()
+            try:
+                async with session_scope() as db_session:
+                    user = await current_user(db_session, cookie)
+                    if access and not (user and (access == 'user' or user['is_admin'] == 1)):
+                        result, status = _message(denied, 404)
+                    elif version is None:
+                        result, status = await handler(db_session, cookie, user, **kwargs)
+                    else:
+                        result_version = await version(db_session, cookie, user, **kwargs)
+                        tag = entity_tag(path, kwargs, result_version) if result_version != 0 else None
+                        if not_modified(request.headers, tag, result_version):
+                            result, status = None, 304
+                        else:
+                            result, status = await handler(db_session, cookie, user, version=result_version or None,
+                                                           **kwargs)
+                        if status in (200, 304):
+                            headers = validator_headers(tag, result_version)
+            except Exception as e:
+                result, status = _message(f"error while {error}, error:{str(e)}", 500)
+            if status == 304:
+                response = Response(status_code=304, headers=headers)
+            else:
+                body, encoding = compress_body((dumps(result) + '\n').encode(), 'application/json',
+                                               request.headers.get('Accept-Encoding'))
+                response = Response(body, status, headers=dict(headers, **encoding), media_type='application/json')
+            save_cookie(cookie, response)
+            metrics.finish(token, request.method, status)
+            return response
+
+        ROUTES.append(Route(path, view, methods=['POST']))
+        return handler
+    return decorator
+
+
+@endpoint('/signup', UserMasterSchema, error='creating USER')
+async def signup(db_session, cookie, user, **kwargs):
+    _response = await async_services.add_user(db_session, **kwargs)
+    return _view(_response, f"User {kwargs['username']} is created successfully")
+
+
+@endpoint('/login', LoginSchema, error='logging USER')
+async def login(db_session, cookie, user, **kwargs):
+    _response = await async_services.login(db_session, **kwargs)
+    if _response != 0:
+        for key, value in _response.items():
+            cookie[key] = value
+        _response = 1
+    return _view(_response, f"User {kwargs['username']} is logged in successfully",
+                 f"User {kwargs['username']} does not exist")
+
+
+@endpoint('/logout', error='logging out USER')
+async def logout(db_session, cookie, user, **kwargs):
+    if user and cookie.get('session_id'):
+        await async_services.end_session(db_session, user['user_id'], cookie['session_id'])
+    cookie.clear()
+    return _message("User has logged out successfully", 200)
+
+
+@endpoint('/add.question', QuestionMasterSchema, 'admin', "Only Admin can add the questions", 'creating QUESTION')
+async def add_question(db_session, cookie, user, **kwargs):
+    _response = await async_services.add_question(db_session, **kwargs)
+    return _view(_response, f"Question {kwargs['question']} has created successfully")
+
+
+async def questions_version(db_session, cookie, user, **kwargs):
+    return await async_services.questions_version(db_session, **kwargs)
+
+
+@endpoint('/list.questions', PageSchema, 'admin', "Only Admin can access all the questions", 'listing questions',
+          questions_version)
+async def list_questions(db_session, cookie, user, **kwargs):
+    _response = await async_services.list_questions(db_session, **kwargs)
+    return _view(_response, "Questions are listed successfully")
+
+
+@endpoint('/search.questions', SearchQuestionSchema, 'admin', "Only Admin can search the questions",
+          'searching questions')
+async def search_questions(db_session, cookie, user, **kwargs):
+    _response = await async_services.search_questions(db_session, **kwargs)
+    return _view(_response, "Questions are searched successfully")
+
+
+@endpoint('/create.quiz', CreateQuizSchema, 'admin', "Only Admin can create the quiz", 'creating quiz')
+async def create_quiz(db_session, cookie, user, **kwargs):
+    _response = await async_services.add_quiz(db_session, **kwargs)
+    return _view(_response, f"Quiz {kwargs['quiz_name']} has created successfully")
+
+
+@endpoint('/assign.quiz', AssignQuizSchema, 'admin', "Only Admin can assign the quiz", 'assigning quiz')
+async def assign_quiz(db_session, cookie, user, **kwargs):
+    _response = await async_services.assign_quiz(db_session, **kwargs)
+    if _response == 0:
+        return _message("Quiz does not exist Please check the quiz id", 404)
+    _response['message'] = f"Quiz has been assigned respectively to the Users, {_response['failed']} rows failed"
+    return bulk_report_response_schema.dump(_response), 200
+
+
+async def quiz_version(db_session, cookie, user, **kwargs):
+    return await async_services.quiz_version(db_session, user, **kwargs)
+
+
+@endpoint('/view.quiz', ViewQuizSchema, 'user', "Login to view the quiz details", 'viewing quiz', quiz_version)
+async def view_quiz(db_session, cookie, user, **kwargs):
+    _response = await async_services.view_quiz(db_session, user, **kwargs)
+    return _view(_response, "Quiz has been viewed successfully",
+                 "Quiz does not exist or you are not assigned to this quiz")
+
+
+@endpoint('/assigned.quizzes', None, 'user', "Login to view the assigned quizzes", 'viewing assigned quizzes')
+async def assigned_quizzes(db_session, cookie, user, **kwargs):
+    _response = await async_services.list_assigned_quizzes(db_session, user)
+    return _view(_response, "Assigned quizzes are listed successfully")
+
+
+async def quizzes_version(db_session, cookie, user, **kwargs):
+    return await async_services.quizzes_version(db_session, **kwargs)
+
+
+@endpoint('/all.quizzes', PageSchema, 'admin', "Only Admin can view the quiz", 'viewing quiz', quizzes_version)
+async def all_quizzes(db_session, cookie, user, **kwargs):
+    _response = await async_services.list_quizzes(db_session, **kwargs)
+    return _view(_response, "Quizzes are listed successfully")
+
+
+@endpoint('/attempt.quiz', UserResponseSchema, 'user', "Only Users can attempt the quiz", 'attempting quiz')
+async def attempt_quiz(db_session, cookie, user, **kwargs):
+    _response = await async_services.attempt_quiz(db_session, user, **kwargs)
+    return _view(_response, f"score achieved: {_response.score_achieved if _response != 0 else 0}",
+                 "Quiz is not assigned to you, does not exist or is already submitted")
+
+
+@endpoint('/submit.quiz', UserResponseSchema, 'user', "Only Users can submit the quiz", 'submitting quiz')
+async def submit_quiz(db_session, cookie, user, **kwargs):
+    _response = await async_services.submit_quiz(db_session, user, **kwargs)
+    receipt_id = _response.id if _response != 0 else ''
+    return _view(_response, f"Submission is queued for grading with receipt id {receipt_id}",
+                 "Quiz is not assigned to you, does not exist or is already submitted")
+
+
+@endpoint('/submission.status', SubmissionStatusSchema, 'user', "Only logged in users can read a submission",
+          'reading submission')
+async def submission_status(db_session, cookie, user, **kwargs):
+    _response = await async_services.submission_status(db_session, user, **kwargs)
+    return _view(_response, "Submission status is read successfully", "Submission does not exist")
+
+
+@endpoint('/autosave.answers', AutosaveSchema, 'user', "Only Users can save answers", 'saving answers')
+async def autosave_answers(db_session, cookie, user, **kwargs):
+    _response = await async_services.autosave_answers(db_session, user, **kwargs)
+    return _view(_response, "Answers are saved successfully", "Quiz is not assigned to you or is already submitted")
+
+
+@endpoint('/quiz.results', QuizResultPageSchema, 'admin', "Only Admin can view all quiz status", 'viewing quiz status')
+async def quiz_results(db_session, cookie, user, **kwargs):
+    _response = await async_services.all_quiz_result(db_session, **kwargs)
+    return _view(_response, "Quiz results are listed successfully")
+
+
+@endpoint('/quiz.stats', ViewQuizSchema, 'admin', "Only Admin can view the quiz statistics",
+          'reading quiz statistics')
+async def quiz_stats(db_session, cookie, user, **kwargs):
+    _response = await async_services.quiz_statistics(db_session, **kwargs)
+    return _view(_response, "Quiz statistics are read successfully", "Quiz does not exist")
+
+
+async def prometheus_metrics(request):
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
+ROUTES.append(Route('/metrics', prometheus_metrics, methods=['GET']))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await engine.dispose()
+
+
+asgi_app = Starlette(routes=ROUTES, lifespan=lifespan)
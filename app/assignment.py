@@ -0,0 +1,150 @@
+from sqlalchemy import func, insert, literal, select
+
+from app.bulk import DEFAULT_CHUNK_SIZE, BulkReport, chunked
+from app.cache import invalidate_assignments
+from app.groups import assign_groups
+from app.keys import new_id, sql_new_id
+from app.leaderboard import leaderboard
+from app.models import GroupMember, QuizInstance, QuizMaster, UserMaster, db
+
+"""
+[Assignment Module] Set-based quiz assignment. The quiz ids of a request are validated with one IN query
+                        and the users are handled in chunks: one IN query finds the users which exist,
+                        one finds those already assigned to the quiz, and the remaining pairs are written
+                        with one executemany insert, compiled once and sent as multi-row INSERTs by the
+                        MySQL driver. Unknown users are reported and already assigned ones
+                        skipped, so a repeated assignment never trips the unique_quiz_user constraint.
+                        Assigning a quiz to every non-admin user is a single INSERT ... SELECT, and
+                        assigning it to a group a single group_quiz row (see groups.py).
+                        Everything is committed together; nothing is assigned if a quiz does not exist.
+"""
+
+INSTANCE_COLUMNS = ('id', 'quiz_id', 'user_id', 'is_active', 'score_achieved', 'is_submitted')
+INSERT_INSTANCES = insert(QuizInstance.__table__)
+
+
+def _assign_chunk(db_session, quiz_id, chunk, report):
+    """
+    Insert the assignments of one chunk of (row number, user id) pairs of a quiz.
+
+    Returns:
+        list: The ids of the users newly assigned.
+    """
+    user_ids = [user_id for number, user_id in chunk]
+    known = set(db_session.execute(select(UserMaster.id).where(UserMaster.id.in_(user_ids))).scalars())
+    assigned = set(db_session.execute(
+        select(QuizInstance.user_id).where(QuizInstance.quiz_id == quiz_id, QuizInstance.user_id.in_(user_ids))
+    ).scalars())
+    new_user_ids = list()
+    for number, user_id in chunk:
+        if user_id not in known:
+            report.add_error(number, f'user {user_id} does not exist')
+        elif user_id in assigned:
+            report.skipped += 1
+        else:
+            assigned.add(user_id)
+            new_user_ids.append(user_id)
+    if new_user_ids:
+        db_session.execute(INSERT_INSTANCES, [
+            {'id': new_id(), 'quiz_id': quiz_id, 'user_id': user_id, 'is_active': 1, 'score_achieved': 0,
+             'is_submitted': 0}
+            for user_id in new_user_ids
+        ])
+    report.inserted += len(new_user_ids)
+    return new_user_ids
+
+
+def _assign_to_all(db_session, quiz_id, chunk_size, report):
+    """
+    Assign a quiz to every non-admin user who does not have it yet, with one INSERT ... SELECT, or
+    through the chunked path on a database which cannot generate keys in SQL.
+    """
+    total = db_session.execute(select(func.count()).select_from(UserMaster).where(UserMaster.is_admin == 0)).scalar()
+    id_expression = sql_new_id(db_session.get_bind().dialect.name)
+    if id_expression is None:
+        user_ids = db_session.execute(select(UserMaster.id).where(UserMaster.is_admin == 0)).scalars()
+        for chunk in chunked(enumerate(user_ids, start=report.total + 1), chunk_size):
+            _assign_chunk(db_session, quiz_id, chunk, report)
+        report.total += total
+        return
+    quiz_key = literal(quiz_id, QuizInstance.__table__.c.quiz_id.type)
+    users = (
+        select(id_expression, quiz_key, UserMaster.id, literal(1), literal(0), literal(0))
+        .where(UserMaster.is_admin == 0)
+        .where(~select(QuizInstance.id)
+               .where(QuizInstance.quiz_id == quiz_key, QuizInstance.user_id == UserMaster.id)
+               .exists())
+    )
+    inserted = db_session.execute(insert(QuizInstance.__table__).from_select(INSTANCE_COLUMNS, users)).rowcount
+    report.total += total
+    report.inserted += inserted
+    report.skipped += total - inserted
+
+
+def assign_quizzes(instance=None, all_users=(), chunk_size=DEFAULT_CHUNK_SIZE, db_session=None, groups=None):
+    """
+    Assign quizzes to users in one transaction.
+
+    Args:
+        instance (dict): The user ids to assign, keyed by quiz id.
+        all_users (list): The ids of the quizzes to assign to every non-admin user.
+        chunk_size (int): The number of users validated and written per statement.
+        db_session (Session): The session to work in, db.session by default (the ASGI mode passes the
+                              sync facade of its AsyncSession).
+        groups (dict): The group ids to assign, keyed by quiz id.
+
+    Returns:
+        BulkReport: The counters and per-row errors, rows numbered from 1 across the users of `instance`
+                    and then the groups of `groups`.
+        None: If one of the quizzes does not exist; nothing is assigned then.
+
+    Raises:
+        ValueError: If the chunk size is invalid.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    db_session = db_session or db.session
+    instance = instance or dict()
+    groups = groups or dict()
+    quiz_ids = set(instance) | set(all_users) | set(groups)
+    if quiz_ids:
+        known = set(db_session.execute(select(QuizMaster.id).where(QuizMaster.id.in_(quiz_ids))).scalars())
+        if known != quiz_ids:
+            db_session.rollback()
+            return None
+
+    report = BulkReport()
+    pairs = list()
+    number = 0
+    for quiz_id, user_ids in instance.items():
+        seen = set()
+        for chunk in chunked(user_ids, chunk_size):
+            rows = list()
+            for user_id in chunk:
+                number += 1
+                if user_id in seen:
+                    report.skipped += 1
+                    continue
+                seen.add(user_id)
+                rows.append((number, user_id))
+            report.total += len(chunk)
+            if rows:
+                pairs.append((quiz_id, _assign_chunk(db_session, quiz_id, rows, report)))
+    for quiz_id in all_users:
+        _assign_to_all(db_session, quiz_id, chunk_size, report)
+    group_pairs = assign_groups(db_session, groups, report, number) if groups else []
+    db_session.commit()
+    invalidate_assignments()
+
+    for quiz_id, user_ids in pairs:
+        leaderboard.assign(quiz_id, user_ids)
+    for quiz_id in all_users:
+        leaderboard.assign(quiz_id, db_session.execute(
+            select(QuizInstance.user_id).where(QuizInstance.quiz_id == quiz_id, QuizInstance.is_submitted == 0)
+        ).scalars())
+    for quiz_id, group_id in group_pairs:
+        leaderboard.assign(quiz_id, db_session.execute(
+            select(GroupMember.user_id).where(GroupMember.group_id == group_id)
+        ).scalars())
+    report.finish()
+    return report
@@ -0,0 +1,69 @@
+import contextlib
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app import application
+from app.config import configure_engine
+from app.metrics import instrument_engine
+
+"""
+[Async DB Module] The async SQLAlchemy engine and sessions of the ASGI mode. The engine points at the
+                    same database as the Flask-SQLAlchemy one, through the asyncio driver of its
+                    backend (aiosqlite for SQLite, aiomysql for MySQL/MariaDB), unless
+                    ASYNC_DATABASE_URI is configured, with the pool and per connection settings of
+                    app/config.py. Every request gets its own AsyncSession from
+                    `session_scope`; the models, keys and statements are shared with the WSGI mode.
+"""
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+    'mariadb': 'mariadb+aiomysql',
+}
+
+
+def async_url(url):
+    """
+    The url of the asyncio driver for a synchronous database url.
+
+    Raises:
+        ValueError: If no asyncio driver is known for the backend.
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'no asyncio driver is known for {backend}, set ASYNC_DATABASE_URI')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def create_engine_from_config():
+    url = application.config.get('ASYNC_DATABASE_URI') or async_url(application.config['SQLALCHEMY_DATABASE_URI'])
+    options = dict(application.config.get('ASYNC_ENGINE_OPTIONS', {}))
+    if options and make_url(url).get_backend_name() == 'sqlite':
+        options.setdefault('poolclass', AsyncAdaptedQueuePool)  # aiosqlite would not pool connections
+    async_engine = create_async_engine(url, **options)
+    configure_engine(async_engine.sync_engine)
+    instrument_engine(async_engine.sync_engine, 'async')
+    return async_engine
+
+
+engine = create_engine_from_config()
+AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False)
+
+
+@contextlib.asynccontextmanager
+async def session_scope():
+    """
+    An AsyncSession for one request, rolled back if the request fails before committing.
+
+    Yields:
+        AsyncSession: The session.
+    """
+    async with AsyncSessionLocal() as db_session:
+        try:
+            yield db_session
+        except BaseException:
+            await db_session.rollback()
+            raise
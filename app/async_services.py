@@ -0,0 +1,409 @@
+import asyncio
+import datetime
+
+from sqlalchemy import select, update
+
+from app.assignment import assign_quizzes
+from app.autosave import autosave_buffer
+from app.cache import assigned_quizzes_cache, invalidate_assignments, invalidate_quiz, quiz_cache, quiz_list_cache
+from app.conditional import version_from_aggregate, version_statement
+from app.grading import get_answer_key, grade_submission, mark_submitted
+from app.gradingqueue import grading_queue, new_receipt, receipt_status
+from app.groups import instance_from_group
+from app.importer import question_hash
+from app.keys import new_id
+from app.leaderboard import leaderboard
+from app.models import QuestionMaster, QuizInstance, QuizMaster, QuizQuestions, SubmissionReceipt, UserMaster
+from app.pagination import paginate, split_page
+from app.passwords import hash_password, password_pool, verify_password_async
+from app.services import (UPGRADE_PASSWORD, _apply_filters, answerable_statement, assigned_quizzes_statement,
+                          assignment_statement, questions_page_statement, quiz_questions_from_rows,
+                          quiz_questions_statement, quiz_version_statement, quizzes_page, quizzes_page_statement,
+                          search_results_from_rows, search_results_statement)
+from app.search import question_search
+from app import quizstats
+from app.sessions import session_store
+
+"""
+[Async Services Module] Coroutine versions of the services behind the endpoints of the ASGI mode.
+                        They take the request's AsyncSession and the logged in user explicitly
+                        instead of reading Flask's globals, and return what their counterparts in
+                        services.py return; the statements, caches and the leaderboard are shared.
+"""
+
+
+async def add_user(db_session, **kwargs):
+    """
+    Adds a new user, its password hashed on the password pool.
+
+    Returns:
+        int: 1 on success.
+    """
+    password = await password_pool.run_async(hash_password, kwargs['password'])
+    db_session.add(UserMaster(id=new_id(), name=kwargs['name'], username=kwargs['username'],
+                              password=password, is_admin=kwargs['is_admin']))
+    await db_session.commit()
+    return 1
+
+
+async def login(db_session, **kwargs):
+    """
+    Verifies the credentials of a user and records a new session.
+
+    Returns:
+        dict: The session_id, user_id and is_admin to keep in the session cookie.
+        int: 0 if the username is unknown or the password is wrong.
+    """
+    user = (await db_session.execute(
+        select(UserMaster.id, UserMaster.password, UserMaster.is_admin).where(UserMaster.username == kwargs['username'])
+    )).first()
+    valid, new_hash = await verify_password_async(user.password if user else None, kwargs['password'])
+    if not valid:
+        return 0
+    operations = ((UPGRADE_PASSWORD, {'b_user_id': user.id, 'b_password': new_hash}),) if new_hash else ()
+    session_id = await session_store.create_async(db_session, user, *operations)
+    return {'session_id': session_id, 'user_id': user.id, 'is_admin': user.is_admin}
+
+
+async def end_session(db_session, user_id, session_id):
+    """
+    Revokes a session and clears the user's is_active flag.
+
+    Returns:
+        int: 1 on success.
+    """
+    await db_session.execute(update(UserMaster).where(UserMaster.id == user_id).values(is_active=0))
+    await session_store.revoke_async(db_session, session_id)
+    await db_session.commit()
+    return 1
+
+
+async def add_question(db_session, **kwargs):
+    """
+    Adds a question to the question bank and, once committed, to the search index.
+
+    Returns:
+        int: 1 on success.
+    """
+    question_id = new_id()
+    db_session.add(QuestionMaster(
+        id=question_id,
+        question=kwargs['question'],
+        choice1=kwargs['choice1'],
+        choice2=kwargs['choice2'],
+        choice3=kwargs['choice3'],
+        choice4=kwargs['choice4'],
+        answer=kwargs['answer'],
+        marks=kwargs['marks'],
+        remarks=kwargs['remarks'],
+        content_hash=question_hash(kwargs['question'], kwargs['choice1'], kwargs['choice2'],
+                                   kwargs['choice3'], kwargs['choice4']),
+    ))
+    await db_session.commit()
+    question_search.add([dict(kwargs, id=question_id)])
+    return 1
+
+
+async def search_questions(db_session, **kwargs):
+    """
+    One ranked page of the questions matching a search, from the in-process search index.
+
+    Returns:
+        list: The matching questions with their score and the total number of matches.
+    """
+    await db_session.run_sync(question_search.refresh)
+    found = question_search.search(kwargs['query'], kwargs.get('min_marks'), kwargs.get('max_marks'),
+                                   kwargs['offset'], kwargs['limit'])
+    if not found['hits']:
+        return list()
+    return search_results_from_rows(found, (await db_session.execute(search_results_statement(found))).scalars())
+
+
+async def list_questions(db_session, **kwargs):
+    """
+    One page of the question bank in (created_ts, id) order.
+
+    Returns:
+        dict: 'response' with the questions and 'next_cursor', None on the last page.
+    """
+    statement = questions_page_statement(kwargs)
+    questions, next_cursor = split_page((await db_session.execute(statement)).scalars().all(), kwargs.get('limit'))
+    question_list = [
+        {
+            'id': question.id,
+            'question': question.question,
+            'choice1': question.choice1,
+            'choice2': question.choice2,
+            'choice3': question.choice3,
+            'choice4': question.choice4,
+            'answer': question.answer,
+        }
+        for question in questions
+    ]
+    return {'response': question_list, 'next_cursor': next_cursor}
+
+
+async def questions_version(db_session, **kwargs):
+    """
+    The version of a page of `list_questions`, for the validators of /list.questions.
+
+    Returns:
+        tuple: The newest updated_ts of the page's rows and their number.
+    """
+    return version_from_aggregate((await db_session.execute(version_statement(questions_page_statement(kwargs)))).one())
+
+
+async def add_quiz(db_session, **kwargs):
+    """
+    Creates a quiz out of existing questions.
+
+    Returns:
+        int: 1 on success.
+    """
+    quiz = QuizMaster(id=new_id(), quiz_name=kwargs['quiz_name'])
+    db_session.add(quiz)
+    db_session.add_all(QuizQuestions(id=new_id(), quiz_id=quiz.id, question_id=question_id)
+                       for question_id in kwargs.get('question_ids') or [])
+    await db_session.commit()
+    invalidate_quiz(quiz.id)
+    quiz_list_cache.clear()
+    return 1
+
+
+async def assign_quiz(db_session, **kwargs):
+    """
+    Assigns quizzes to users with the set-based assignment engine, run on the sync facade of the session.
+
+    Returns:
+        dict: The assignment report.
+        int: 0 if one of the quizzes does not exist (nothing is assigned then).
+    """
+    report = await db_session.run_sync(lambda sync_session: assign_quizzes(
+        kwargs.get('instance'), kwargs.get('all_users') or [], kwargs['chunk_size'], sync_session,
+        kwargs.get('groups')))
+    return 0 if report is None else report.as_dict()
+
+
+async def view_quiz(db_session, user, **kwargs):
+    """
+    The questions of a quiz, for an admin or a user the quiz is assigned to, served from quiz_cache
+    unless the cached list is not of the given 'version'.
+
+    Returns:
+        list: The question dictionaries.
+        int: 0 if the quiz does not exist or is not assigned to the user.
+    """
+    quiz_id = kwargs['quiz_id']
+    if user['is_admin'] != 1 and not (await db_session.execute(assignment_statement(quiz_id, user['user_id']))).scalar():
+        return 0
+
+    async def load():
+        return quiz_questions_from_rows((await db_session.execute(quiz_questions_statement(quiz_id))).all())
+
+    compiled = await quiz_cache.get_or_load_async(quiz_id, load)
+    if compiled is not None and kwargs.get('version') is not None and compiled['version'] != kwargs['version']:
+        compiled = await load()
+        if compiled is not None:
+            quiz_cache.set(quiz_id, compiled)
+    if compiled is None:
+        return 0
+    return list(compiled['questions'])
+
+
+async def quiz_version(db_session, user, **kwargs):
+    """
+    The version of the questions of a quiz, for the validators of /view.quiz.
+
+    Returns:
+        tuple: The newest updated_ts of the quiz, its question links and its questions, and the number of questions.
+        int: 0 if the user is not an admin and the quiz is not assigned to them.
+    """
+    quiz_id = kwargs['quiz_id']
+    if user['is_admin'] != 1 and not (await db_session.execute(assignment_statement(quiz_id, user['user_id']))).scalar():
+        return 0
+    return version_from_aggregate((await db_session.execute(quiz_version_statement(quiz_id))).one())
+
+
+async def list_assigned_quizzes(db_session, user):
+    """
+    The quizzes assigned to the user, directly or through the user's groups, with their names in one query.
+
+    Returns:
+        list: The assignment dictionaries.
+    """
+
+    async def load():
+        return [row._asdict() for row in await db_session.execute(assigned_quizzes_statement(user['user_id']))]
+
+    return list(await assigned_quizzes_cache.get_or_load_async(user['user_id'], load))
+
+
+async def list_quizzes(db_session, **kwargs):
+    """
+    One page of the quizzes in (created_ts, id) order, served from quiz_list_cache unless the cached page
+    is not of the given 'version'.
+
+    Returns:
+        dict: 'response' with the quizzes and 'next_cursor', None on the last page.
+    """
+    key = (kwargs.get('cursor'), kwargs.get('limit'), kwargs.get('is_active'))
+    page = await quiz_list_cache.get_or_load_async(key, lambda: _load_quizzes(db_session, kwargs))
+    if kwargs.get('version') is not None and page['version'] != kwargs['version']:
+        page = await _load_quizzes(db_session, kwargs)
+        quiz_list_cache.set(key, page)
+    return {'response': list(page['response']), 'next_cursor': page['next_cursor']}
+
+
+async def _load_quizzes(db_session, kwargs):
+    quizzes = (await db_session.execute(quizzes_page_statement(kwargs))).scalars().all()
+    return quizzes_page(quizzes, kwargs.get('limit'))
+
+
+async def quizzes_version(db_session, **kwargs):
+    """
+    The version of a page of `list_quizzes`, for the validators of /all.quizzes.
+
+    Returns:
+        tuple: The newest updated_ts of the page's rows and their number.
+    """
+    return version_from_aggregate((await db_session.execute(version_statement(quizzes_page_statement(kwargs)))).one())
+
+
+async def attempt_quiz(db_session, user, **kwargs):
+    """
+    Records the submission of the user with the answers autosaved for it and grades the stored
+    responses against the cached answer key, updating the statistics of the quiz. A submission is final.
+
+    Returns:
+        QuizInstance: The graded assignment.
+        int: 0 if the quiz is not assigned to the user or is already submitted.
+    """
+    quiz_instance = (await db_session.execute(
+        select(QuizInstance).where(QuizInstance.quiz_id == kwargs['quiz_id'], QuizInstance.user_id == user['user_id'])
+        .with_for_update()
+    )).scalars().first()
+    if quiz_instance is None:
+        quiz_instance = await db_session.run_sync(
+            lambda sync_session: instance_from_group(kwargs['quiz_id'], user['user_id'], sync_session))
+    if quiz_instance is None or quiz_instance.is_submitted == 1:
+        return 0
+    # waits for a flush in progress, off the event loop
+    buffered = await asyncio.to_thread(autosave_buffer.take, quiz_instance.quiz_id, quiz_instance.user_id)
+    responses = dict(buffered)
+    responses.update(kwargs['responses'][0] if kwargs.get('responses') else dict())
+    try:
+        score = await db_session.run_sync(lambda sync_session: grade_submission(quiz_instance, responses, sync_session))
+        recorded = await db_session.run_sync(lambda sync_session: mark_submitted(
+            sync_session, quiz_instance, score, datetime.datetime.utcnow()))
+        if recorded:
+            await db_session.run_sync(lambda sync_session: quizstats.record(
+                sync_session, [(quiz_instance.quiz_id, score)]))
+            await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        autosave_buffer.restore(kwargs['quiz_id'], user['user_id'], buffered)
+        raise
+    if not recorded:
+        await db_session.rollback()
+        autosave_buffer.restore(kwargs['quiz_id'], user['user_id'], buffered)
+        return 0
+    invalidate_assignments([quiz_instance.user_id])
+    leaderboard.submit(quiz_instance.quiz_id, quiz_instance.user_id,
+                       quiz_instance.score_achieved, quiz_instance.updated_ts)
+    return quiz_instance
+
+
+async def submit_quiz(db_session, user, **kwargs):
+    """
+    Stores the answer sheet of the user, with the autosaved answers, for the grading queue.
+
+    Returns:
+        SubmissionReceipt: The receipt of the submission.
+        int: 0 if the quiz is not assigned to the user or is already submitted.
+    """
+    if not (await db_session.execute(answerable_statement(kwargs['quiz_id'], user['user_id']))).scalar():
+        return 0
+    buffered = await asyncio.to_thread(autosave_buffer.take, kwargs['quiz_id'], user['user_id'])
+    responses = dict(buffered)
+    responses.update(kwargs['responses'][0] if kwargs.get('responses') else dict())
+    receipt = new_receipt(kwargs['quiz_id'], user['user_id'], responses)
+    try:
+        db_session.add(receipt)
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        autosave_buffer.restore(kwargs['quiz_id'], user['user_id'], buffered)
+        raise
+    grading_queue.put(receipt.id)
+    return receipt
+
+
+async def submission_status(db_session, user, **kwargs):
+    """
+    The status of a submission queued for grading, for its user or an admin.
+
+    Returns:
+        list: The status of the receipt.
+        int: 0 if the receipt does not exist or belongs to another user.
+    """
+    receipt = await db_session.get(SubmissionReceipt, kwargs['receipt_id'])
+    if receipt is None or (user['is_admin'] != 1 and receipt.user_id != user['user_id']):
+        return 0
+    return [receipt_status(receipt)]
+
+
+async def autosave_answers(db_session, user, **kwargs):
+    """
+    Buffers answers of the user during an exam, for the writer thread of the autosave buffer to store.
+
+    Returns:
+        list: The ids of the saved questions.
+        int: 0 if the quiz is not assigned to the user or is already submitted.
+    """
+    if not (await db_session.execute(answerable_statement(kwargs['quiz_id'], user['user_id']))).scalar():
+        return 0
+    answer_key = await db_session.run_sync(lambda sync_session: get_answer_key(kwargs['quiz_id'], sync_session))
+    answers = {question_id: choice for question_id, choice in kwargs['answers'].items()
+               if question_id in answer_key.index}
+    autosave_buffer.save(kwargs['quiz_id'], user['user_id'], answers)
+    return list(answers)
+
+
+async def quiz_statistics(db_session, **kwargs):
+    """
+    The statistics of the submissions of a quiz, derived from its quiz_score_count rows.
+
+    Returns:
+        list: The statistics of the quiz.
+        int: 0 if the quiz does not exist.
+    """
+    if (await db_session.execute(quizstats.quiz_id_statement(kwargs['quiz_id']))).first() is None:
+        return 0
+    score_counts = (await db_session.execute(quizstats.score_counts_statement(kwargs['quiz_id']))).all()
+    answer_key = await db_session.run_sync(lambda sync_session: get_answer_key(kwargs['quiz_id'], sync_session))
+    return [quizstats.summary(kwargs['quiz_id'], score_counts, answer_key.total_marks)]
+
+
+async def all_quiz_result(db_session, **kwargs):
+    """
+    One page of the quiz results in (created_ts, id) order.
+
+    Returns:
+        dict: 'response' with the quiz instances and 'next_cursor', None on the last page.
+    """
+    statement = _apply_filters(select(QuizInstance), QuizInstance, kwargs,
+                               ('quiz_id', 'user_id', 'is_submitted', 'is_active'))
+    statement = paginate(statement, QuizInstance, kwargs.get('cursor'), kwargs.get('limit'))
+    quiz_instances, next_cursor = split_page((await db_session.execute(statement)).scalars().all(),
+                                             kwargs.get('limit'))
+    quiz_instance_list = [
+        {
+            'id': quiz_instance.id,
+            'quiz_id': quiz_instance.quiz_id,
+            'user_id': quiz_instance.user_id,
+            'score_achieved': quiz_instance.score_achieved,
+            'is_submitted': quiz_instance.is_submitted,
+        }
+        for quiz_instance in quiz_instances
+    ]
+    return {'response': quiz_instance_list, 'next_cursor': next_cursor}
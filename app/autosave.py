@@ -0,0 +1,179 @@
+import atexit
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from app import application
+from app.grading import answer_rows, save_responses, submitted_assignments
+from app.models import db
+
+"""
+[Autosave Module] Write-behind buffer of the answers saved question by question during an exam.
+                    A save only updates the buffer in memory, the last answer to a question winning;
+                    one writer thread flushes the whole buffer every AUTOSAVE_INTERVAL seconds, or as
+                    soon as it holds AUTOSAVE_MAX_PENDING answers, with one executemany upsert into
+                    user_responses in one transaction, so the writes of an exam are spread over its
+                    duration instead of arriving with the submissions at the deadline. A flush which
+                    fails keeps its answers for the next one, but for those of deleted rows. The submission takes the buffered answers of
+                    its assignment, after any flush in progress, and grades what is stored. A submission
+                    is final: answers still buffered for a submitted assignment, by another process or
+                    saved while the submission ran, are dropped by the flush, which locks the
+                    assignments of its batch before reading which are submitted.
+"""
+
+AUTOSAVE_INTERVAL = application.config.get('AUTOSAVE_INTERVAL', 1.0)
+AUTOSAVE_MAX_PENDING = application.config.get('AUTOSAVE_MAX_PENDING', 5000)
+
+
+class AutosaveBuffer:
+    """
+    The unsaved answers of the process keyed by (quiz id, user id), with one writer thread started on the first save.
+    """
+
+    def __init__(self, interval=AUTOSAVE_INTERVAL, max_pending=AUTOSAVE_MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = dict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.wake = threading.Event()
+        self.thread = None
+        self.saves = 0
+        self.flushes = 0
+        self.writes = 0
+        self.dropped = 0
+
+    def save(self, quiz_id, user_id, answers):
+        """
+        Buffer answers of one assignment, replacing those buffered for the same questions.
+
+        Args:
+            quiz_id (str): The ID of the quiz.
+            user_id (str): The ID of the user.
+            answers (dict): A mapping of question id to the chosen option.
+        """
+        self._start()
+        with self.lock:
+            buffered = self.pending.setdefault((quiz_id, user_id), dict())
+            self.size -= len(buffered)
+            buffered.update(answers)
+            self.size += len(buffered)
+            self.saves += len(answers)
+            full = self.size >= self.max_pending
+        if full:
+            self.wake.set()
+
+    def take(self, quiz_id, user_id):
+        """
+        Remove and return the buffered answers of one assignment, for its submission to store them.
+        A flush in progress is waited for, so that no answer of the assignment is still in flight.
+
+        Returns:
+            dict: A mapping of question id to the chosen option, empty if nothing is buffered.
+        """
+        with self.flushing, self.lock:
+            answers = self.pending.pop((quiz_id, user_id), dict())
+            self.size -= len(answers)
+        return answers
+
+    def restore(self, quiz_id, user_id, answers):
+        """
+        Buffer again the answers taken by a submission which was not stored, behind those saved since.
+
+        Args:
+            quiz_id (str): The ID of the quiz.
+            user_id (str): The ID of the user.
+            answers (dict): The answers returned by `take`.
+        """
+        if answers:
+            self._restore({(quiz_id, user_id): dict(answers)})
+
+    def flush(self):
+        """
+        Write every buffered answer with one executemany upsert and one commit, but for the answers
+        of submitted assignments, which are dropped. If the batch breaks a constraint, its assignments are written
+        one transaction each and those which still fail, their quiz, user or question being deleted,
+        are dropped. On any other failure the answers are put back, behind those saved since.
+
+        Returns:
+            int: The number of answers written.
+        """
+        with self.flushing:
+            with self.lock:
+                batch, self.pending, self.size = self.pending, dict(), 0
+            if not batch:
+                return 0
+            try:
+                written = self._write(batch)
+            except IntegrityError:
+                written = 0
+                for key, answers in batch.items():
+                    try:
+                        written += self._write({key: answers})
+                    except IntegrityError:
+                        application.logger.exception(f'autosaved answers of {key} dropped')
+                    except Exception:
+                        self._restore({key: answers})
+                        raise
+            except Exception:
+                self._restore(batch)
+                raise
+            self.flushes += 1
+            return written
+
+    def _write(self, batch):
+        """
+        Upsert the answers of a batch, but for those of submitted assignments, in one transaction.
+
+        Returns:
+            int: The number of answers written.
+        """
+        with db.engine.begin() as connection:
+            submitted = submitted_assignments(connection, batch)
+            rows = [row for (quiz_id, user_id), answers in batch.items() if (quiz_id, user_id) not in submitted
+                    for row in answer_rows(quiz_id, user_id, answers.items())]
+            if rows:
+                save_responses(connection, rows)
+        self.dropped += sum(len(batch[key]) for key in submitted)
+        self.writes += len(rows)
+        return len(rows)
+
+    def _restore(self, batch):
+        with self.lock:
+            for key, answers in batch.items():
+                newer = self.pending.get(key)
+                if newer is not None:
+                    self.size -= len(newer)
+                    answers.update(newer)
+                self.pending[key] = answers
+                self.size += len(answers)
+
+    def _start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='autosave', daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        with application.app_context():
+            while True:
+                self.wake.wait(self.interval)
+                self.wake.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    application.logger.exception('autosave flush failed, its answers are kept for the next one')
+
+    def close(self):
+        """
+        Flush what is left, on exit of the process.
+        """
+        with application.app_context():
+            self.flush()
+
+
+autosave_buffer = AutosaveBuffer()
+atexit.register(autosave_buffer.close)
@@ -0,0 +1,151 @@
+import time
+from itertools import islice
+
+from sqlalchemy import func, insert
+from sqlalchemy.dialects import mysql, sqlite
+
+from app.models import db
+
+"""
+[Bulk Module] Shared helpers for set-based writes. Large inputs are consumed in
+                fixed-size chunks and every chunk goes to the database as one
+                multi-row statement instead of one ORM object per row.
+"""
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+
+class BulkReport:
+    """
+    Outcome of a bulk run: row counters, per-row errors and throughput.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors = list()
+        self.elapsed = 0.0
+        self._started = time.perf_counter()
+
+    def add_error(self, row, error):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'error': str(error)})
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self._started
+
+    @property
+    def rows_per_sec(self):
+        return round(self.total / self.elapsed, 2) if self.elapsed else float(self.total)
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'rows_per_sec': self.rows_per_sec,
+            'errors': self.errors,
+        }
+
+    def __str__(self):
+        return (f'{self.total} rows in {self.elapsed:.2f}s ({self.rows_per_sec} rows/sec): '
+                f'{self.inserted} inserted, {self.updated} updated, '
+                f'{self.skipped} skipped, {self.failed} failed')
+
+
+def chunked(iterable, size=DEFAULT_CHUNK_SIZE):
+    """
+    Split an iterable into lists of at most `size` items without materialising it.
+
+    Args:
+        iterable: Any iterable, typically a generator or a csv reader.
+        size (int): The maximum number of items per chunk.
+
+    Yields:
+        list: The next chunk of items.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def dialect_name(db_session):
+    """
+    The dialect name of the database a session or a connection works on.
+    """
+    return (db_session.get_bind() if hasattr(db_session, 'get_bind') else db_session).dialect.name
+
+
+def supports_upsert(dialect=None):
+    """
+    Tells whether the bound database dialect has a native single-statement upsert.
+
+    Args:
+        dialect (str): The dialect name, that of db.engine by default.
+
+    Returns:
+        bool: True for MySQL/MariaDB and SQLite, False otherwise.
+    """
+    return (dialect or db.engine.dialect.name) in ('mysql', 'mariadb', 'sqlite')
+
+
+def upsert_statement(table, rows, key_columns, update_columns, dialect=None, increment_columns=()):
+    """
+    Build one multi-row INSERT which updates `update_columns` when a row collides
+    on a unique key, and adds the incoming values of `increment_columns` to the stored
+    ones. `updated_ts` is refreshed on conflict when the table has it.
+
+    Args:
+        table (Table): The target table.
+        rows (list): A list of dictionaries, one per row, or None for a statement executed
+                     with a list of parameter sets (executemany).
+        key_columns (list): The columns of the unique key the upsert is keyed on.
+        update_columns (list): The columns to overwrite on conflict.
+        dialect (str): The dialect name, that of db.engine by default.
+        increment_columns (list): The counter columns to add to on conflict.
+
+    Returns:
+        Insert: The dialect specific statement, or None if the dialect has no upsert.
+    """
+    dialect = dialect or db.engine.dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        statement = mysql.insert(table)
+    elif dialect == 'sqlite':
+        statement = sqlite.insert(table)
+    else:
+        return None
+    if rows is not None:
+        statement = statement.values(rows)
+    incoming = statement.inserted if dialect != 'sqlite' else statement.excluded
+    values = {column: incoming[column] for column in update_columns}
+    for column in increment_columns:
+        values[column] = table.c[column] + incoming[column]
+    if 'updated_ts' in table.c:
+        values['updated_ts'] = func.now()
+    if dialect == 'sqlite':
+        return statement.on_conflict_do_update(index_elements=key_columns, set_=values)
+    return statement.on_duplicate_key_update(values)
+
+
+def insert_statement(table, rows):
+    """
+    Build one multi-row INSERT for the given rows.
+
+    Args:
+        table (Table): The target table.
+        rows (list): A list of dictionaries, one per row.
+
+    Returns:
+        Insert: The statement inserting every row with a single round trip.
+    """
+    return insert(table).values(rows)
@@ -0,0 +1,282 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from sqlalchemy import select
+
+from app import application, metrics
+from app.models import QuestionMaster, QuizQuestions, db
+
+"""
+[Cache Module] Process local caches for read heavy data. Entries are evicted in least
+                recently used order once the cache reaches its size bound, and writers
+                invalidate the entries they touch.
+                The caches of the read services also coalesce their misses: the requests
+                missing the same key at the same time share one load (single flight), and
+                the first request finding an entry within refresh_ahead seconds of its expiry
+                reloads it while the others keep being served the cached value. Their size,
+                ttl and refresh_ahead are set per service in READ_CACHES, which the
+                application config key of the same name overrides; a maxsize of 0 caches
+                nothing but still coalesces. Hits, misses, coalesced misses and refreshes
+                are counted on /metrics.
+"""
+
+ANSWER_KEY_CACHE_SIZE = 256
+LOAD_TIMEOUT = application.config.get('READ_CACHE_LOAD_TIMEOUT', 30)
+READ_CACHES = {
+    'view_quiz': {'maxsize': 256, 'ttl': 300, 'refresh_ahead': 30},
+    'list_quizzes': {'maxsize': 64, 'ttl': 10, 'refresh_ahead': 2},
+    'list_assigned_quizzes': {'maxsize': 10000, 'ttl': 10, 'refresh_ahead': 2},
+}
+HIT = 'hit'
+MISS = 'miss'
+COALESCED = 'coalesced'
+REFRESH = 'refresh'
+
+read_cache_requests = metrics.registry.counter('quiz_read_cache_requests_total',
+                                               'Reads of the read service caches by cache and result.',
+                                               ('cache', 'result'))
+
+
+class LRUCache:
+    """
+    A thread safe, size bounded mapping evicting the least recently used entry first.
+    With a ttl (seconds) entries also expire that long after they were set.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """
+        Drop every entry whose value satisfies the predicate.
+        """
+        with self._lock:
+            for key in [key for key, (expires_at, value) in self._entries.items() if predicate(value)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class LoadingCache(LRUCache):
+    """
+    An LRUCache filled by the loader passed on a read, one load at a time per key. Invalidating while a
+    load is in flight keeps its result out of the cache, it was read before the write.
+    """
+
+    def __init__(self, name, maxsize, ttl=None, refresh_ahead=0, timeout=LOAD_TIMEOUT):
+        super().__init__(maxsize, ttl)
+        self.name = name
+        self.refresh_ahead = refresh_ahead
+        self.timeout = timeout
+        self._flights = dict()
+        self._generation = 0
+        self.counts = dict.fromkeys((HIT, MISS, COALESCED, REFRESH), 0)
+
+    def _begin(self, key):
+        """
+        Look a key up and decide the part of the caller in its load.
+
+        Returns:
+            tuple: (result, value, flight, generation): HIT with the value, COALESCED with the flight to wait
+                   for, MISS or REFRESH with the flight the caller resolves (and the value being refreshed).
+        """
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            flight = self._flights.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                self._entries.move_to_end(key)
+                result = HIT
+                if flight is None and expires_at is not None and expires_at - now <= self.refresh_ahead:
+                    result = REFRESH
+                    flight = self._flights[key] = Future()
+            elif flight is not None:
+                value, result = None, COALESCED
+            else:
+                value, result = None, MISS
+                flight = self._flights[key] = Future()
+            self.counts[result] += 1
+            generation = self._generation
+        read_cache_requests.inc((self.name, result))
+        return result, value, flight, generation
+
+    def _finish(self, key, flight, generation, value=None, error=None):
+        with self._lock:
+            del self._flights[key]
+        if error is not None:
+            flight.set_exception(error)
+            return
+        if value is not None:
+            with self._lock:
+                if generation == self._generation:
+                    expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+                    self._entries[key] = (expires_at, value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+        flight.set_result(value)
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value of a key, calling loader() once for all the concurrent misses of the key.
+        A None result is returned to the waiting callers but not cached.
+        """
+        result, value, flight, generation = self._begin(key)
+        if result == HIT:
+            return value
+        if result == COALESCED:
+            return flight.result(self.timeout)
+        try:
+            loaded = loader()
+        except Exception as e:
+            self._finish(key, flight, generation, error=e)
+            if result == REFRESH:
+                return value
+            raise
+        self._finish(key, flight, generation, loaded)
+        return loaded
+
+    async def get_or_load_async(self, key, loader):
+        """
+        Coroutine version of `get_or_load`, loader() returning an awaitable.
+        """
+        result, value, flight, generation = self._begin(key)
+        if result == HIT:
+            return value
+        if result == COALESCED:
+            return await asyncio.wait_for(asyncio.wrap_future(flight), self.timeout)
+        try:
+            loaded = await loader()
+        except Exception as e:
+            self._finish(key, flight, generation, error=e)
+            if result == REFRESH:
+                return value
+            raise
+        self._finish(key, flight, generation, loaded)
+        return loaded
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            self._generation += 1
+        super().invalidate_where(predicate)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def read_cache(name):
+    """
+    The LoadingCache of a read service, configured by READ_CACHES and the application config.
+    """
+    options = dict(READ_CACHES[name], **application.config.get('READ_CACHES', dict()).get(name, dict()))
+    return LoadingCache(name, **options)
+
+
+"""
+Compiled question lists of quizzes and their version keyed by quiz id, loaded by services.view_quiz
+"""
+quiz_cache = read_cache('view_quiz')
+
+"""
+Pages of quizzes and their version keyed by (cursor, limit, is_active), loaded by services.list_quizzes
+"""
+quiz_list_cache = read_cache('list_quizzes')
+
+"""
+Quizzes assigned to a user keyed by user id, loaded by services.list_assigned_quizzes
+"""
+assigned_quizzes_cache = read_cache('list_assigned_quizzes')
+
+"""
+Compiled answer keys of quizzes and their version keyed by quiz id, filled and validated by grading.get_answer_key
+"""
+answer_key_cache = LRUCache(ANSWER_KEY_CACHE_SIZE)
+
+
+def invalidate_quiz(quiz_id):
+    """
+    Drop everything cached about a quiz.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+    """
+    quiz_cache.invalidate(quiz_id)
+    answer_key_cache.invalidate(quiz_id)
+
+
+def invalidate_assignments(user_ids=None):
+    """
+    Drop the cached quiz lists of the given users, of every user by default, after an assignment or a submission.
+
+    Args:
+        user_ids (iterable): The IDs of the users.
+    """
+    if user_ids is None:
+        assigned_quizzes_cache.clear()
+        return
+    for user_id in user_ids:
+        assigned_quizzes_cache.invalidate(user_id)
+
+
+def invalidate_quizzes_of_questions(content_hashes):
+    """
+    Drop the cached quizzes which contain any of the given questions.
+
+    Args:
+        content_hashes (list): The content hashes of the edited questions.
+    """
+    if not content_hashes or not (len(quiz_cache) or len(answer_key_cache)):
+        return
+    quiz_ids = db.session.execute(
+        select(QuizQuestions.quiz_id).distinct()
+        .join(QuestionMaster, QuestionMaster.id == QuizQuestions.question_id)
+        .where(QuestionMaster.content_hash.in_(content_hashes))
+    ).scalars()
+    for quiz_id in quiz_ids:
+        invalidate_quiz(quiz_id)
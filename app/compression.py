@@ -0,0 +1,82 @@
+import gzip
+import zlib
+
+from flask import request
+from werkzeug.http import parse_accept_header
+
+from app import application
+
+"""
+[Compression Module] Content encoding of the responses, negotiated per request from Accept-Encoding:
+                        gzip or deflate, whichever the client weighs higher (gzip on a tie), for JSON
+                        and text bodies of at least COMPRESS_MIN_SIZE bytes. Smaller bodies cost more
+                        to compress than they save on the wire. Streamed responses (the result exports)
+                        are sent as they are, and every compressible response carries
+                        Vary: Accept-Encoding for the caches in between.
+"""
+
+COMPRESS_MIN_SIZE = application.config.get('COMPRESS_MIN_SIZE', 1024)
+COMPRESS_LEVEL = application.config.get('COMPRESS_LEVEL', 6)
+ENCODINGS = ('gzip', 'deflate')
+
+
+def negotiate(accept_encoding):
+    """
+    Returns:
+        str: The encoding to use for an Accept-Encoding header, None for the identity.
+    """
+    if not accept_encoding:
+        return None
+    accepted = parse_accept_header(accept_encoding)
+    encoding = max(ENCODINGS, key=accepted.quality)  # the first of ENCODINGS on a tie
+    return encoding if accepted.quality(encoding) > 0 else None
+
+
+def compressible(mimetype):
+    return mimetype is not None and (mimetype == 'application/json' or mimetype.startswith('text/'))
+
+
+def encode(body, encoding):
+    """
+    Compress a body with gzip, or with deflate (the zlib format, as HTTP defines it).
+    """
+    if encoding == 'gzip':
+        return gzip.compress(body, COMPRESS_LEVEL)
+    return zlib.compress(body, COMPRESS_LEVEL)
+
+
+def compress_body(body, mimetype, accept_encoding):
+    """
+    Compress a response body for a request.
+
+    Returns:
+        tuple: The body and the headers to add, Content-Encoding when it was compressed.
+    """
+    if not compressible(mimetype):
+        return body, dict()
+    headers = {'Vary': 'Accept-Encoding'}
+    encoding = negotiate(accept_encoding) if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding is None:
+        return body, headers
+    headers['Content-Encoding'] = encoding
+    return encode(body, encoding), headers
+
+
+def install(application):
+    """
+    Compress the responses of a Flask application.
+    """
+    @application.after_request
+    def compress(response):
+        if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 206, 304):
+            return response
+        body, headers = compress_body(response.get_data(), response.mimetype, request.headers.get('Accept-Encoding'))
+        if 'Content-Encoding' in headers:
+            response.set_data(body)
+        for name, value in headers.items():
+            if name == 'Vary':
+                response.vary.add('Accept-Encoding')
+            else:
+                response.headers[name] = value
+        return response
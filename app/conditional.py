@@ -0,0 +1,124 @@
+import datetime
+import hashlib
+import json
+
+from sqlalchemy import func, select
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+from app import application
+from app.serialization import json_default
+
+"""
+[Conditional Module] Validators of the polled read endpoints (/list.questions, /all.quizzes, /view.quiz)
+                        for HTTP conditional requests. The version of a result is the newest updated_ts
+                        of its rows and their number, read with one aggregate query over the same
+                        statement as the result; the ETag hashes it with the endpoint and its parameters,
+                        Last-Modified is the timestamp. A request whose If-None-Match (or, without it,
+                        If-Modified-Since) matches is answered 304 without loading the result.
+                        Timestamps have a one second precision, so a version whose newest row changed
+                        within VALIDATOR_MARGIN seconds is not settled: a write later in the same second
+                        would leave it unchanged. No validators are sent for it, and a cached result
+                        carrying it is not trusted. The database clock is expected in UTC, like graded_ts.
+"""
+
+VALIDATOR_MARGIN = application.config.get('VALIDATOR_MARGIN', 1)
+
+
+def version_statement(statement, *columns):
+    """
+    The aggregate of the version of a statement's rows, the newest of the given timestamp columns of
+    the statement (its updated_ts by default) and the number of rows.
+    """
+    subquery = statement.subquery()
+    columns = [subquery.c[column] for column in columns or ('updated_ts',)]
+    return select(*(func.max(column) for column in columns), func.count()).select_from(subquery)
+
+
+def version_from_aggregate(row):
+    """
+    Returns:
+        tuple: The (newest timestamp or None, number of rows) version of a `version_statement` row.
+    """
+    *timestamps, count = row
+    return newest(timestamps), count
+
+
+def newest(timestamps):
+    """
+    Returns:
+        datetime: The newest of the timestamps, None ignored, None if there is none.
+    """
+    return max((timestamp for timestamp in timestamps if timestamp is not None), default=None)
+
+
+def settled(version):
+    """
+    Whether no write can still land in the second of a version's newest row.
+    """
+    last_modified = version[0]
+    return last_modified is None or \
+        last_modified < datetime.datetime.utcnow() - datetime.timedelta(seconds=VALIDATOR_MARGIN)
+
+
+def settled_version(timestamps, count):
+    """
+    The version of a result loaded from its rows, None when it is not settled yet.
+
+    Args:
+        timestamps (iterable): The timestamp columns of every row of the result.
+        count (int): The number of rows.
+    """
+    version = (newest(timestamps), count)
+    return version if settled(version) else None
+
+
+def entity_tag(path, params, version):
+    """
+    The weak entity tag of a result.
+
+    Args:
+        path (str): The path of the endpoint.
+        params (dict): The parameters of the request.
+        version (tuple): The version of the result.
+
+    Returns:
+        str: The unquoted tag, None if the version is not settled.
+    """
+    if not settled(version):
+        return None
+    payload = json.dumps([path, params, version], sort_keys=True, default=json_default)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def not_modified(headers, tag, version):
+    """
+    Whether the request headers validate the client's copy of a result: If-None-Match takes precedence
+    over If-Modified-Since.
+
+    Args:
+        headers (Mapping): The request headers.
+        tag (str): The entity tag of the result, None when there are no validators.
+        version (tuple): The version of the result.
+    """
+    if tag is None:
+        return False
+    if_none_match = headers.get('If-None-Match')
+    if if_none_match:
+        return parse_etags(if_none_match).contains_weak(tag)
+    if_modified_since = parse_date(headers.get('If-Modified-Since'))
+    last_modified = version[0]
+    return if_modified_since is not None and last_modified is not None and \
+        last_modified.replace(tzinfo=datetime.timezone.utc) <= if_modified_since
+
+
+def validator_headers(tag, version):
+    """
+    The ETag and Last-Modified headers of a result, none without a tag. The client revalidates its copy
+    on every use.
+    """
+    if tag is None:
+        return dict()
+    headers = {'ETag': quote_etag(tag, weak=True), 'Cache-Control': 'private, no-cache'}
+    if version[0] is not None:
+        headers['Last-Modified'] = http_date(version[0].replace(tzinfo=datetime.timezone.utc))
+    return headers
@@ -0,0 +1,163 @@
+import datetime
+
+import click
+from sqlalchemy import select
+
+from app import application
+from app.models import (GroupMember, GroupQuiz, QuestionMaster, QuizInstance, QuizQuestions, UserGroup,
+                        SubmissionReceipt, UserMaster, UserResponses, UserSession, db)
+from app.conditional import version_statement
+from app.grading import answer_key_statement, answer_key_version_statement
+from app.leaderboard import instance_changes_statement, member_changes_statement
+from app.pagination import encode_cursor, paginate
+from app.search import INDEXED_COLUMNS
+from app.quizstats import quiz_id_statement, score_counts_statement
+from app.services import (answerable_statement, assigned_quizzes_statement, assignment_statement, questions_page_statement,
+                          quiz_questions_statement, quiz_version_statement, quizzes_page_statement, search_results_statement)
+
+"""
+[Explain Module] Checks with EXPLAIN that the queries issued by the services are served by an index.
+                    Each entry below has the shape of a query in services.py (and the modules it uses)
+                    with placeholder values; a plan with a full table scan or a sort for the ORDER BY
+                    is reported as a failure.
+"""
+
+_ID = '00000000-0000-0000-0000-000000000000'
+_CURSOR = encode_cursor(datetime.datetime(2000, 1, 1), _ID)
+
+
+def service_queries():
+    """
+    Returns:
+        dict: The representative select of every hot service query, keyed by a descriptive name.
+    """
+    return {
+        'login: user by username': select(UserMaster).where(UserMaster.username == _ID),
+        'session store: live session by session_id': (
+            select(UserSession.user_id, UserMaster.is_admin)
+            .join(UserMaster, UserMaster.id == UserSession.user_id)
+            .where(UserSession.session_id == _ID, UserSession.is_active == 1)
+        ),
+        'view_quiz: assignment probe, direct and through groups': assignment_statement(_ID, _ID),
+        'view_quiz: quiz with questions': quiz_questions_statement(_ID),
+        'list_assigned_quizzes: instances and group quizzes of user': assigned_quizzes_statement(_ID),
+        'attempt_quiz: instance of user': select(QuizInstance).where(QuizInstance.quiz_id == _ID,
+                                                                    QuizInstance.user_id == _ID),
+        'attempt_quiz: answer key': answer_key_statement(_ID),
+        'attempt_quiz: version of the cached answer key': answer_key_version_statement(_ID),
+        'user_responses: by quiz and user': select(UserResponses).where(UserResponses.quiz_id == _ID,
+                                                                       UserResponses.user_id == _ID),
+        'autosave_answers: assigned and not submitted': answerable_statement(_ID, _ID),
+        'autosave flush: submitted among the flushed': (
+            select(QuizInstance.quiz_id, QuizInstance.user_id, QuizInstance.updated_ts)
+            .where(QuizInstance.quiz_id.in_([_ID]), QuizInstance.user_id.in_([_ID]), QuizInstance.is_submitted == 1)
+        ),
+        'grading queue: receipts left queued': (
+            select(SubmissionReceipt.id, SubmissionReceipt.created_ts).where(SubmissionReceipt.status == 'queued')
+            .order_by(SubmissionReceipt.created_ts, SubmissionReceipt.id)
+        ),
+        'grading queue: stale claims': (
+            select(SubmissionReceipt.id)
+            .where(SubmissionReceipt.status == 'grading', SubmissionReceipt.updated_ts < datetime.datetime(2000, 1, 1))
+        ),
+        'grading queue: claimed receipts': (
+            select(SubmissionReceipt)
+            .where(SubmissionReceipt.id.in_([_ID]), SubmissionReceipt.status == 'grading',
+                   SubmissionReceipt.claim_id == _ID)
+            .order_by(SubmissionReceipt.created_ts, SubmissionReceipt.id)
+        ),
+        'regrade_quiz: responses of quiz': (
+            select(UserResponses.user_id, UserResponses.question_id, UserResponses.response)
+            .where(UserResponses.quiz_id == _ID)
+        ),
+        'importer: quizzes of edited questions': (
+            select(QuizQuestions.quiz_id).distinct()
+            .join(QuestionMaster, QuestionMaster.id == QuizQuestions.question_id)
+            .where(QuestionMaster.content_hash.in_([_ID]))
+        ),
+        'search_questions: questions of the hits': search_results_statement({'hits': [(_ID, 1.0)]}),
+        'search refresh: questions changed since': (
+            select(*INDEXED_COLUMNS, QuestionMaster.updated_ts)
+            .where(QuestionMaster.updated_ts >= datetime.datetime(2000, 1, 1))
+        ),
+        'list_questions: page': questions_page_statement({'cursor': _CURSOR}),
+        'list_quizzes: page': quizzes_page_statement({'cursor': _CURSOR}),
+        'list_questions: version of page': version_statement(questions_page_statement({'cursor': _CURSOR})),
+        'list_quizzes: version of page': version_statement(quizzes_page_statement({'cursor': _CURSOR})),
+        'view_quiz: version of quiz questions': quiz_version_statement(_ID),
+        'all_quiz_result: page': paginate(select(QuizInstance), QuizInstance, _CURSOR),
+        'add_members: members of group': select(GroupMember.user_id).where(GroupMember.group_id == _ID,
+                                                                          GroupMember.user_id.in_([_ID])),
+        'add_members: quizzes of group': select(GroupQuiz.quiz_id).where(GroupQuiz.group_id == _ID),
+        'leaderboard refresh: assignments changed since': instance_changes_statement(_ID, datetime.datetime(2000, 1, 1)),
+        'leaderboard refresh: group members added since': member_changes_statement(_ID, datetime.datetime(2000, 1, 1)),
+        'list_members: page': paginate(select(GroupMember).where(GroupMember.group_id == _ID), GroupMember, _CURSOR),
+        'list_groups: page': paginate(select(UserGroup), UserGroup, _CURSOR),
+        'quiz_statistics: quiz by id': quiz_id_statement(_ID),
+        'quiz_statistics: submissions per score': score_counts_statement(_ID),
+    }
+
+
+def _sqlite_plan(connection, sql, params):
+    details = [row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + sql, params)]
+    # the rows of a subquery (a page under an aggregate) are scanned once produced, like DERIVED on MySQL
+    derived = {'SCAN ' + detail.split()[-1] for detail in details if detail.startswith(('CO-ROUTINE ', 'MATERIALIZE '))}
+    full_scan = any(detail.startswith('SCAN ') and ' USING ' not in detail and detail != 'SCAN CONSTANT ROW'
+                    and detail not in derived for detail in details)
+    sorted_ = any('TEMP B-TREE FOR ORDER BY' in detail for detail in details)
+    return not (full_scan or sorted_), details
+
+
+def _mysql_plan(connection, sql, params):
+    rows = [row._asdict() for row in connection.exec_driver_sql('EXPLAIN ' + sql, params)]
+    uses_index = all(
+        row.get('table') is None or (row.get('key') is not None and row.get('type') != 'ALL')
+        for row in rows if row.get('select_type') != 'DERIVED'
+    ) and not any('filesort' in (row.get('Extra') or '') for row in rows)
+    details = [f"{row.get('table')}: type={row.get('type')} key={row.get('key')} {row.get('Extra') or ''}".strip()
+               for row in rows]
+    return uses_index, details
+
+
+def index_report():
+    """
+    EXPLAIN every query of `service_queries`.
+
+    Returns:
+        list: One dictionary per query with its name, whether it uses indexes only and the plan lines.
+
+    Raises:
+        NotImplementedError: If the database is neither SQLite nor MySQL/MariaDB.
+    """
+    dialect = db.engine.dialect
+    if dialect.name == 'sqlite':
+        explain = _sqlite_plan
+    elif dialect.name in ('mysql', 'mariadb'):
+        explain = _mysql_plan
+    else:
+        raise NotImplementedError(f'EXPLAIN check is not implemented for {dialect.name}')
+    report = list()
+    with db.engine.connect() as connection:
+        for name, statement in service_queries().items():
+            compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True})
+            params = compiled.construct_params()
+            if compiled.positional:
+                params = tuple(params[key] for key in compiled.positiontup)
+            uses_index, plan = explain(connection, str(compiled), params)
+            report.append({'name': name, 'uses_index': uses_index, 'plan': plan})
+    return report
+
+
+@application.cli.command('check-indexes')
+def check_indexes_command():
+    """
+    EXPLAIN the service queries and fail if any of them scans a table or sorts.
+    """
+    failures = 0
+    for entry in index_report():
+        failures += not entry['uses_index']
+        click.echo(f"{'ok  ' if entry['uses_index'] else 'FAIL'} {entry['name']}")
+        for line in entry['plan']:
+            click.echo(f'       {line}')
+    if failures:
+        raise SystemExit(f'{failures} queries do not use an index')
@@ -0,0 +1,123 @@
+import csv
+import io
+
+import click
+from sqlalchemy import select
+
+from app import application
+from app.models import QuizInstance, QuizMaster, UserMaster, db
+from app.serialization import dumps
+
+"""
+[Export Module] Streaming export of quiz results. Rows are read from a server side cursor
+                chunk by chunk with the quiz and user names joined in SQL, and every chunk
+                is encoded and handed out before the next one is fetched, so memory stays
+                bounded whatever the size of quiz_instance.
+"""
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_COLUMNS = ('id', 'quiz_id', 'quiz_name', 'user_id', 'user_name',
+                  'score_achieved', 'is_submitted', 'created_ts', 'updated_ts')
+
+
+def result_rows(quiz_id=None, date_from=None, date_to=None):
+    """
+    Stream the quiz results matching the filters.
+
+    Args:
+        quiz_id (str): Only export the results of this quiz.
+        date_from (datetime): Only export results last updated at or after this time.
+        date_to (datetime): Only export results last updated before this time.
+
+    Returns:
+        Result: The streamed rows, ordered by quiz and user.
+    """
+    statement = (
+        select(QuizInstance.id, QuizInstance.quiz_id, QuizMaster.quiz_name.label('quiz_name'),
+               QuizInstance.user_id, UserMaster.name.label('user_name'), QuizInstance.score_achieved,
+               QuizInstance.is_submitted, QuizInstance.created_ts, QuizInstance.updated_ts)
+        .join(QuizMaster, QuizMaster.id == QuizInstance.quiz_id)
+        .join(UserMaster, UserMaster.id == QuizInstance.user_id)
+        .order_by(QuizInstance.quiz_id, QuizInstance.user_id)
+    )
+    if quiz_id:
+        statement = statement.where(QuizInstance.quiz_id == quiz_id)
+    if date_from:
+        statement = statement.where(QuizInstance.updated_ts >= date_from)
+    if date_to:
+        statement = statement.where(QuizInstance.updated_ts < date_to)
+    return db.session.execute(
+        statement.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+    )
+
+
+def _encode_value(value):
+    return value.isoformat(sep=' ') if hasattr(value, 'isoformat') else value
+
+
+def ndjson_chunks(rows):
+    """
+    Encode streamed rows as newline delimited json, one chunk of rows per yielded string.
+    """
+    for partition in rows.partitions():
+        yield ''.join(
+            dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n'
+            for row in partition
+        )
+
+
+def csv_chunks(rows):
+    """
+    Encode streamed rows as csv, the header first and then one chunk of rows per yielded string.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for partition in rows.partitions():
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_encode_value(value) for value in row] for row in partition)
+        yield buffer.getvalue()
+
+
+def export_results(format='ndjson', quiz_id=None, date_from=None, date_to=None):
+    """
+    Build the chunk generator of a results export. The query runs on the first iteration.
+
+    Args:
+        format (str): 'ndjson' or 'csv'.
+        quiz_id, date_from, date_to: The filters of `result_rows`.
+
+    Returns:
+        generator: The encoded chunks.
+
+    Raises:
+        ValueError: If the format is not supported.
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f'format must be one of {", ".join(EXPORT_FORMATS)}')
+    encoder = ndjson_chunks if format == 'ndjson' else csv_chunks
+
+    def chunks():
+        yield from encoder(result_rows(quiz_id, date_from, date_to))
+    return chunks()
+
+
+@application.cli.command('export-results')
+@click.option('--format', 'format', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+@click.option('--quiz-id', default=None, help='Only export the results of this quiz.')
+@click.option('--from', 'date_from', type=click.DateTime(), default=None, help='Results updated at or after this time.')
+@click.option('--to', 'date_to', type=click.DateTime(), default=None, help='Results updated before this time.')
+@click.option('--output', type=click.File('w'), default='-', help='Output file, stdout by default.')
+def export_results_command(format, quiz_id, date_from, date_to, output):
+    """
+    Stream quiz results as ndjson or csv.
+    """
+    for chunk in export_results(format, quiz_id, date_from, date_to):
+        output.write(chunk)
+    output.flush()
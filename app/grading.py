@@ -0,0 +1,365 @@
+from array import array
+from collections import defaultdict
+
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app import quizstats
+from app.bulk import chunked, dialect_name, supports_upsert, upsert_statement
+from app.cache import answer_key_cache
+from app.conditional import settled_version, version_from_aggregate, version_statement
+from app.keys import new_id
+from app.models import QuestionMaster, QuizInstance, QuizQuestions, UserResponses, db
+
+"""
+[Grading Module] Set based grading. Every quiz is compiled once into an answer key holding the
+                    correct choice and the marks of its questions in flat arrays, a submission
+                    is scored against it in one pass. The cached key carries the version of its rows
+                    (their newest updated_ts and their number) and is only used while the version
+                    read from the database is the same, so an edit made through another process
+                    is graded against at once. Responses are written with a single
+                    executemany upsert on (quiz_id, user_id, question_id), whether they come
+                    from the autosave buffer or with the submission, and a submission is
+                    graded from the responses stored for it.
+"""
+
+REGRADE_CHUNK_SIZE = 1000
+INSERT_RESPONSES = insert(UserResponses.__table__)
+RESPONSE_KEY = ['quiz_id', 'user_id', 'question_id']
+
+
+class AnswerKey:
+    """
+    The correct choices and marks of a quiz, aligned by position with its question ids.
+    """
+
+    def __init__(self, question_ids, answers, marks, version=None):
+        self.question_ids = tuple(question_ids)
+        self.index = {question_id: position for position, question_id in enumerate(self.question_ids)}
+        self.answers = array('i', answers)
+        self.marks = array('i', marks)
+        self.total_marks = sum(self.marks)
+        self.version = version
+
+    def align(self, responses):
+        """
+        Lay a submitted answer sheet out in the order of the key. Unanswered questions hold 0,
+        answers to questions which are not part of the quiz are dropped.
+
+        Args:
+            responses (dict): A mapping of question id to the chosen option.
+
+        Returns:
+            array: The chosen option per question of the key.
+        """
+        chosen = array('i', [0]) * len(self.question_ids)
+        for question_id, choice in responses.items():
+            position = self.index.get(question_id)
+            if position is not None:
+                chosen[position] = int(choice)
+        return chosen
+
+    def score(self, chosen):
+        """
+        Score an aligned answer sheet.
+
+        Args:
+            chosen (array): The chosen option per question, as returned by `align`.
+
+        Returns:
+            int: The sum of the marks of the correctly answered questions.
+        """
+        return sum(mark for answer, choice, mark in zip(self.answers, chosen, self.marks) if answer == choice)
+
+
+def answer_key_statement(quiz_id):
+    """
+    The joined select of the question ids, answers and marks of a quiz, with the updated_ts of the
+    questions and of their links to the quiz.
+    """
+    return (
+        select(QuestionMaster.id, QuestionMaster.answer, QuestionMaster.marks, QuestionMaster.updated_ts,
+               QuizQuestions.updated_ts.label('link_ts'))
+        .join(QuizQuestions, QuizQuestions.question_id == QuestionMaster.id)
+        .where(QuizQuestions.quiz_id == quiz_id)
+    )
+
+
+def answer_key_version_statement(quiz_id):
+    """
+    The aggregate of the version of `answer_key_statement`'s rows.
+    """
+    return version_statement(answer_key_statement(quiz_id), 'updated_ts', 'link_ts')
+
+
+def answer_key_from_rows(rows):
+    """
+    Build an answer key from the rows of `answer_key_statement`, with their version if it is settled.
+    """
+    return AnswerKey(
+        [row.id for row in rows],
+        [int(row.answer) for row in rows],
+        [int(row.marks) for row in rows],
+        settled_version([timestamp for row in rows for timestamp in (row.updated_ts, row.link_ts)], len(rows)),
+    )
+
+
+def load_answer_key(quiz_id, db_session=None):
+    """
+    Compile the answer key of a quiz with one joined query.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        db_session (Session): The session or connection to query, db.session by default.
+
+    Returns:
+        AnswerKey: The answer key, empty if the quiz has no questions.
+    """
+    return answer_key_from_rows((db_session or db.session).execute(answer_key_statement(quiz_id)).all())
+
+
+def get_answer_key(quiz_id, db_session=None):
+    """
+    Return the answer key of a quiz from answer_key_cache if its version is still that of the database,
+    read with one aggregate query, compiling it otherwise. Keys whose version is not settled are not cached.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        db_session (Session): The session or connection to query, db.session by default.
+
+    Returns:
+        AnswerKey: The answer key of the quiz.
+    """
+    db_session = db_session or db.session
+    answer_key = answer_key_cache.get(quiz_id)
+    if answer_key is not None and \
+            answer_key.version == version_from_aggregate(db_session.execute(answer_key_version_statement(quiz_id)).one()):
+        return answer_key
+    answer_key = load_answer_key(quiz_id, db_session)
+    if answer_key.version is not None:
+        answer_key_cache.set(quiz_id, answer_key)
+    else:
+        answer_key_cache.invalidate(quiz_id)
+    return answer_key
+
+
+def get_answer_keys(quiz_ids, db_session=None):
+    """
+    Return the answer keys of several quizzes, each validated once as by `get_answer_key`.
+
+    Returns:
+        dict: The answer keys keyed by quiz id.
+    """
+    return {quiz_id: get_answer_key(quiz_id, db_session) for quiz_id in set(quiz_ids)}
+
+
+def grade_submission(quiz_instance, responses, db_session=None):
+    """
+    Store the responses sent with a submission, over those autosaved for the same questions, and
+    score the responses stored for the assignment. The caller commits.
+
+    Args:
+        quiz_instance (QuizInstance): The assignment being submitted.
+        responses (dict): A mapping of question id to the chosen option.
+        db_session (Session): The session of the submission, db.session by default.
+
+    Returns:
+        int: The score achieved.
+    """
+    db_session = db_session or db.session
+    answer_key = get_answer_key(quiz_instance.quiz_id, db_session)
+    rows = response_rows(quiz_instance, answer_key, answer_key.align(responses))
+    if rows:
+        save_responses(db_session, rows)
+    return stored_score(db_session, answer_key, quiz_instance.quiz_id, quiz_instance.user_id)
+
+
+def mark_submitted(db_session, quiz_instance, score, submitted_ts):
+    """
+    Record the score of an assignment and mark it submitted, unless it already is: the update is
+    conditional on is_submitted, so of two concurrent submissions of an assignment only the first one
+    to commit is recorded. The attributes of the instance are set without a flush.
+
+    Returns:
+        bool: Whether this submission was recorded, the caller rolls back otherwise.
+    """
+    table = QuizInstance.__table__
+    values = {'score_achieved': score, 'is_submitted': 1, 'is_active': 0, 'updated_ts': submitted_ts}
+    recorded = db_session.execute(
+        update(table).where(table.c.id == quiz_instance.id, table.c.is_submitted == 0).values(values)
+    ).rowcount == 1
+    if recorded:
+        for name, value in values.items():
+            set_committed_value(quiz_instance, name, value)
+    return recorded
+
+
+def submitted_assignments(db_session, pairs):
+    """
+    The submitted assignments among the given ones, found with chunked IN lookups on quiz_instance.
+    The assignments are locked first with a no-op update, which on SQLite takes the write lock of the
+    database, so that no submission commits between the lookup and the writes of the caller's transaction.
+
+    Args:
+        db_session (Session): The session or connection of the caller's transaction.
+        pairs (iterable): The (quiz id, user id) pairs of the assignments.
+
+    Returns:
+        set: The (quiz id, user id) of the submitted assignments.
+    """
+    pairs = set(pairs)
+    table = QuizInstance.__table__
+    quiz_ids = list({quiz_id for quiz_id, user_id in pairs})
+    submitted = set()
+    for chunk in chunked(list({user_id for quiz_id, user_id in pairs}), REGRADE_CHUNK_SIZE):
+        assignments = [table.c.quiz_id.in_(quiz_ids), table.c.user_id.in_(chunk)]
+        db_session.execute(update(table).where(*assignments)
+                           .values(is_submitted=table.c.is_submitted, updated_ts=table.c.updated_ts))
+        rows = db_session.execute(
+            select(table.c.quiz_id, table.c.user_id).where(*assignments, table.c.is_submitted == 1)
+        )
+        submitted.update((quiz_id, user_id) for quiz_id, user_id in rows if (quiz_id, user_id) in pairs)
+    return submitted
+
+
+def stored_score(db_session, answer_key, quiz_id, user_id):
+    """
+    Score the responses stored for an assignment, read with one query on ix_user_responses_quiz_user.
+    """
+    stored = db_session.execute(stored_responses_statement(quiz_id, user_id)).all()
+    return answer_key.score(answer_key.align(dict(stored)))
+
+
+def stored_scores(db_session, pairs):
+    """
+    Score the responses stored for many assignments with chunked IN queries, for the grading queue.
+
+    Args:
+        db_session (Session): The session to query.
+        pairs (set): The (quiz id, user id) pairs of the assignments.
+
+    Returns:
+        dict: The score keyed by (quiz id, user id), 0 for an assignment without responses.
+    """
+    sheets = {pair: dict() for pair in pairs}
+    quiz_ids = list({quiz_id for quiz_id, user_id in pairs})
+    for chunk in chunked(list({user_id for quiz_id, user_id in pairs}), REGRADE_CHUNK_SIZE):
+        rows = db_session.execute(
+            select(UserResponses.quiz_id, UserResponses.user_id, UserResponses.question_id, UserResponses.response)
+            .where(UserResponses.quiz_id.in_(quiz_ids), UserResponses.user_id.in_(chunk))
+        )
+        for quiz_id, user_id, question_id, response in rows:
+            sheet = sheets.get((quiz_id, user_id))
+            if sheet is not None:
+                sheet[question_id] = response
+    scores = dict()
+    answer_keys = get_answer_keys((quiz_id for quiz_id, _ in sheets), db_session)
+    for (quiz_id, user_id), sheet in sheets.items():
+        answer_key = answer_keys[quiz_id]
+        scores[quiz_id, user_id] = answer_key.score(answer_key.align(sheet))
+    return scores
+
+
+def stored_responses_statement(quiz_id, user_id):
+    """
+    The select of the (question id, response) pairs stored for an assignment.
+    """
+    return (
+        select(UserResponses.question_id, UserResponses.response)
+        .where(UserResponses.quiz_id == quiz_id, UserResponses.user_id == user_id)
+    )
+
+
+def save_responses(db_session, rows):
+    """
+    Write user_responses rows with one executemany upsert, a single statement whatever the number of
+    answers and free of the bind parameter limit of a multi-row VALUES. A response already stored for
+    the question is overwritten. Without a native upsert the stored responses of the rows are deleted
+    and the rows inserted.
+
+    Args:
+        db_session (Session): The session or connection of the write, the caller commits.
+        rows (list): The rows, as built by `response_rows`.
+    """
+    dialect = dialect_name(db_session)
+    if supports_upsert(dialect):
+        db_session.execute(upsert_statement(UserResponses.__table__, None, RESPONSE_KEY, ['response'], dialect), rows)
+        return
+    questions = defaultdict(list)
+    for row in rows:
+        questions[row['quiz_id'], row['user_id']].append(row['question_id'])
+    for (quiz_id, user_id), question_ids in questions.items():
+        for chunk in chunked(question_ids, REGRADE_CHUNK_SIZE):
+            db_session.execute(delete(UserResponses.__table__).where(
+                UserResponses.quiz_id == quiz_id, UserResponses.user_id == user_id,
+                UserResponses.question_id.in_(chunk),
+            ))
+    db_session.execute(INSERT_RESPONSES, rows)
+
+
+def response_rows(quiz_instance, answer_key, chosen):
+    """
+    The user_responses rows of an aligned answer sheet, unanswered questions left out.
+    """
+    return answer_rows(quiz_instance.quiz_id, quiz_instance.user_id,
+                       ((question_id, choice) for question_id, choice in zip(answer_key.question_ids, chosen) if choice))
+
+
+def answer_rows(quiz_id, user_id, answers):
+    """
+    The user_responses rows of (question id, chosen option) pairs of one assignment.
+    """
+    return [
+        {
+            'id': new_id(),
+            'quiz_id': quiz_id,
+            'user_id': user_id,
+            'question_id': question_id,
+            'response': choice,
+            'is_active': 1,
+        }
+        for question_id, choice in answers
+    ]
+
+
+def regrade_quiz(quiz_id):
+    """
+    Re-grade every submission of a quiz against a freshly compiled answer key, for instance after
+    an answer correction. The stored responses are streamed in one query and the scores are
+    written back with chunked executemany updates in a single transaction, which also rebuilds
+    the statistics of the quiz.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+
+    Returns:
+        int: The number of submissions re-graded.
+    """
+    answer_key_cache.invalidate(quiz_id)
+    answer_key = get_answer_key(quiz_id)
+    scores = defaultdict(int)
+    responses = db.session.execute(
+        select(UserResponses.user_id, UserResponses.question_id, UserResponses.response)
+        .where(UserResponses.quiz_id == quiz_id)
+        .execution_options(yield_per=REGRADE_CHUNK_SIZE)
+    )
+    for user_id, question_id, response in responses:
+        position = answer_key.index.get(question_id)
+        if position is not None and answer_key.answers[position] == response:
+            scores[user_id] += answer_key.marks[position]
+
+    table = QuizInstance.__table__
+    regraded = db.session.execute(
+        update(table).where(table.c.quiz_id == quiz_id, table.c.is_submitted == 1).values(score_achieved=0)
+    ).rowcount
+    statement = (
+        update(table)
+        .where(table.c.quiz_id == quiz_id, table.c.user_id == bindparam('b_user_id'), table.c.is_submitted == 1)
+        .values(score_achieved=bindparam('b_score'))
+    )
+    graded = [{'b_user_id': user_id, 'b_score': score} for user_id, score in scores.items()]
+    for chunk in chunked(graded, REGRADE_CHUNK_SIZE):
+        db.session.connection().execute(statement, chunk)
+    quizstats.rebuild(db.session, quiz_id)
+    db.session.commit()
+    return regraded
@@ -0,0 +1,387 @@
+import datetime
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import select, update
+
+from app import application, metrics, quizstats
+from app.cache import invalidate_assignments
+from app.grading import get_answer_keys, response_rows, save_responses, stored_scores, submitted_assignments
+from app.groups import instance_from_group
+from app.keys import new_id
+from app.leaderboard import leaderboard
+from app.models import QuizInstance, SubmissionReceipt, db
+
+"""
+[Grading Queue Module] Asynchronous grading of the submissions sent to /submit.quiz. The request stores
+                        the answer sheet in submission_receipt with one insert and returns the receipt
+                        id; a pool of GRADING_WORKERS threads takes the receipts off an in-process
+                        queue, up to GRADING_BATCH_SIZE of them arriving within GRADING_BATCH_WINDOW
+                        seconds, and grades a batch in one transaction: the responses of every sheet
+                        go in one executemany upsert, the stored responses are read back with IN
+                        queries and scored, and the quiz instances and receipts are updated before a
+                        single commit. If a batch fails its receipts are graded one transaction each,
+                        so that a bad sheet only fails its own receipt. A worker claims the receipts of
+                        its batch first, with one conditional update from queued to grading under a new
+                        claim id which is committed on its own, and grades only the receipts it claimed,
+                        so that workers of different processes never grade the same receipt. Receipts
+                        left queued for GRADING_RECOVERY_AGE seconds, whose process stopped before
+                        claiming them, and claims older than GRADING_CLAIM_TIMEOUT seconds, whose
+                        process stopped while grading, are queued again on startup and by idle
+                        workers every GRADING_RECOVERY_INTERVAL seconds. The queue depth, the wait of
+                        the oldest receipt and the grading lag, from the receipt's creation, are
+                        exposed on /metrics.
+"""
+
+GRADING_WORKERS = application.config.get('GRADING_WORKERS', 2)
+GRADING_BATCH_SIZE = application.config.get('GRADING_BATCH_SIZE', 50)
+GRADING_BATCH_WINDOW = application.config.get('GRADING_BATCH_WINDOW', 0.05)
+GRADING_CLAIM_TIMEOUT = application.config.get('GRADING_CLAIM_TIMEOUT', 300)  # longer than any batch takes
+GRADING_RECOVERY_AGE = application.config.get('GRADING_RECOVERY_AGE', 30)
+GRADING_RECOVERY_INTERVAL = application.config.get('GRADING_RECOVERY_INTERVAL', 60)
+LAG_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+QUEUED = 'queued'
+GRADING = 'grading'
+GRADED = 'graded'
+FAILED = 'failed'
+
+queue_depth = metrics.registry.gauge('quiz_grading_queue_depth', 'Submissions waiting to be graded in the process.')
+oldest_wait = metrics.registry.gauge('quiz_grading_oldest_wait_seconds',
+                                     'Time the oldest submission waiting to be graded has been queued.')
+grading_lag = metrics.registry.histogram('quiz_grading_lag_seconds',
+                                         'Time from the queueing of a submission to the commit of its grade.',
+                                         buckets=LAG_BUCKETS)
+graded_submissions = metrics.registry.counter('quiz_graded_submissions_total',
+                                              'Submissions processed by the grading workers, by outcome.', ('status',))
+
+
+def new_receipt(quiz_id, user_id, responses):
+    """
+    The receipt of a submission, its answer sheet serialized as JSON.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        user_id (str): The ID of the user.
+        responses (dict): A mapping of question id to the chosen option.
+
+    Returns:
+        SubmissionReceipt: The receipt, to be added to a session.
+    """
+    return SubmissionReceipt(id=new_id(), quiz_id=quiz_id, user_id=user_id, responses=json.dumps(responses))
+
+
+def receipt_status(receipt):
+    """
+    The status dictionary of a receipt.
+    """
+    return {
+        'receipt_id': receipt.id,
+        'quiz_id': receipt.quiz_id,
+        'status': receipt.status,
+        'score_achieved': receipt.score_achieved,
+        'error': receipt.error,
+        'submitted_ts': receipt.created_ts,
+        'graded_ts': receipt.graded_ts,
+    }
+
+
+def assignments(receipts):
+    """
+    The quiz instances of the receipts, loaded with one IN query. A member of a group the quiz is assigned
+    to gets the instance written and committed on its own, like on a synchronous submission.
+
+    Returns:
+        dict: The QuizInstance keyed by (quiz id, user id), missing for the receipts of unassigned quizzes.
+    """
+    pairs = {(receipt.quiz_id, receipt.user_id) for receipt in receipts}
+    instances = {
+        (quiz_instance.quiz_id, quiz_instance.user_id): quiz_instance
+        for quiz_instance in db.session.execute(
+            select(QuizInstance).where(QuizInstance.quiz_id.in_(list({quiz_id for quiz_id, user_id in pairs})),
+                                       QuizInstance.user_id.in_(list({user_id for quiz_id, user_id in pairs})))
+        ).scalars()
+        if (quiz_instance.quiz_id, quiz_instance.user_id) in pairs
+    }
+    for quiz_id, user_id in pairs - set(instances):
+        quiz_instance = instance_from_group(quiz_id, user_id)
+        if quiz_instance is not None:
+            db.session.commit()
+            instances[quiz_id, user_id] = quiz_instance
+    return instances
+
+
+def claim_receipts(receipt_ids):
+    """
+    Claim the receipts among the given ones which are still queued, in a transaction of its own.
+
+    Returns:
+        str: The claim id, set on the claimed receipts.
+    """
+    claim_id = new_id()
+    table = SubmissionReceipt.__table__
+    db.session.execute(
+        update(table).where(table.c.id.in_(receipt_ids), table.c.status == QUEUED)
+        .values(status=GRADING, claim_id=claim_id, updated_ts=datetime.datetime.utcnow())
+    )
+    db.session.commit()
+    return claim_id
+
+
+def grade_receipts(receipt_ids, claim_id):
+    """
+    Grade the receipts among the given ones held by a claim in one transaction, in the order they were received,
+    with the statistics of their quizzes. A submission is final: the receipts of an assignment which is
+    submitted, read after locking the assignments, fail, and so do all but the first of the batch's
+    receipts of an assignment. Receipts of one assignment graded by different workers count in the
+    order they are graded.
+
+    Returns:
+        list: The status of every receipt graded or failed, GRADED or FAILED.
+    """
+    receipts = db.session.execute(
+        select(SubmissionReceipt)
+        .where(SubmissionReceipt.id.in_(receipt_ids), SubmissionReceipt.status == GRADING,
+               SubmissionReceipt.claim_id == claim_id)
+        .order_by(SubmissionReceipt.created_ts, SubmissionReceipt.id)
+    ).scalars().all()
+    if not receipts:
+        return list()
+    instances = assignments(receipts)
+    submitted = submitted_assignments(db.session, instances)
+    graded = dict()
+    for receipt in receipts:
+        key = (receipt.quiz_id, receipt.user_id)
+        if key in instances and key not in submitted and key not in graded:
+            graded[key] = receipt
+    rows = list()
+    answer_keys = get_answer_keys(quiz_id for quiz_id, _ in graded)
+    for key, receipt in graded.items():
+        answer_key = answer_keys[receipt.quiz_id]
+        rows.extend(response_rows(instances[key], answer_key, answer_key.align(json.loads(receipt.responses))))
+    if rows:
+        save_responses(db.session, rows)
+    scores = stored_scores(db.session, set(graded))
+    graded_ts = datetime.datetime.utcnow()
+    statuses = list()
+    for receipt in receipts:
+        key = (receipt.quiz_id, receipt.user_id)
+        if key not in instances:
+            receipt.status = FAILED
+            receipt.error = 'Quiz is not assigned to the user'
+        elif graded.get(key) is not receipt:
+            receipt.status = FAILED
+            receipt.error = 'Quiz is already submitted'
+        else:
+            quiz_instance = instances[key]
+            quiz_instance.score_achieved = scores[key]
+            quiz_instance.is_submitted = 1
+            quiz_instance.is_active = 0
+            quiz_instance.updated_ts = graded_ts
+            receipt.status = GRADED
+            receipt.score_achieved = quiz_instance.score_achieved
+            receipt.graded_ts = graded_ts
+        if receipt.status == FAILED:
+            receipt.graded_ts = graded_ts
+        statuses.append(receipt.status)
+    quizstats.record(db.session, [(quiz_id, scores[quiz_id, user_id]) for quiz_id, user_id in graded])
+    db.session.commit()
+    invalidate_assignments(user_id for quiz_id, user_id in graded)
+    for quiz_id, user_id in graded:
+        leaderboard.submit(quiz_id, user_id, scores[quiz_id, user_id], graded_ts)
+    return statuses
+
+
+def fail_receipt(receipt_id, claim_id, error):
+    """
+    Record the error of a claimed receipt which could not be graded.
+    """
+    receipt = db.session.get(SubmissionReceipt, receipt_id)
+    if receipt is not None and receipt.status == GRADING and receipt.claim_id == claim_id:
+        receipt.status = FAILED
+        receipt.error = str(error)[:500]
+        receipt.graded_ts = datetime.datetime.utcnow()
+        db.session.commit()
+
+
+class GradingQueue:
+    """
+    The receipts waiting to be graded in the process and the worker threads, started on the first receipt.
+    """
+
+    def __init__(self, workers=GRADING_WORKERS, batch_size=GRADING_BATCH_SIZE, window=GRADING_BATCH_WINDOW):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.window = window
+        self.pending = queue.SimpleQueue()
+        self.waiting = dict()
+        self.lock = threading.Lock()
+        self.threads = list()
+        self.recovered_at = time.monotonic()
+        self.batches = 0
+        self.graded = 0
+
+    def put(self, receipt_id, created_ts=None):
+        """
+        Queue a committed receipt for grading.
+
+        Args:
+            receipt_id (str): The ID of the receipt.
+            created_ts (datetime): When the receipt was stored, for a receipt queued again, now by default.
+        """
+        self._start()
+        queued_at = time.monotonic()
+        if created_ts is not None:
+            queued_at -= max(0.0, (datetime.datetime.utcnow() - created_ts).total_seconds())
+        with self.lock:
+            self.waiting.setdefault(receipt_id, queued_at)
+        self.pending.put(receipt_id)
+
+    def recover(self):
+        """
+        Queue again, in the order they were received, the receipts of stopped processes: those left
+        queued for GRADING_RECOVERY_AGE seconds and those claimed GRADING_CLAIM_TIMEOUT seconds ago,
+        whose claims are released. Receipts already waiting in this process are left alone; a receipt
+        queued in two processes is graded by the one claiming it. The workers are started while
+        receipts are queued, for their idle recoveries to find the receipts too recent to be queued
+        again yet.
+
+        Returns:
+            int: The number of receipts queued.
+        """
+        now = datetime.datetime.utcnow()
+        table = SubmissionReceipt.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.status == GRADING,
+                   table.c.updated_ts < now - datetime.timedelta(seconds=GRADING_CLAIM_TIMEOUT))
+            .values(status=QUEUED, claim_id=None, updated_ts=now)
+        )
+        db.session.commit()
+        receipts = db.session.execute(
+            select(SubmissionReceipt.id, SubmissionReceipt.created_ts).where(SubmissionReceipt.status == QUEUED)
+            .order_by(SubmissionReceipt.created_ts, SubmissionReceipt.id)
+        ).all()
+        recovered = [(receipt_id, created_ts) for receipt_id, created_ts in receipts
+                     if created_ts < now - datetime.timedelta(seconds=GRADING_RECOVERY_AGE)]
+        with self.lock:
+            recovered = [receipt for receipt in recovered if receipt[0] not in self.waiting]
+        for receipt_id, created_ts in recovered:
+            self.put(receipt_id, created_ts)
+        if receipts:
+            self._start()
+        return len(recovered)
+
+    def depth(self):
+        """
+        Returns:
+            tuple: The number of receipts waiting and the seconds the oldest of them has waited.
+        """
+        with self.lock:
+            if not self.waiting:
+                return 0, 0.0
+            return len(self.waiting), time.monotonic() - min(self.waiting.values())
+
+    def _start(self):
+        if len(self.threads) == self.workers and all(thread.is_alive() for thread in self.threads):
+            return
+        with self.lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._run, name=f'grading-{len(self.threads)}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _collect(self):
+        """
+        Returns:
+            list: The ids of the next batch, empty when none arrived for GRADING_RECOVERY_INTERVAL seconds.
+        """
+        try:
+            batch = [self.pending.get(timeout=GRADING_RECOVERY_INTERVAL)]
+        except queue.Empty:
+            return list()
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with application.app_context():
+            while True:
+                batch = self._collect()
+                if not batch:
+                    self._recover_idle()
+                    continue
+                try:
+                    claim_id = claim_receipts(batch)
+                except Exception:
+                    db.session.rollback()
+                    db.session.remove()
+                    application.logger.exception('claim of a grading batch failed')
+                    self._done(batch, list())  # left queued, queued again by a recovery
+                    continue
+                try:
+                    outcomes = grade_receipts(batch, claim_id)
+                except Exception:
+                    db.session.rollback()
+                    outcomes = [self._grade_alone(receipt_id, claim_id) for receipt_id in batch]
+                finally:
+                    db.session.remove()
+                self._done(batch, outcomes)
+
+    def _recover_idle(self):
+        with self.lock:
+            if time.monotonic() - self.recovered_at < GRADING_RECOVERY_INTERVAL:
+                return
+            self.recovered_at = time.monotonic()
+        try:
+            self.recover()
+        except Exception:
+            db.session.rollback()
+            application.logger.exception('recovery of the queued receipts failed')
+        finally:
+            db.session.remove()
+
+    def _grade_alone(self, receipt_id, claim_id):
+        try:
+            statuses = grade_receipts([receipt_id], claim_id)
+            return statuses[0] if statuses else None
+        except Exception as e:
+            db.session.rollback()
+            application.logger.exception(f'grading of receipt {receipt_id} failed')
+            try:
+                fail_receipt(receipt_id, claim_id, e)
+            except Exception:
+                db.session.rollback()
+                return None  # left claimed, queued again once the claim is stale
+            return FAILED
+
+    def _done(self, batch, outcomes):
+        now = time.monotonic()
+        with self.lock:
+            queued_at = [self.waiting.pop(receipt_id, now) for receipt_id in batch]
+        for started in queued_at:
+            grading_lag.observe((), now - started)
+        for status in outcomes:
+            if status is not None:
+                graded_submissions.inc((status,))
+        self.batches += 1
+        self.graded += len(batch)
+
+
+grading_queue = GradingQueue()
+
+
+@metrics.registry.on_collect
+def grading_queue_depth():
+    depth, waited = grading_queue.depth()
+    queue_depth.set((), depth)
+    oldest_wait.set((), waited)
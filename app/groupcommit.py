@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app import application
+from app.models import db
+
+"""
+[Group Commit Module] Coalesces small writes of concurrent requests into shared transactions.
+                        A request submits its statements and waits; one writer thread collects
+                        whatever arrives within GROUP_COMMIT_WINDOW seconds (or GROUP_COMMIT_MAX_BATCH
+                        writes), runs every distinct statement once with the parameter sets of all
+                        the writes (executemany) and commits once. The waiting requests return only
+                        after that commit, so a login is as durable as with its own commit. If a
+                        shared transaction fails, its writes are retried one transaction each so
+                        that a single bad write only fails its own request.
+"""
+
+GROUP_COMMIT_WINDOW = application.config.get('GROUP_COMMIT_WINDOW', 0.005)
+GROUP_COMMIT_MAX_BATCH = application.config.get('GROUP_COMMIT_MAX_BATCH', 500)
+GROUP_COMMIT_TIMEOUT = application.config.get('GROUP_COMMIT_TIMEOUT', 30)
+
+
+class GroupCommitter:
+    """
+    One writer thread, started on the first submit, committing the writes of many requests at once.
+    """
+
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_batch=GROUP_COMMIT_MAX_BATCH):
+        self.window = window
+        self.max_batch = max_batch
+        self.pending = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, *operations):
+        """
+        Queue the operations of one request, which are committed together.
+
+        Args:
+            *operations (tuple): (statement, parameters dictionary) pairs.
+
+        Returns:
+            Future: Resolved to None after the commit, or to the exception of the failed write.
+        """
+        self._start()
+        future = Future()
+        self.pending.put((operations, future))
+        return future
+
+    def write(self, *operations, timeout=GROUP_COMMIT_TIMEOUT):
+        """
+        Queue the operations of one request and wait until they are committed.
+        """
+        self.submit(*operations).result(timeout)
+
+    def _start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self.thread.start()
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with application.app_context():
+            while True:
+                batch = self._collect()
+                try:
+                    self._commit([operations for operations, future in batch])
+                except Exception:
+                    for operations, future in batch:
+                        try:
+                            self._commit([operations])
+                        except Exception as e:
+                            future.set_exception(e)
+                        else:
+                            future.set_result(None)
+                else:
+                    for operations, future in batch:
+                        future.set_result(None)
+                self.batches += 1
+                self.writes += len(batch)
+
+    def _commit(self, writes):
+        """
+        Run the writes in one transaction, each distinct statement once with all its parameter sets,
+        in the order the statements were first submitted.
+        """
+        grouped = dict()
+        for operations in writes:
+            for statement, params in operations:
+                grouped.setdefault(statement, list()).append(params)
+        with db.engine.begin() as connection:
+            for statement, params in grouped.items():
+                connection.execute(statement, params)
+
+
+group_committer = GroupCommitter()
@@ -0,0 +1,207 @@
+from sqlalchemy import exists, insert, select
+from sqlalchemy.exc import IntegrityError
+
+from app.bulk import DEFAULT_CHUNK_SIZE, BulkReport, chunked
+from app.cache import invalidate_assignments
+from app.keys import new_id
+from app.leaderboard import leaderboard
+from app.models import GroupMember, GroupQuiz, QuizInstance, UserGroup, UserMaster, db
+from app.pagination import paginate, split_page
+
+"""
+[Groups Module] User groups (cohorts) as the target of quiz assignment. Assigning a quiz to a group writes
+                    one group_quiz row whatever the size of the group; membership is resolved lazily with
+                    indexed lookups: the access check of a quiz and the list of assigned quizzes probe
+                    group_member by user, and the quiz_instance of a member is only written when the member
+                    first submits the quiz. Members are added in chunks with IN validation, like the users
+                    of a bulk assignment.
+"""
+
+INSERT_MEMBERS = insert(GroupMember.__table__)
+INSERT_GROUP_QUIZZES = insert(GroupQuiz.__table__)
+
+
+def group_assignment(quiz_id, user_id):
+    """
+    The EXISTS clause telling whether a quiz is assigned to one of the groups of a user, served by
+    ix_group_quiz_quiz and unique_group_user.
+    """
+    return exists().where(
+        GroupQuiz.quiz_id == quiz_id,
+        GroupMember.group_id == GroupQuiz.group_id,
+        GroupMember.user_id == user_id,
+    )
+
+
+def create_group(group_name):
+    """
+    Create an empty group.
+
+    Returns:
+        str: The ID of the group.
+    """
+    group = UserGroup(id=new_id(), group_name=group_name)
+    db.session.add(group)
+    db.session.commit()
+    return group.id
+
+
+def add_members(group_id, user_ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Add users to a group in chunks: one IN query finds the users which exist, one the members already
+    in the group, and the new members are written with one executemany insert. Each chunk is committed.
+    The new members join the pending users of the leaderboards of the group's quizzes.
+
+    Returns:
+        BulkReport: The counters and per-row errors, rows numbered from 1. Unknown users fail, members skip.
+        None: If the group does not exist.
+
+    Raises:
+        ValueError: If the chunk size is invalid.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    if db.session.get(UserGroup, group_id) is None:
+        return None
+    quiz_ids = list(db.session.execute(select(GroupQuiz.quiz_id).where(GroupQuiz.group_id == group_id)).scalars())
+    report = BulkReport()
+    seen = set()
+    for chunk in chunked(enumerate(user_ids, start=1), chunk_size):
+        report.total += len(chunk)
+        chunk_ids = [user_id for number, user_id in chunk]
+        known = set(db.session.execute(select(UserMaster.id).where(UserMaster.id.in_(chunk_ids))).scalars())
+        members = set(db.session.execute(
+            select(GroupMember.user_id).where(GroupMember.group_id == group_id, GroupMember.user_id.in_(chunk_ids))
+        ).scalars())
+        new_user_ids = list()
+        for number, user_id in chunk:
+            if user_id not in known:
+                report.add_error(number, f'user {user_id} does not exist')
+            elif user_id in members or user_id in seen:
+                report.skipped += 1
+            else:
+                seen.add(user_id)
+                new_user_ids.append(user_id)
+        if new_user_ids:
+            db.session.execute(INSERT_MEMBERS, [{'id': new_id(), 'group_id': group_id, 'user_id': user_id,
+                                                 'is_active': 1} for user_id in new_user_ids])
+        db.session.commit()
+        invalidate_assignments(new_user_ids)
+        report.inserted += len(new_user_ids)
+        for quiz_id in quiz_ids:
+            leaderboard.assign(quiz_id, new_user_ids)
+    report.finish()
+    return report
+
+
+def list_members(group_id, cursor=None, limit=None):
+    """
+    One page of the members of a group in (created_ts, id) order of their membership.
+
+    Returns:
+        dict: 'response' with the members and 'next_cursor', None on the last page.
+    """
+    statement = (
+        select(GroupMember, UserMaster.name, UserMaster.username)
+        .join(UserMaster, UserMaster.id == GroupMember.user_id)
+        .where(GroupMember.group_id == group_id)
+    )
+    rows, next_cursor = split_page(db.session.execute(paginate(statement, GroupMember, cursor, limit)).all(), limit,
+                                   key=lambda row: row[0])
+    members = [
+        {
+            'user_id': member.user_id,
+            'name': name,
+            'username': username,
+            'added_at': member.created_ts,
+        }
+        for member, name, username in rows
+    ]
+    return {'response': members, 'next_cursor': next_cursor}
+
+
+def list_groups(cursor=None, limit=None):
+    """
+    One page of the groups in (created_ts, id) order.
+
+    Returns:
+        dict: 'response' with the groups and 'next_cursor', None on the last page.
+    """
+    groups, next_cursor = split_page(db.session.execute(paginate(select(UserGroup), UserGroup, cursor, limit))
+                                     .scalars().all(), limit)
+    group_list = [
+        {
+            'id': group.id,
+            'group_name': group.group_name,
+            'created_at': group.created_ts,
+        }
+        for group in groups
+    ]
+    return {'response': group_list, 'next_cursor': next_cursor}
+
+
+def assign_groups(db_session, groups, report, number):
+    """
+    Assign quizzes to groups, one group_quiz row per pair, within the caller's transaction. Unknown
+    groups are reported, pairs already assigned skipped.
+
+    Args:
+        db_session (Session): The session of the assignment.
+        groups (dict): The group ids to assign, keyed by quiz id.
+        report (BulkReport): The report of the assignment.
+        number (int): The number of the rows already accounted in the report.
+
+    Returns:
+        list: The (quiz id, group id) pairs newly assigned.
+    """
+    group_ids = {group_id for ids in groups.values() for group_id in ids}
+    known = set(db_session.execute(select(UserGroup.id).where(UserGroup.id.in_(group_ids))).scalars()) \
+        if group_ids else set()
+    assigned = set(db_session.execute(
+        select(GroupQuiz.quiz_id, GroupQuiz.group_id)
+        .where(GroupQuiz.quiz_id.in_(list(groups)), GroupQuiz.group_id.in_(group_ids))
+    ).tuples()) if group_ids else set()
+    pairs = list()
+    for quiz_id, ids in groups.items():
+        for group_id in ids:
+            number += 1
+            report.total += 1
+            if group_id not in known:
+                report.add_error(number, f'group {group_id} does not exist')
+            elif (quiz_id, group_id) in assigned:
+                report.skipped += 1
+            else:
+                assigned.add((quiz_id, group_id))
+                pairs.append((quiz_id, group_id))
+    if pairs:
+        db_session.execute(INSERT_GROUP_QUIZZES, [{'id': new_id(), 'quiz_id': quiz_id, 'group_id': group_id,
+                                                   'is_active': 1} for quiz_id, group_id in pairs])
+    report.inserted += len(pairs)
+    return pairs
+
+
+def instance_from_group(quiz_id, user_id, db_session=None):
+    """
+    Write the quiz_instance of a member who submits a quiz assigned to one of their groups.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        user_id (str): The ID of the user.
+        db_session (Session): The session to work in, db.session by default.
+
+    Returns:
+        QuizInstance: The assignment of the user, None if the quiz is not assigned to any of their groups.
+    """
+    db_session = db_session or db.session
+    if not db_session.execute(select(group_assignment(quiz_id, user_id))).scalar():
+        return None
+    quiz_instance = QuizInstance(id=new_id(), quiz_id=quiz_id, user_id=user_id)
+    db_session.add(quiz_instance)
+    try:
+        db_session.flush()
+    except IntegrityError:  # a concurrent submission of the same user wrote it first
+        db_session.rollback()
+        return db_session.execute(
+            select(QuizInstance).where(QuizInstance.quiz_id == quiz_id, QuizInstance.user_id == user_id)
+        ).scalars().first()
+    return quiz_instance
@@ -0,0 +1,169 @@
+import csv
+import hashlib
+
+from sqlalchemy import select
+
+from app.bulk import DEFAULT_CHUNK_SIZE, BulkReport, chunked, insert_statement, supports_upsert, upsert_statement
+from app.cache import invalidate_quizzes_of_questions
+from app.keys import new_id
+from app.models import QuestionMaster, db
+from app.search import INDEXED_COLUMNS, question_search
+
+"""
+[Importer Module] Streaming import engine for the question bank. The csv source is read
+                    in fixed-size chunks, each chunk is written with a single multi-row
+                    statement and committed on its own, so memory stays flat however
+                    large the file is. Rows are keyed on a hash of their content which
+                    makes re-running an import idempotent. The written questions are
+                    added to the search index after each commit.
+"""
+
+CHOICES = ('choice1', 'choice2', 'choice3', 'choice4')
+UPDATABLE_COLUMNS = ('answer', 'marks', 'remarks')
+IMPORT_MODES = ('update', 'skip')
+MAX_TEXT_LENGTH = 200
+
+
+def question_hash(question, choice1, choice2, choice3, choice4):
+    """
+    Compute the content hash identifying a question.
+
+    Args:
+        question (str): The question text.
+        choice1 .. choice4 (str): The four choices of the question.
+
+    Returns:
+        str: The hex encoded sha256 of the whitespace normalised question and choices.
+    """
+    parts = (question, choice1, choice2, choice3, choice4)
+    normalised = '\x1f'.join(' '.join(str(part).split()).lower() for part in parts)
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def _parse_row(row):
+    """
+    Validate one csv row and turn it into a question_master row.
+
+    Args:
+        row (dict): The csv row with case-insensitive headers.
+
+    Returns:
+        dict: The column values of the question, including its id and content hash.
+
+    Raises:
+        ValueError: If a required value is missing or malformed.
+    """
+    row = {str(key).strip().lower(): (value or '').strip() for key, value in row.items() if key}
+    values = dict()
+    for column in ('question',) + CHOICES:
+        if not row.get(column):
+            raise ValueError(f'{column} is required')
+        if len(row[column]) > MAX_TEXT_LENGTH:
+            raise ValueError(f'{column} is longer than {MAX_TEXT_LENGTH} characters')
+        values[column] = row[column]
+    try:
+        values['answer'] = int(row.get('answer'))
+        values['marks'] = int(row.get('marks'))
+    except (TypeError, ValueError):
+        raise ValueError('answer and marks must be integers')
+    if values['answer'] not in range(1, len(CHOICES) + 1):
+        raise ValueError(f'answer must be between 1 and {len(CHOICES)}')
+    values['remarks'] = row.get('remarks', '')[:MAX_TEXT_LENGTH]
+    values['content_hash'] = question_hash(values['question'], *(values[choice] for choice in CHOICES))
+    values['id'] = new_id()
+    values['is_active'] = 1
+    return values
+
+
+def _write_chunk(rows, mode, report):
+    """
+    Write one chunk of parsed rows and commit it.
+
+    Args:
+        rows (list): The parsed rows of the chunk, already de-duplicated on content hash.
+        mode (str): 'update' to overwrite answer/marks/remarks of existing questions, 'skip' to leave them.
+        report (BulkReport): The report to account the chunk in.
+    """
+    table = QuestionMaster.__table__
+    existing = set(db.session.execute(
+        select(table.c.content_hash).where(table.c.content_hash.in_([row['content_hash'] for row in rows]))
+    ).scalars())
+    new_rows = [row for row in rows if row['content_hash'] not in existing]
+    if mode == 'update' and existing and supports_upsert():
+        db.session.execute(upsert_statement(table, rows, ['content_hash'], UPDATABLE_COLUMNS))
+    else:
+        if new_rows:
+            db.session.execute(insert_statement(table, new_rows))
+        if mode == 'update' and existing:
+            for row in rows:
+                if row['content_hash'] in existing:
+                    db.session.execute(
+                        table.update()
+                        .where(table.c.content_hash == row['content_hash'])
+                        .values({column: row[column] for column in UPDATABLE_COLUMNS})
+                    )
+    db.session.commit()
+    question_search.add(new_rows)
+    if mode == 'update' and existing:
+        question_search.add([row._mapping for row in db.session.execute(
+            select(*INDEXED_COLUMNS).where(table.c.content_hash.in_(list(existing)))
+        )])
+    report.inserted += len(new_rows)
+    if mode == 'update':
+        invalidate_quizzes_of_questions(list(existing))
+        report.updated += len(rows) - len(new_rows)
+    else:
+        report.skipped += len(rows) - len(new_rows)
+
+
+def import_questions(source, chunk_size=DEFAULT_CHUNK_SIZE, mode='update'):
+    """
+    Stream questions from a csv source into question_master.
+
+    Args:
+        source (str or file): A path to a csv file or an open text file object. The csv
+            needs the Question, Choice1..Choice4, Answer and Marks columns, Remarks is optional.
+        chunk_size (int): The number of rows written and committed per statement.
+        mode (str): 'update' upserts questions already present, 'skip' leaves them untouched.
+
+    Returns:
+        BulkReport: The counters, per-row errors and rows/sec of the run.
+
+    Raises:
+        ValueError: If the mode or chunk size is invalid.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f'mode must be one of {", ".join(IMPORT_MODES)}')
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    if isinstance(source, str):
+        with open(source, newline='', encoding='utf-8-sig') as csvfile:
+            return import_questions(csvfile, chunk_size, mode)
+
+    report = BulkReport()
+    numbered_rows = enumerate(csv.DictReader(source), start=2)  # line 1 is the header
+    for chunk in chunked(numbered_rows, chunk_size):
+        parsed = dict()
+        line_numbers = list()
+        for line_number, row in chunk:
+            report.total += 1
+            try:
+                values = _parse_row(row)
+            except ValueError as e:
+                report.add_error(line_number, e)
+                continue
+            if values['content_hash'] in parsed:
+                report.skipped += 1
+            else:
+                line_numbers.append(line_number)
+            parsed[values['content_hash']] = values
+        if not parsed:
+            continue
+        try:
+            _write_chunk(list(parsed.values()), mode, report)
+        except Exception as e:
+            db.session.rollback()
+            for line_number in line_numbers:
+                report.add_error(line_number, e)
+    report.finish()
+    return report
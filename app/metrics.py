@@ -0,0 +1,295 @@
+import bisect
+import contextvars
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from flask import request
+from sqlalchemy import event
+
+"""
+[Metrics Module] Request and database instrumentation, exposed on /metrics in the Prometheus text format.
+                    For every endpoint it records the request latency, the status codes and the number
+                    and time of the SQL statements the request executed (from the engine events, so the
+                    session validation and the services are counted alike); statements outside of a
+                    request, such as the group commits, are recorded under the endpoint "background".
+                    For every engine it records how long a checkout waited for a pooled connection, and
+                    the pool occupancy at scrape time.
+                    The metrics are process local; with several worker processes every one is scraped.
+"""
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+BACKGROUND = 'background'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    A metric family with a fixed set of label names, thread safe.
+    """
+
+    kind = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self):
+        """
+        Returns:
+            list: The (sample name, rendered labels, value) triples of the family.
+        """
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labelnames, labels), value) for labels, value in items]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labels=(), value=0):
+        with self._lock:
+            counts, total = self._values.get(labels) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[labels] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        samples = list()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                samples.append((f'{self.name}_bucket', _labels(self.labelnames, labels, [('le', le)]), cumulative))
+            samples.append((f'{self.name}_sum', _labels(self.labelnames, labels), float(total)))
+            samples.append((f'{self.name}_count', _labels(self.labelnames, labels), cumulative))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of the process, rendered in registration order. Collectors are called before every
+    render to refresh the gauges which are read rather than recorded.
+    """
+
+    def __init__(self):
+        self.metrics = list()
+        self.collectors = list()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labelnames=()):
+        return self.register(Counter(name, description, labelnames))
+
+    def gauge(self, name, description, labelnames=()):
+        return self.register(Gauge(name, description, labelnames))
+
+    def histogram(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, description, labelnames, buckets))
+
+    def on_collect(self, collector):
+        self.collectors.append(collector)
+        return collector
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        lines = list()
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter('quiz_http_requests_total', 'Requests by endpoint, method and status code.',
+                                 ('endpoint', 'method', 'status'))
+http_latency = registry.histogram('quiz_http_request_duration_seconds', 'Request latency by endpoint.',
+                                  ('endpoint',))
+sql_per_request = registry.histogram('quiz_sql_statements_per_request', 'SQL statements executed per request.',
+                                     ('endpoint',), STATEMENT_BUCKETS)
+sql_statements = registry.counter('quiz_sql_statements_total', 'SQL statements executed by endpoint.',
+                                  ('endpoint',))
+sql_seconds = registry.counter('quiz_sql_duration_seconds_total', 'Time spent executing SQL statements by endpoint.',
+                               ('endpoint',))
+pool_wait = registry.histogram('quiz_db_pool_checkout_wait_seconds', 'Time a checkout waited for a pooled connection.',
+                               ('engine',), POOL_WAIT_BUCKETS)
+pool_checked_out = registry.gauge('quiz_db_pool_checked_out', 'Connections checked out of the pool.', ('engine',))
+pool_overflow = registry.gauge('quiz_db_pool_overflow', 'Connections open beyond the pool size.', ('engine',))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class RequestStats:
+    """
+    The SQL statements of the current request; one per request, carried in a context variable so
+    that threads and asyncio tasks each see their own.
+    """
+
+    __slots__ = ('endpoint', 'started', 'statements', 'sql_seconds')
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def begin(endpoint):
+    """
+    Start recording a request.
+
+    Returns:
+        Token: The token to pass to `finish`.
+    """
+    return _current.set(RequestStats(endpoint))
+
+
+def finish(token, method, status):
+    """
+    Record the latency, the status code and the SQL statements of the request started by `begin`.
+    """
+    stats = _current.get()
+    _current.reset(token)
+    if stats is None:
+        return
+    http_requests.inc((stats.endpoint, method, str(status)))
+    http_latency.observe((stats.endpoint,), time.perf_counter() - stats.started)
+    sql_per_request.observe((stats.endpoint,), stats.statements)
+    if stats.statements:
+        sql_statements.inc((stats.endpoint,), stats.statements)
+        sql_seconds.inc((stats.endpoint,), stats.sql_seconds)
+
+
+def instrument_engine(engine, name='default'):
+    """
+    Count the statements of an engine (the sync_engine of an async one) and time its pool checkouts.
+
+    Args:
+        engine (Engine): The engine.
+        name (str): The value of the engine label.
+    """
+    @event.listens_for(engine, 'before_cursor_execute')
+    def statement_started(connection, cursor, statement, parameters, context, executemany):
+        connection.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def statement_finished(connection, cursor, statement, parameters, context, executemany):
+        started = connection.info.get('metrics_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        stats = _current.get()
+        if stats is None:
+            sql_statements.inc((BACKGROUND,))
+            sql_seconds.inc((BACKGROUND,), elapsed)
+        else:
+            stats.statements += 1
+            stats.sql_seconds += elapsed
+
+    @event.listens_for(engine, 'handle_error')
+    def statement_failed(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_started'):
+            connection.info['metrics_started'].pop()
+
+    def timed(connect):
+        # the pool has no event before a checkout starts waiting, so the checkout itself is timed
+        def connect_timed():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                pool_wait.observe((name,), time.perf_counter() - started)
+        return connect_timed
+
+    engine.pool.connect = timed(engine.pool.connect)
+
+    @registry.on_collect
+    def pool_occupancy():
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):
+            pool_checked_out.set((name,), pool.checkedout())
+        if hasattr(pool, 'overflow'):
+            pool_overflow.set((name,), max(0, pool.overflow()))
+
+
+def install(application):
+    """
+    Record every request of a Flask application. The hooks are registered first so that the
+    request time includes the other before_request functions, such as the session validation.
+    """
+    @application.before_request
+    def metrics_begin():
+        rule = request.url_rule
+        request.environ['quiz.metrics'] = begin(rule.rule if rule is not None else 'unmatched')
+
+    @application.after_request
+    def metrics_finish(response):
+        token = request.environ.pop('quiz.metrics', None)
+        if token is not None:
+            finish(token, request.method, response.status_code)
+        return response
+
+    @application.teardown_request
+    def metrics_discard(exception=None):
+        token = request.environ.pop('quiz.metrics', None)
+        if token is not None:
+            finish(token, request.method, 500)
@@ -0,0 +1,220 @@
+import click
+from sqlalchemy import MetaData, and_, bindparam, create_engine, delete, insert, inspect, or_, select, update
+from sqlalchemy.schema import CreateColumn
+
+from app import application
+from app import quizstats
+from app.importer import question_hash
+from app.models import QuestionMaster, Timestamp, db
+
+"""
+[Migrations Module] Incremental schema migrations. Every migration has a version and runs once,
+                    in its own transaction; applied versions are recorded in schema_migrations
+                    so that restarting the application keeps the data and only applies what is new.
+                    New tables, columns and indexes are added by appending a migration below.
+"""
+
+HASH_CHUNK_SIZE = 1000
+
+schema_migrations = db.Table(
+    'schema_migrations',
+    db.Column('version', db.String(32), primary_key=True),
+    db.Column('description', db.String(200), nullable=False),
+    db.Column('applied_ts', Timestamp, server_default=db.func.now(), nullable=False),
+)
+
+
+def create_tables(connection, *names):
+    """
+    Create the given model tables, with the indexes they declare, unless they exist.
+    """
+    db.metadata.create_all(connection, tables=[db.metadata.tables[name] for name in names], checkfirst=True)
+
+
+def create_indexes(connection, *names):
+    """
+    Create the given declared indexes unless they exist.
+    """
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+def add_columns(connection, table_name, *names):
+    """
+    Add the given declared columns to a table which exists without them.
+    """
+    table = db.metadata.tables[table_name]
+    existing = {column['name'] for column in inspect(connection).get_columns(table_name)}
+    for name in names:
+        if name not in existing:
+            column = CreateColumn(table.c[name]).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column}')
+
+
+def _baseline(connection):
+    create_tables(connection, 'user_master', 'user_session', 'question_master', 'quiz_master',
+                  'quiz_questions', 'quiz_instance', 'user_responses')
+
+
+def _secondary_indexes(connection):
+    create_indexes(connection, 'ix_user_session_session', 'ix_question_master_created', 'ix_quiz_master_created',
+                   'ix_quiz_questions_question', 'ix_quiz_instance_user', 'ix_quiz_instance_created',
+                   'ix_user_responses_quiz_user')
+
+
+def _groups(connection):
+    create_tables(connection, 'user_group', 'group_member', 'group_quiz')
+
+
+def _submission_receipts(connection):
+    create_tables(connection, 'submission_receipt')
+
+
+def _quiz_stats(connection):
+    create_tables(connection, 'quiz_score_count')
+    quizstats.rebuild(connection)
+
+
+def _receipt_claims(connection):
+    add_columns(connection, 'submission_receipt', 'claim_id')
+
+
+def _question_versions(connection):
+    create_indexes(connection, 'ix_question_master_updated')
+
+
+def _leaderboard_changes(connection):
+    create_indexes(connection, 'ix_quiz_instance_quiz_updated')
+
+
+def _question_hashes(connection):
+    """
+    Add content_hash to a question_master created by the baseline, backfill it in chunks, oldest
+    question first, and make it unique. A later duplicate of a question keeps a NULL hash, the
+    imports then match the oldest copy.
+    """
+    add_columns(connection, 'question_master', 'content_hash')
+    table = QuestionMaster.__table__
+    seen = set(connection.execute(select(table.c.content_hash).where(table.c.content_hash.isnot(None))).scalars())
+    after = None
+    while True:
+        statement = (
+            select(table.c.id, table.c.created_ts, table.c.question, table.c.choice1, table.c.choice2,
+                   table.c.choice3, table.c.choice4)
+            .where(table.c.content_hash.is_(None))
+            .order_by(table.c.created_ts, table.c.id).limit(HASH_CHUNK_SIZE)
+        )
+        if after is not None:
+            statement = statement.where(or_(table.c.created_ts > after[0],
+                                            and_(table.c.created_ts == after[0], table.c.id > after[1])))
+        chunk = connection.execute(statement).all()
+        if not chunk:
+            break
+        after = chunk[-1][:2]
+        hashes = list()
+        for question_id, created_ts, *content in chunk:
+            content_hash = question_hash(*content)
+            if content_hash not in seen:
+                seen.add(content_hash)
+                hashes.append({'b_id': question_id, 'b_content_hash': content_hash})
+        if hashes:
+            connection.execute(
+                update(table).where(table.c.id == bindparam('b_id'))
+                .values(content_hash=bindparam('b_content_hash'), updated_ts=table.c.updated_ts),
+                hashes,
+            )
+    inspector = inspect(connection)
+    unique = [constraint['column_names'] for constraint in inspector.get_unique_constraints('question_master')]
+    unique += [index['column_names'] for index in inspector.get_indexes('question_master') if index['unique']]
+    if ['content_hash'] not in unique:
+        db.Index('uq_question_master_content_hash', table.c.content_hash, unique=True).create(connection)
+
+
+"""
+The ordered migrations as (version, description, function applying it on a connection)
+"""
+MIGRATIONS = (
+    ('0001', 'baseline schema', _baseline),
+    ('0002', 'secondary indexes for the hot lookups', _secondary_indexes),
+    ('0003', 'user groups, their members and group quiz assignments', _groups),
+    ('0004', 'receipts of the submissions graded by the grading queue', _submission_receipts),
+    ('0005', 'incremental per-quiz statistics of the submissions', _quiz_stats),
+    ('0006', 'claims of the receipts taken by the grading workers', _receipt_claims),
+    ('0007', 'index of the question changes read by the search refresh', _question_versions),
+    ('0008', 'content hash of the questions of a baseline question bank', _question_hashes),
+    ('0009', 'index of the assignment changes read by the leaderboard refresh', _leaderboard_changes),
+)
+
+
+def applied_versions():
+    """
+    Returns:
+        set: The versions recorded in schema_migrations.
+    """
+    with db.engine.connect() as connection:
+        return set(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def migrate():
+    """
+    Apply the pending migrations in order.
+
+    Returns:
+        list: The versions applied by this call.
+    """
+    schema_migrations.create(db.engine, checkfirst=True)
+    applied = applied_versions()
+    applied_now = list()
+    for version, description, apply in MIGRATIONS:
+        if version in applied:
+            continue
+        with db.engine.begin() as connection:
+            apply(connection)
+            connection.execute(insert(schema_migrations).values(version=version, description=description))
+        applied_now.append(version)
+    return applied_now
+
+
+@application.cli.command('migrate')
+def migrate_command():
+    """
+    Apply the pending schema migrations and list every migration with its state.
+    """
+    applied_now = migrate()
+    for version, description, apply in MIGRATIONS:
+        state = 'applied now' if version in applied_now else 'applied'
+        click.echo(f'{version} {description}: {state}')
+
+
+@application.cli.command('convert-keys')
+@click.option('--source', required=True, help='Database url of the deployment whose keys are stored as text.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows copied per transaction.')
+@click.confirmation_option(prompt='Every row of the target database tables will be replaced, continue?')
+def convert_keys_command(source, chunk_size):
+    """
+    Copy every table from a text key database into the configured database, converting the keys to the
+    representation of the running QUIZ_KEY_MODE (run with QUIZ_KEY_MODE=binary against a new database).
+    """
+    source_engine = create_engine(source)
+    source_metadata = MetaData()
+    source_metadata.reflect(source_engine)
+    tables = [table for table in db.metadata.sorted_tables
+              if table is not schema_migrations and table.name in source_metadata.tables]
+    with db.engine.begin() as target:
+        for table in reversed(tables):
+            target.execute(delete(table))
+    for table in tables:
+        source_table = source_metadata.tables[table.name]
+        columns = [column.name for column in table.columns if column.name in source_table.c]
+        copied = 0
+        with source_engine.connect() as source_connection:
+            rows = source_connection.execution_options(yield_per=chunk_size).execute(
+                select(*(source_table.c[column] for column in columns))
+            )
+            for partition in rows.partitions():
+                with db.engine.begin() as target:
+                    target.execute(insert(table), [dict(zip(columns, row)) for row in partition])
+                copied += len(partition)
+        click.echo(f'{table.name}: {copied} rows')
+    click.echo('keys converted, restart the application to rebuild its in-process state')
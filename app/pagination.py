@@ -0,0 +1,94 @@
+import base64
+import datetime
+import json
+
+from sqlalchemy import and_, or_
+
+"""
+[Pagination Module] Keyset pagination over (created_ts, id). A page is fetched with a range
+                    condition on the last seen key instead of an OFFSET, so every page costs
+                    the same however deep the client has paged. The key is handed out as an
+                    opaque cursor.
+"""
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(created_ts, id):
+    """
+    Encode the key of the last row of a page into an opaque cursor.
+
+    Args:
+        created_ts (datetime): The creation timestamp of the row.
+        id (str): The ID of the row.
+
+    Returns:
+        str: The url safe cursor.
+    """
+    key = json.dumps([created_ts.strftime('%Y-%m-%d %H:%M:%S'), id])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by `encode_cursor`.
+
+    Args:
+        cursor (str): The cursor.
+
+    Returns:
+        tuple: The creation timestamp and the ID of the last row of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        created_ts, id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return datetime.datetime.strptime(created_ts, '%Y-%m-%d %H:%M:%S'), str(id)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def paginate(statement, model, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Restrict a select to one page in (created_ts, id) order.
+
+    Args:
+        statement (Select): The select with its filters already applied.
+        model (BaseModel): The model whose created_ts and id define the order.
+        cursor (str): The cursor returned with the previous page, None for the first page.
+        limit (int): The page size, capped at MAX_PAGE_SIZE.
+
+    Returns:
+        Select: The select of the page. It fetches one extra row which tells `split_page`
+        whether a next page exists.
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    if cursor:
+        created_ts, id = decode_cursor(cursor)
+        statement = statement.where(or_(
+            model.created_ts > created_ts,
+            and_(model.created_ts == created_ts, model.id > id),
+        ))
+    return statement.order_by(model.created_ts, model.id).limit(limit + 1)
+
+
+def split_page(rows, limit=DEFAULT_PAGE_SIZE, key=lambda row: row):
+    """
+    Cut the extra row fetched by `paginate` and compute the cursor of the next page.
+
+    Args:
+        rows (list): The rows returned by the paginated select.
+        limit (int): The page size given to `paginate`.
+        key (callable): Returns the model instance holding created_ts and id for a row.
+
+    Returns:
+        tuple: The rows of the page and the cursor of the next page, None on the last page.
+    """
+    limit = max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = key(rows[-1])
+    return rows, encode_cursor(last.created_ts, last.id)
@@ -0,0 +1,163 @@
+import asyncio
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from app import application
+
+"""
+[Passwords Module] Password hashing and verification. Passwords are stored as werkzeug salted
+                    hashes; rows written before hashing was introduced still hold the plain text
+                    and are recognised by the missing method prefix, verified with a constant time
+                    comparison and upgraded on the next successful login.
+                    Hashing is deliberately slow, so it runs on a bounded pool of worker threads
+                    (hashlib releases the GIL while hashing): at most PASSWORD_WORKERS hashes run at
+                    once and at most PASSWORD_QUEUE_SIZE more wait, further logins fail fast instead
+                    of tying up every request thread. The hashes of a bulk provisioning run on a
+                    pool of their own, of BULK_HASH_WORKERS threads, so that a cohort of thousands of
+                    users never queues ahead of the logins nor takes more than those threads of CPU.
+"""
+
+HASH_METHOD = application.config.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+HASH_PREFIXES = ('pbkdf2:', 'scrypt:')
+PASSWORD_WORKERS = application.config.get('PASSWORD_WORKERS', os.cpu_count() or 4)
+PASSWORD_QUEUE_SIZE = application.config.get('PASSWORD_QUEUE_SIZE', PASSWORD_WORKERS * 16)
+PASSWORD_WAIT_TIMEOUT = application.config.get('PASSWORD_WAIT_TIMEOUT', 10)
+BULK_HASH_WORKERS = application.config.get('BULK_HASH_WORKERS', max(1, PASSWORD_WORKERS // 4))
+
+
+class PasswordPoolBusy(RuntimeError):
+    """
+    Raised when the verification queue is full.
+    """
+
+
+class PasswordPool:
+    """
+    A thread pool whose queue is bounded, for the CPU heavy hash computations.
+    """
+
+    def __init__(self, workers=PASSWORD_WORKERS, queue_size=PASSWORD_QUEUE_SIZE):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password')
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+
+    def run(self, func, *args, timeout=PASSWORD_WAIT_TIMEOUT):
+        """
+        Run `func(*args)` on a worker and wait for its result.
+
+        Raises:
+            PasswordPoolBusy: If no slot frees up within the timeout.
+        """
+        if not self.slots.acquire(timeout=timeout):
+            raise PasswordPoolBusy('too many logins in progress, try again')
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future.result()
+
+    async def run_async(self, func, *args):
+        """
+        Run `func(*args)` on a worker and await its result without blocking the event loop.
+
+        Raises:
+            PasswordPoolBusy: If the pool and its queue are full.
+        """
+        if not self.slots.acquire(blocking=False):
+            raise PasswordPoolBusy('too many logins in progress, try again')
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return await asyncio.wrap_future(future)
+
+
+password_pool = PasswordPool()
+bulk_hash_executor = ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS, thread_name_prefix='bulk-password')
+
+"""
+Verified against when the username is unknown, so that unknown and known usernames take the same time
+"""
+_DUMMY_HASH = generate_password_hash('dummy password', method=HASH_METHOD)
+
+
+def is_hashed(stored):
+    """
+    Tells whether a stored password is a hash or legacy plain text.
+    """
+    return stored.startswith(HASH_PREFIXES)
+
+
+def hash_password(password, method=None):
+    """
+    Hash a password on the calling thread.
+
+    Returns:
+        str: The salted hash to store in user_master.password.
+    """
+    return generate_password_hash(password, method=method or HASH_METHOD)
+
+
+def _check(stored, password):
+    if stored is None:
+        check_password_hash(_DUMMY_HASH, password)
+        return False
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+
+def _verify(stored, password, method):
+    """
+    Verify the password and compute its replacement hash if the stored value is plain text or uses
+    another method.
+
+    Returns:
+        tuple: (valid, new hash or None).
+    """
+    if not _check(stored, password):
+        return False, None
+    if stored.startswith(method + '$'):
+        return True, None
+    return True, hash_password(password, method)
+
+
+def verify_password(stored, password):
+    """
+    Verify a password against its stored value on the password pool.
+
+    Args:
+        stored (str or None): The stored hash or legacy plain text, None for an unknown user.
+        password (str): The password given at login.
+
+    Returns:
+        tuple: (valid, new hash or None), the new hash has to be stored when it is not None.
+
+    Raises:
+        PasswordPoolBusy: If the pool is saturated.
+    """
+    return password_pool.run(_verify, stored, password, HASH_METHOD)
+
+
+async def verify_password_async(stored, password):
+    """
+    Coroutine version of `verify_password` for the ASGI mode.
+    """
+    return await password_pool.run_async(_verify, stored, password, HASH_METHOD)
+
+
+def hash_passwords(passwords):
+    """
+    Hash many passwords on the bulk hashing threads, apart from the password pool of the logins.
+
+    Returns:
+        list: The hashes, in the order of the passwords.
+    """
+    return list(bulk_hash_executor.map(hash_password, passwords))
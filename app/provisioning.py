@@ -0,0 +1,160 @@
+import csv
+
+from sqlalchemy import exists, select
+
+from app.bulk import DEFAULT_CHUNK_SIZE, BulkReport, chunked, insert_statement
+from app.keys import new_id
+from app.models import UserMaster, db
+from app.passwords import hash_passwords
+
+"""
+[Provisioning Module] Bulk user provisioning. Users come from a generator, a csv file or the
+                        json body of a request, are validated row by row and inserted set-based in
+                        chunks, each chunk with one multi-row statement and its own commit.
+                        Usernames already present are skipped, never overwritten.
+                        Passwords are hashed on the bulk hashing threads, only for the users actually inserted.
+"""
+
+MAX_TEXT_LENGTH = 200
+
+
+def has_users():
+    """
+    Tells whether user_master has at least one row without loading any of them.
+
+    Returns:
+        bool: True if at least one user exists.
+    """
+    return db.session.execute(select(exists().select_from(UserMaster.__table__))).scalar()
+
+
+def seed_users(first=10000, last=11000):
+    """
+    Generate the development users: one admin with the id `first` and plain users up to `last`.
+    The username and password of every user are equal to its name.
+
+    Yields:
+        dict: One user row at a time.
+    """
+    for i in range(first, last + 1):
+        name = 'admin' if i == first else 'user' + str(i)
+        yield {
+            'id': str(i),
+            'name': name,
+            'username': name,
+            'password': name,
+            'is_admin': 1 if i == first else 0,
+        }
+
+
+def users_from_csv(csvfile):
+    """
+    Read users from a csv file with name, username, password and optionally id and is_admin columns.
+
+    Args:
+        csvfile (file): An open text file object.
+
+    Yields:
+        dict: One user row at a time, streamed from the file.
+    """
+    for row in csv.DictReader(csvfile):
+        yield {str(key).strip().lower(): value for key, value in row.items() if key}
+
+
+def _parse_user(row):
+    """
+    Validate one user and turn it into a user_master row.
+
+    Args:
+        row (dict): The user with name, username, password and optionally id and is_admin.
+
+    Returns:
+        dict: The column values of the user.
+
+    Raises:
+        ValueError: If a required value is missing or malformed.
+    """
+    values = dict()
+    for column in ('name', 'username', 'password'):
+        value = str(row.get(column) or '').strip()
+        if not value:
+            raise ValueError(f'{column} is required')
+        if len(value) > MAX_TEXT_LENGTH:
+            raise ValueError(f'{column} is longer than {MAX_TEXT_LENGTH} characters')
+        values[column] = value
+    try:
+        values['is_admin'] = 1 if int(row.get('is_admin') or 0) else 0
+    except (TypeError, ValueError):
+        raise ValueError('is_admin must be 0 or 1')
+    values['id'] = str(row.get('id') or new_id())
+    values['is_active'] = 1
+    return values
+
+
+def _write_chunk(rows, report, hashed):
+    """
+    Insert the users of one chunk whose usernames are not taken yet and commit.
+
+    Args:
+        rows (list): The parsed users of the chunk, already de-duplicated on username.
+        report (BulkReport): The report to account the chunk in.
+        hashed (bool): Whether to store password hashes rather than the plain text.
+    """
+    table = UserMaster.__table__
+    taken = set(db.session.execute(
+        select(table.c.username).where(table.c.username.in_([row['username'] for row in rows]))
+    ).scalars())
+    new_rows = [row for row in rows if row['username'] not in taken]
+    if hashed:
+        for row, password in zip(new_rows, hash_passwords([row['password'] for row in new_rows])):
+            row['password'] = password
+    if new_rows:
+        db.session.execute(insert_statement(table, new_rows))
+    db.session.commit()
+    report.inserted += len(new_rows)
+    report.skipped += len(rows) - len(new_rows)
+
+
+def provision_users(users, chunk_size=DEFAULT_CHUNK_SIZE, hashed=True):
+    """
+    Insert users in chunks, skipping usernames which already exist.
+
+    Args:
+        users (iterable): User rows from a generator, `users_from_csv` or a list of dictionaries.
+        chunk_size (int): The number of users written and committed per statement.
+        hashed (bool): Whether to hash the passwords. Plain text passwords are upgraded on the first login.
+
+    Returns:
+        BulkReport: The counters, per-row errors and rows/sec of the run. Rows are numbered from 1.
+
+    Raises:
+        ValueError: If the chunk size is invalid.
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be positive')
+    report = BulkReport()
+    for chunk in chunked(enumerate(users, start=1), chunk_size):
+        parsed = dict()
+        numbers = list()
+        for number, row in chunk:
+            report.total += 1
+            try:
+                values = _parse_user(row)
+            except (AttributeError, ValueError) as e:
+                report.add_error(number, e)
+                continue
+            if values['username'] in parsed:
+                report.add_error(number, f"username {values['username']} is repeated")
+                continue
+            parsed[values['username']] = values
+            numbers.append(number)
+        if not parsed:
+            continue
+        try:
+            _write_chunk(list(parsed.values()), report, hashed)
+        except Exception as e:
+            db.session.rollback()
+            for number in numbers:
+                report.add_error(number, e)
+    report.finish()
+    return report
@@ -0,0 +1,176 @@
+import math
+from collections import Counter
+
+import click
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from app import application
+from app.bulk import dialect_name, upsert_statement
+from app.keys import new_id
+from app.models import QuizInstance, QuizMaster, QuizScoreCount, db
+
+"""
+[Quiz Stats Module] Per-quiz statistics of the submissions, kept up to date by the gradings instead of
+                        being computed over every quiz_instance on read. quiz_score_count holds the
+                        number of submissions per score of every quiz; the counts, the sum and the sum of
+                        squares of the scores, and so the mean and the variance, as well as the minimum,
+                        the maximum, the histogram and the pass rate, are all derived from these rows. A
+                        grading adds its submissions with one executemany increment upsert in its own
+                        transaction; an assignment is submitted once, so there is no previous score to
+                        take out and nothing to read first. The counts are integers: unlike a running
+                        mean, adding them is exact and does not depend on the order of concurrent
+                        gradings. Reading the statistics of a quiz costs two indexed lookups, the second
+                        one bounded by the number of distinct scores, whatever the number of submissions.
+
+                        usage: flask --app main rebuild-quiz-stats [--quiz-id ID]
+"""
+
+PASS_MARK_RATIO = application.config.get('PASS_MARK_RATIO', 0.4)
+HISTOGRAM_BUCKETS = application.config.get('QUIZ_STATS_HISTOGRAM_BUCKETS', 10)
+
+
+def record(db_session, submissions):
+    """
+    Add graded submissions to the statistics of their quizzes within the caller's transaction.
+
+    Args:
+        db_session (Session): The session or connection of the grading, the caller commits.
+        submissions (iterable): The (quiz id, score) of every assignment submitted.
+    """
+    counts = Counter(submissions)
+    if not counts:
+        return
+    table = QuizScoreCount.__table__
+    rows = [{'id': new_id(), 'quiz_id': quiz_id, 'score': score, 'submissions': count, 'is_active': 1}
+            for (quiz_id, score), count in counts.items()]
+    statement = upsert_statement(table, None, ['quiz_id', 'score'], [], dialect_name(db_session),
+                                 increment_columns=('submissions',))
+    if statement is not None:
+        db_session.execute(statement, rows)
+        return
+    # without a native upsert the missing scores, looked up per quiz, are inserted at zero first
+    stored = set()
+    for quiz_id in {row['quiz_id'] for row in rows}:
+        stored.update(db_session.execute(
+            select(table.c.quiz_id, table.c.score).where(table.c.quiz_id == quiz_id)
+        ).tuples())
+    missing = [dict(row, submissions=0) for row in rows if (row['quiz_id'], row['score']) not in stored]
+    if missing:
+        db_session.execute(insert(table), missing)
+    db_session.execute(
+        update(table)
+        .where(table.c.quiz_id == bindparam('b_quiz_id'), table.c.score == bindparam('b_score'))
+        .values(submissions=table.c.submissions + bindparam('b_submissions')),
+        [{'b_quiz_id': row['quiz_id'], 'b_score': row['score'], 'b_submissions': row['submissions']} for row in rows],
+    )
+
+
+def rebuild(db_session, quiz_id=None):
+    """
+    Recompute the statistics of a quiz, or of every quiz, from quiz_instance with one grouped
+    aggregate, within the caller's transaction.
+
+    Args:
+        db_session (Session): The session or connection of the rebuild, the caller commits.
+        quiz_id (str): The ID of the quiz, None for every quiz.
+
+    Returns:
+        int: The number of quizzes with submissions.
+    """
+    submitted = [QuizInstance.is_submitted == 1]
+    table = QuizScoreCount.__table__
+    if quiz_id is not None:
+        submitted.append(QuizInstance.quiz_id == quiz_id)
+        db_session.execute(delete(table).where(table.c.quiz_id == quiz_id))
+    else:
+        db_session.execute(delete(table))
+    score = func.coalesce(QuizInstance.score_achieved, 0)
+    rows = [
+        {'id': new_id(), 'quiz_id': count_quiz_id, 'score': count_score, 'submissions': count, 'is_active': 1}
+        for count_quiz_id, count_score, count in db_session.execute(
+            select(QuizInstance.quiz_id, score, func.count()).where(*submitted).group_by(QuizInstance.quiz_id, score)
+        )
+    ]
+    if rows:
+        db_session.execute(insert(table), rows)
+    return len({row['quiz_id'] for row in rows})
+
+
+def quiz_id_statement(quiz_id):
+    """
+    The select of the id of a quiz, no row if it does not exist.
+    """
+    return select(QuizMaster.id).where(QuizMaster.id == quiz_id)
+
+
+def score_counts_statement(quiz_id):
+    """
+    The select of the (score, submissions) pairs of a quiz in score order, served by unique_quiz_score.
+    """
+    return (
+        select(QuizScoreCount.score, QuizScoreCount.submissions)
+        .where(QuizScoreCount.quiz_id == quiz_id, QuizScoreCount.submissions > 0)
+        .order_by(QuizScoreCount.score)
+    )
+
+
+def summary(quiz_id, score_counts, total_marks):
+    """
+    The statistics of a quiz.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        score_counts (list): The rows of `score_counts_statement`.
+        total_marks (int): The marks of all the questions of the quiz.
+
+    Returns:
+        dict: The counts, the mean, variance and standard deviation, the minimum and maximum scores,
+              the pass mark (PASS_MARK_RATIO of the total marks) and the pass rate of the submitted
+              assignments, and their histogram in HISTOGRAM_BUCKETS equal ranges of scores.
+    """
+    submitted_count = sum(count for score, count in score_counts)
+    score_sum = sum(score * count for score, count in score_counts)
+    square_sum = sum(score * score * count for score, count in score_counts)
+    pass_mark = PASS_MARK_RATIO * total_marks
+    statistics = {
+        'quiz_id': quiz_id,
+        'submitted_count': submitted_count,
+        'mean': None,
+        'variance': None,
+        'std_dev': None,
+        'min_score': score_counts[0][0] if score_counts else None,
+        'max_score': score_counts[-1][0] if score_counts else None,
+        'total_marks': total_marks,
+        'pass_mark': round(pass_mark, 4),
+        'pass_rate': None,
+        'histogram': list(),
+    }
+    if submitted_count:
+        variance = (submitted_count * square_sum - score_sum * score_sum) / (submitted_count * submitted_count)
+        statistics['mean'] = round(score_sum / submitted_count, 4)
+        statistics['variance'] = round(variance, 4)
+        statistics['std_dev'] = round(math.sqrt(max(variance, 0)), 4)
+        passed = sum(count for score, count in score_counts if score >= pass_mark)
+        statistics['pass_rate'] = round(passed / submitted_count, 4)
+    top = max(total_marks, statistics['max_score'] or 0)
+    width = max(1, math.ceil((top + 1) / HISTOGRAM_BUCKETS))
+    buckets = [0] * math.ceil((top + 1) / width)
+    for score, count in score_counts:
+        buckets[min(max(score, 0) // width, len(buckets) - 1)] += count
+    statistics['histogram'] = [
+        {'min_score': number * width, 'max_score': min((number + 1) * width - 1, top), 'count': count}
+        for number, count in enumerate(buckets)
+    ]
+    return statistics
+
+
+@application.cli.command('rebuild-quiz-stats')
+@click.option('--quiz-id', default=None, help='Rebuild the statistics of this quiz only')
+def rebuild_quiz_stats_command(quiz_id):
+    """
+    Recompute the quiz statistics from the submissions, after a restore or a manual correction of scores.
+    """
+    with application.app_context():
+        quizzes = rebuild(db.session, quiz_id)
+        db.session.commit()
+    click.echo(f'statistics of {quizzes} quizzes with submissions rebuilt')
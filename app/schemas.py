@@ -1,4 +1,5 @@
-from marshmallow import Schema, fields, base
+from marshmallow import Schema, fields, base, validate
+from app.pagination import MAX_PAGE_SIZE, decode_cursor
 
 
 """
@@ -6,6 +7,13 @@ This module aims at providing the request and response format for the various ap
 This also helpful for creating swagger docs for apis testing.
 """
 
+def _valid_cursor(cursor):
+    try:
+        decode_cursor(cursor)
+        return True
+    except ValueError:
+        return False
+
 class UserMasterSchema(Schema):
     name = fields.String(required=True, default='name')
     username = fields.String(required=True, default='username')
@@ -13,6 +21,25 @@ class UserMasterSchema(Schema):
     is_admin = fields.Integer(required=True, default=0)
 
 
+class ProvisionUserSchema(Schema):
+    id = fields.String()
+    name = fields.String(required=True)
+    username = fields.String(required=True)
+    password = fields.String(required=True)
+    is_admin = fields.Integer(load_default=0, validate=validate.OneOf([0, 1]))
+
+class BulkUserSchema(Schema):
+    users = fields.List(fields.Nested(ProvisionUserSchema))
+    chunk_size = fields.Integer(load_default=500, validate=validate.Range(min=1, max=10000))
+
+
+class SearchQuestionSchema(Schema):
+    query = fields.String(required=True, validate=validate.Length(min=1, max=200))
+    min_marks = fields.Integer()
+    max_marks = fields.Integer()
+    offset = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    limit = fields.Integer(load_default=20, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+
 class CreateQuizSchema(Schema):
     quiz_name = fields.String(required=True, default='quiz_name')
     question_ids = fields.List(fields.String()) 
@@ -30,19 +57,100 @@ class QuestionMasterSchema(Schema):
     marks = fields.Integer(required=True)
     remarks = fields.String(required=True)
 
+class BulkQuestionUploadSchema(Schema):
+    chunk_size = fields.Integer(load_default=500, validate=validate.Range(min=1, max=10000))
+    mode = fields.String(load_default='update', validate=validate.OneOf(['update', 'skip']))
+
 class AssignQuizSchema(Schema):
-    instance = fields.Dict(keys=fields.String(), values=fields.List(fields.String()))
+    instance = fields.Dict(keys=fields.String(), values=fields.List(fields.String()), load_default=dict)
+    all_users = fields.List(fields.String(), load_default=list)
+    groups = fields.Dict(keys=fields.String(), values=fields.List(fields.String()), load_default=dict)
+    chunk_size = fields.Integer(load_default=500, validate=validate.Range(min=1, max=10000))
+
+class GroupSchema(Schema):
+    group_name = fields.String(required=True)
+
+class GroupMembersSchema(Schema):
+    group_id = fields.String(required=True)
+    user_ids = fields.List(fields.String(), load_default=list)
+    chunk_size = fields.Integer(load_default=500, validate=validate.Range(min=1, max=10000))
 
 class UserResponseSchema(Schema):
     quiz_id = fields.String(required=True)
     responses = fields.List(fields.Dict(keys=fields.String(), values=fields.String()))
 
+class SubmissionStatusSchema(Schema):
+    receipt_id = fields.String(required=True)
+
+class AutosaveSchema(Schema):
+    quiz_id = fields.String(required=True)
+    answers = fields.Dict(keys=fields.String(), values=fields.Integer(validate=validate.Range(min=1, max=4)),
+                          required=True, validate=validate.Length(min=1, max=MAX_PAGE_SIZE))
+
+class UserSchema(Schema):
+    user_id = fields.String(required=True)
+
+class UserRoleSchema(UserSchema):
+    is_admin = fields.Integer(required=True, validate=validate.OneOf([0, 1]))
+
 class LoginSchema(Schema):
     username = fields.String(required=True)
     password = fields.String(required=True)
 
+class PageSchema(Schema):
+    cursor = fields.String(allow_none=True, validate=_valid_cursor)
+    limit = fields.Integer(validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    is_active = fields.Integer(validate=validate.OneOf([0, 1]))
+
+class QuizResultPageSchema(PageSchema):
+    quiz_id = fields.String()
+    user_id = fields.String()
+    is_submitted = fields.Integer(validate=validate.OneOf([0, 1]))
+
+class GroupMemberPageSchema(PageSchema):
+    group_id = fields.String(required=True)
+
+class LeaderboardSchema(Schema):
+    quiz_id = fields.String(required=True)
+    mode = fields.String(load_default='top', validate=validate.OneOf(['top', 'rank', 'around', 'not_attempted']))
+    k = fields.Integer(load_default=10, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+    user_id = fields.String()
+    rank = fields.Integer(load_default=1, validate=validate.Range(min=1))
+    window = fields.Integer(load_default=10, validate=validate.Range(min=0, max=MAX_PAGE_SIZE // 2))
+    offset = fields.Integer(load_default=0, validate=validate.Range(min=0))
+    limit = fields.Integer(load_default=100, validate=validate.Range(min=1, max=MAX_PAGE_SIZE))
+
+class ExportResultSchema(Schema):
+    format = fields.String(load_default='ndjson', validate=validate.OneOf(['ndjson', 'csv']))
+    quiz_id = fields.String()
+    date_from = fields.DateTime()
+    date_to = fields.DateTime()
+
 class UnifiedAPIResponseSchema(Schema):
     message = fields.String(default="default responce message")
 
 class UnifiedViewResponseSchema(Schema):
-    response = fields.List(fields.Dict(keys=fields.String(), values=fields.String()))
\ No newline at end of file
+    response = fields.List(fields.Dict(keys=fields.String()))
+
+class UnifiedPageResponseSchema(UnifiedViewResponseSchema):
+    next_cursor = fields.String(allow_none=True)
+
+class BulkErrorSchema(Schema):
+    row = fields.Integer()
+    error = fields.String()
+
+class BulkReportResponseSchema(Schema):
+    message = fields.String(default="default responce message")
+    total = fields.Integer()
+    inserted = fields.Integer()
+    updated = fields.Integer()
+    skipped = fields.Integer()
+    failed = fields.Integer()
+    rows_per_sec = fields.Float()
+    errors = fields.List(fields.Nested(BulkErrorSchema))
+"""
+Schemas hold no per-request state once built, so the response schemas are instantiated once
+and shared by every response and by the marshal_with decorators
+"""
+api_response_schema = UnifiedAPIResponseSchema()
+bulk_report_response_schema = BulkReportResponseSchema()
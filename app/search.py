@@ -0,0 +1,403 @@
+import datetime
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter
+
+from sqlalchemy import select
+
+from app import application
+from app.cache import LRUCache
+from app.models import QuestionMaster, db
+
+"""
+[Search Module] Full-text search over the question bank with an inverted index kept in process.
+                    Every term of the question, its choices and remarks maps to the questions containing
+                    it, bucketed by (occurrences, question length, marks). All the questions of a bucket
+                    score the same with BM25, so a one word search reads the buckets best first and stops
+                    at the page, the total being the sum of the bucket sizes, and the marks filter skips
+                    whole buckets. With more words, every word must match: the questions of the rarest
+                    word are intersected with the buckets of the others, or checked against their own
+                    terms when they are far fewer than the postings; the head of their ranking is
+                    cached until the index changes, for the next pages. The last word also matches as
+                    a prefix, looked up in the sorted term list with a binary search, every term it
+                    starts counting. The index is updated when questions are added or imported and
+                    rebuilt from question_master on startup. Every process holds its own index and
+                    only sees the questions added through it, so at most every SEARCH_REFRESH_INTERVAL
+                    seconds a search first reads the questions whose updated_ts is past the newest one
+                    indexed, less SEARCH_REFRESH_MARGIN seconds for the transactions which commit
+                    late, with a range scan of ix_question_master_updated, and indexes them like an
+                    add: the cost is that of the questions changed, not of the question bank.
+"""
+
+REBUILD_CHUNK_SIZE = 1000
+MERGE_THRESHOLD = 64
+SEARCH_REFRESH_INTERVAL = application.config.get('SEARCH_REFRESH_INTERVAL', 5)
+SEARCH_REFRESH_MARGIN = application.config.get('SEARCH_REFRESH_MARGIN', 60)
+PROBE_RATIO = 16
+RANKING_CACHE_SIZE = 32
+RANKING_CACHE_DEPTH = 1000
+K1 = 1.2
+B = 0.75
+TOKEN = re.compile(r'\w+')
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or',
+    'the', 'to', 'was', 'which', 'with',
+))
+TEXT_COLUMNS = ('question', 'choice1', 'choice2', 'choice3', 'choice4', 'remarks')
+INDEXED_COLUMNS = (QuestionMaster.id, QuestionMaster.marks) + tuple(getattr(QuestionMaster, column)
+                                                                     for column in TEXT_COLUMNS)
+
+
+def tokenize(text):
+    """
+    Returns:
+        list: The lower cased words of a text, stop words left out.
+    """
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class IndexState:
+    """
+    The postings and per-question data of the index. Questions are numbered in the order they are
+    indexed, terms in the order they are first seen; a question indexed again is removed from the
+    postings of its old terms and gets a new number. Not thread safe on its own, the QuestionSearch
+    serialises access.
+    """
+
+    def __init__(self):
+        self.ids = list()
+        self.number_of = dict()
+        self.tokens = list()
+        self.marks = array('i')
+        self.term_number = dict()
+        self.postings = list()
+        self.document_frequency = array('I')
+        self.terms = list()
+        self.new_terms = set()
+        self.live_count = 0
+        self.total_length = 0
+
+    def add(self, question):
+        old_number = self.number_of.get(question['id'])
+        if old_number is not None:
+            self.remove(old_number)
+        tokens = array('I')
+        for word in tokenize(' '.join(question.get(column) or '' for column in TEXT_COLUMNS)):
+            term = self.term_number.get(word)
+            if term is None:
+                term = self.term_number[word] = len(self.postings)
+                self.postings.append(dict())
+                self.document_frequency.append(0)
+                self.new_terms.add(word)
+            tokens.append(term)
+        number = len(self.ids)
+        marks = question.get('marks') or 0
+        self.ids.append(question['id'])
+        self.number_of[question['id']] = number
+        self.tokens.append(tokens)
+        self.marks.append(marks)
+        self.live_count += 1
+        self.total_length += len(tokens)
+        for term, count in Counter(tokens).items():
+            bucket = self.postings[term].get((count, len(tokens), marks))
+            if bucket is None:
+                bucket = self.postings[term][count, len(tokens), marks] = array('I')
+            bucket.append(number)
+            self.document_frequency[term] += 1
+
+    def remove(self, number):
+        tokens = self.tokens[number]
+        for term, count in Counter(tokens).items():
+            key = (count, len(tokens), self.marks[number])
+            bucket = self.postings[term][key]
+            bucket.remove(number)
+            if not bucket:
+                del self.postings[term][key]
+            self.document_frequency[term] -= 1
+        del self.number_of[self.ids[number]]
+        self.ids[number] = self.tokens[number] = None
+        self.live_count -= 1
+        self.total_length -= len(tokens)
+
+    def merge_terms(self):
+        if len(self.new_terms) <= MERGE_THRESHOLD:
+            for term in self.new_terms:
+                insort(self.terms, term)
+        else:  # one sort instead of a list insertion per term, after an import
+            self.terms = sorted(self.new_terms.union(self.terms))
+        self.new_terms.clear()
+
+    def expand(self, word, prefix):
+        """
+        The idf of the indexed terms a query word matches: itself, and the terms it starts when it is a prefix.
+
+        Returns:
+            dict: The idf keyed by term number, empty when nothing matches.
+        """
+        if prefix:
+            position = bisect_left(self.terms, word)
+            words = list()
+            while position < len(self.terms) and self.terms[position].startswith(word):
+                words.append(self.terms[position])
+                position += 1
+        else:
+            words = [word]
+        matched = dict()
+        for word in words:
+            term = self.term_number.get(word)
+            if term is not None and self.document_frequency[term]:
+                frequency = self.document_frequency[term]
+                matched[term] = math.log(1 + (self.live_count - frequency + 0.5) / (frequency + 0.5))
+        return matched
+
+    def weight(self, idf, count, length, average_length):
+        return idf * count * (K1 + 1) / (count + K1 * (1 - B + B * length / average_length))
+
+    def ranked_buckets(self, group, low, high, average_length):
+        """
+        The buckets of the terms of a query word within the marks range, best scoring first.
+
+        Returns:
+            list: (score, bucket) pairs.
+        """
+        buckets = [
+            (self.weight(idf, count, length, average_length), bucket)
+            for term, idf in group.items()
+            for (count, length, marks), bucket in self.postings[term].items()
+            if low <= marks <= high
+        ]
+        buckets.sort(key=lambda item: item[0], reverse=True)
+        return buckets
+
+    def match(self, number, group, average_length):
+        """
+        The score of a question for a query word, its best matching term counting, 0 if none matches.
+        """
+        tokens = self.tokens[number]
+        if len(group) == 1:
+            for term, idf in group.items():
+                count = tokens.count(term)
+                return self.weight(idf, count, len(tokens), average_length) if count else 0
+        best = 0
+        for term in group.keys() & set(tokens):
+            best = max(best, self.weight(group[term], tokens.count(term), len(tokens), average_length))
+        return best
+
+    def intersect(self, scores, group, average_length):
+        """
+        Add the scores of a query word to those of the questions matching the previous words, and
+        drop the questions it does not match.
+
+        Returns:
+            dict: The summed scores keyed by question number.
+        """
+        added = dict()
+        if len(scores) * PROBE_RATIO < sum(self.document_frequency[term] for term in group):
+            for number in scores:
+                score = self.match(number, group, average_length)
+                if score:
+                    added[number] = score
+        else:  # ascending, so that a question matched by several terms of a prefix keeps its best score
+            for score, bucket in reversed(self.ranked_buckets(group, -math.inf, math.inf, average_length)):
+                added.update(dict.fromkeys(scores.keys() & bucket, score))
+        return {number: scores[number] + score for number, score in added.items()}
+
+
+class QuestionSearch:
+    """
+    The question index shared by the requests of the process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = IndexState()
+        self._version = 0
+        self._rankings = LRUCache(RANKING_CACHE_SIZE)
+        self._indexed_ts = None
+        self._recent = dict()
+        self._checked_at = time.monotonic()
+        self._refreshing = False
+
+    def add(self, questions):
+        """
+        Index questions, replacing the entries of those already indexed.
+
+        Args:
+            questions (iterable): Mappings with the id, marks and text columns of the questions.
+        """
+        with self._lock:
+            for question in questions:
+                self._state.add(question)
+            self._version += 1
+
+    def search(self, text, min_marks=None, max_marks=None, offset=0, limit=20):
+        """
+        Rank the questions matching every word of a text, the last word also as a prefix.
+
+        Args:
+            text (str): The words to search for.
+            min_marks (int): Only match questions of at least these marks.
+            max_marks (int): Only match questions of at most these marks.
+            offset (int): The number of ranked matches to skip.
+            limit (int): The most matches to return.
+
+        Returns:
+            dict: 'total' with the number of matches and 'hits' with the (question id, score) pairs
+                  from offset on, best first.
+        """
+        words = tokenize(text)
+        low = min_marks if min_marks is not None else -math.inf
+        high = max_marks if max_marks is not None else math.inf
+        with self._lock:
+            state = self._state
+            if not words or not state.live_count:
+                return {'total': 0, 'hits': []}
+            if state.new_terms:
+                state.merge_terms()
+            groups = [state.expand(word, position == len(words) - 1) for position, word in enumerate(words)]
+            if not all(groups):
+                return {'total': 0, 'hits': []}
+            groups.sort(key=lambda group: sum(state.document_frequency[term] for term in group))
+            average_length = state.total_length / state.live_count
+            buckets = state.ranked_buckets(groups[0], low, high, average_length)
+            if len(groups) == 1:
+                return self._read_buckets(state, buckets, len(groups[0]) > 1, offset, limit)
+            key = (self._version, tuple(words), low, high)
+            total, ranked = self._rankings.get(key) or (None, ())
+            if total is None or (offset + limit > len(ranked) and total > len(ranked)):
+                total, ranked = self._rank(state, groups, buckets, average_length,
+                                           max(offset + limit, RANKING_CACHE_DEPTH))
+                self._rankings.set(key, (total, ranked))
+            return {'total': total, 'hits': [(state.ids[number], score)
+                                             for number, score in ranked[offset:offset + limit]]}
+
+    @staticmethod
+    def _rank(state, groups, buckets, average_length, depth):
+        """
+        Score the questions matching every word of a search.
+
+        Returns:
+            tuple: The number of matches and the (question number, score) pairs of the best `depth` of them.
+        """
+        scores = dict()
+        for score, bucket in reversed(buckets):  # ascending, so a question keeps its best score
+            scores.update(dict.fromkeys(bucket, score))
+        for group in groups[1:]:
+            scores = state.intersect(scores, group, average_length)
+            if not scores:
+                break
+        ranked = heapq.nlargest(depth, scores, key=scores.__getitem__)
+        return len(scores), [(number, scores[number]) for number in ranked]
+
+    @staticmethod
+    def _read_buckets(state, buckets, overlapping, offset, limit):
+        """
+        The page of a one word search, read off its buckets best first. The buckets of the terms of
+        a prefix overlap, a question then counts once, at its best score.
+        """
+        if overlapping:
+            matched = set()
+            for score, bucket in buckets:
+                matched.update(bucket)
+            total = len(matched)
+        else:
+            total = sum(len(bucket) for score, bucket in buckets)
+        hits = list()
+        seen = set()
+        for score, bucket in buckets:
+            for number in bucket:
+                if overlapping:
+                    if number in seen:
+                        continue
+                    seen.add(number)
+                if offset:
+                    offset -= 1
+                    continue
+                hits.append((state.ids[number], score))
+                if len(hits) == limit:
+                    return {'total': total, 'hits': hits}
+        return {'total': total, 'hits': hits}
+
+    def rebuild(self, db_session=None):
+        """
+        Rebuild the index from question_master with one streamed query.
+
+        Args:
+            db_session (Session): The session to read with, the Flask-SQLAlchemy session by default.
+        """
+        db_session = db_session or db.session
+        state = IndexState()
+        recent = dict()
+        newest = None
+        rows = db_session.execute(
+            select(*INDEXED_COLUMNS, QuestionMaster.updated_ts).execution_options(yield_per=REBUILD_CHUNK_SIZE)
+        )
+        for row in rows:
+            state.add(row._mapping)
+            if newest is None or row.updated_ts > newest:
+                newest = row.updated_ts
+            if row.updated_ts >= newest - datetime.timedelta(seconds=SEARCH_REFRESH_MARGIN):
+                recent[row.id] = row.updated_ts
+        state.merge_terms()
+        indexed_ts, recent = self._recent_changes(None, recent)
+        with self._lock:
+            self._state = state
+            self._version += 1
+            self._indexed_ts, self._recent = indexed_ts, recent
+            self._checked_at = time.monotonic()
+
+    def refresh(self, db_session=None):
+        """
+        Index the questions changed in question_master by other processes since the last refresh,
+        at most every SEARCH_REFRESH_INTERVAL seconds. The questions changed within SEARCH_REFRESH_MARGIN
+        seconds of the newest one are read again, and skipped if their updated_ts did not move. One
+        search refreshes while the others read the current index.
+
+        Args:
+            db_session (Session): The session to read with, the Flask-SQLAlchemy session by default.
+        """
+        with self._lock:
+            if self._refreshing or time.monotonic() - self._checked_at < SEARCH_REFRESH_INTERVAL:
+                return
+            self._refreshing = True
+            self._checked_at = time.monotonic()
+            indexed_ts, recent = self._indexed_ts, self._recent
+        try:
+            statement = select(*INDEXED_COLUMNS, QuestionMaster.updated_ts)
+            if indexed_ts is not None:
+                statement = statement.where(
+                    QuestionMaster.updated_ts >= indexed_ts - datetime.timedelta(seconds=SEARCH_REFRESH_MARGIN))
+            rows = [row for row in (db_session or db.session).execute(statement)
+                    if recent.get(row.id) != row.updated_ts]
+            if rows:
+                self.add(row._mapping for row in rows)
+            recent = dict(recent)
+            recent.update((row.id, row.updated_ts) for row in rows)
+            indexed_ts, recent = self._recent_changes(indexed_ts, recent)
+            with self._lock:
+                self._indexed_ts, self._recent = indexed_ts, recent
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    @staticmethod
+    def _recent_changes(indexed_ts, updated):
+        """
+        Returns:
+            tuple: The newest updated_ts among the indexed one and the given questions', and the updated_ts
+                   keyed by question id of those within SEARCH_REFRESH_MARGIN seconds of it.
+        """
+        indexed_ts = max([timestamp for timestamp in (indexed_ts, *updated.values()) if timestamp is not None],
+                         default=None)
+        if indexed_ts is None:
+            return None, dict()
+        oldest = indexed_ts - datetime.timedelta(seconds=SEARCH_REFRESH_MARGIN)
+        return indexed_ts, {question_id: timestamp for question_id, timestamp in updated.items() if timestamp >= oldest}
+
+
+question_search = QuestionSearch()
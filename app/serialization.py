@@ -0,0 +1,49 @@
+import datetime
+import decimal
+import json
+
+from flask import Response
+
+"""
+[Serialization Module] JSON encoding of the API responses. List and page responses are returned as
+                        plain dictionaries and encoded here in one pass by a JSON encoder built once
+                        (flask_apispec's APISPEC_FORMAT_RESPONSE hook, used for every resource),
+                        instead of being pushed through a marshmallow schema per response: integers,
+                        booleans and nulls keep their JSON types, timestamps are written the way the
+                        API always printed them ('YYYY-MM-DD HH:MM:SS').
+"""
+
+
+def json_default(value):
+    """
+    Encode the values the json module does not know.
+
+    Raises:
+        TypeError: If the value has no JSON form.
+    """
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, bytes):
+        return value.decode()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+json_encoder = json.JSONEncoder(default=json_default, separators=(',', ':'), ensure_ascii=False)
+
+
+def dumps(data):
+    """
+    Encode a response body with the shared encoder.
+    """
+    return json_encoder.encode(data)
+
+
+def jsonify(data):
+    """
+    Build the JSON response of a resource.
+    """
+    return Response(dumps(data) + '\n', mimetype='application/json')
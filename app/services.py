@@ -1,7 +1,26 @@
+from sqlalchemy import and_, bindparam, exists, func, literal, or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm.session import sessionmaker
-from app.models import (QuestionMaster, QuizInstance, QuizMaster, QuizQuestions, UserMaster, UserResponses, UserSession)
+from app.models import (GroupMember, GroupQuiz, QuestionMaster, QuizInstance, QuizMaster, QuizQuestions, UserMaster,
+                        SubmissionReceipt, UserResponses, UserSession)
 from app import db
-import uuid
+from app.assignment import assign_quizzes
+from app.autosave import autosave_buffer
+from app.cache import assigned_quizzes_cache, invalidate_assignments, invalidate_quiz, quiz_cache, quiz_list_cache
+from app.conditional import settled_version, version_from_aggregate, version_statement
+from app.export import EXPORT_FORMATS, export_results
+from app import groups
+from app.keys import new_id
+from app.leaderboard import leaderboard
+from app.pagination import paginate, split_page
+from app.passwords import hash_password, password_pool, verify_password
+from app.grading import get_answer_key, grade_submission, mark_submitted, regrade_quiz as regrade_submissions
+from app.gradingqueue import grading_queue, new_receipt, receipt_status
+from app.importer import import_questions, question_hash
+from app.provisioning import provision_users, users_from_csv
+from app import quizstats
+from app.search import question_search
+from app.sessions import session_store
 from flask import session
 import datetime
 from typing import List
@@ -11,6 +30,12 @@ from typing import List
                     implementation using MVC Template
 """
 
+UPGRADE_PASSWORD = (
+    update(UserMaster.__table__)
+    .where(UserMaster.__table__.c.id == bindparam('b_user_id'))
+    .values(password=bindparam('b_password'))
+)
+
 def exception_handler(func):
     def wrapper(**kwargs):
         """
@@ -49,52 +74,119 @@ def add_user(**kwargs):
         DatabaseError: If there was an error adding the user to the database.
     """
     user = UserMaster(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             name=kwargs['name'],
             username=kwargs['username'],
-            password=kwargs['password'],
+            password=password_pool.run(hash_password, kwargs['password']),
             is_admin=kwargs['is_admin'],
         )
     db.session.add(user)
     db.session.commit()
     return 1
     
-@exception_handler    
-def add_session(**kwargs):
+@exception_handler
+def bulk_add_users(**kwargs):
+    """
+    Provisions a whole cohort of users with chunked multi-row inserts.
+
+    Parameters:
+        **kwargs (dict): Keyword arguments containing the cohort.
+            - users (list): The users as dictionaries with name, username, password and optionally is_admin.
+            - file (file): Alternatively a csv file with the same columns as an open text stream.
+            - chunk_size (int): The number of users written per statement.
+
+    Returns:
+        dict: The provisioning report. Users whose username already exists are counted as skipped.
+    """
+    users = users_from_csv(kwargs['file']) if kwargs.get('file') else kwargs.get('users') or []
+    report = provision_users(users, chunk_size=kwargs['chunk_size'])
+    return report.as_dict()
+
+@exception_handler
+def login(**kwargs):
     """
-    Adds a session for the given user.
+    Verifies the credentials of a user and adds a session for the user.
 
     Args:
-        **kwargs (dict): Keyword arguments containing the user information.
-            - user (UserMaster): The user to add the session for.
+        **kwargs (dict): Keyword arguments containing the credentials.
+            - username (str): The username of the user.
+            - password (str): The password of the user.
 
     Returns:
-        int: Returns 1 on success.
+        int: 1 on success, 0 if the username is unknown or the password is wrong.
 
     Raises:
-        Exception: If there is an error while adding the session.
+        PasswordPoolBusy: If too many logins are being verified at once.
 
     Notes:
-        - This function adds a session for the user.
-        - The user information is passed as keyword arguments.
+        - The password is verified on the bounded password pool, not on the request thread.
+        - A legacy plain text password, or a hash made with an older method, is re-hashed and stored
+          in the same commit as the session.
+        - The session row and the user's `is_active` flag are written through the session store,
+          which coalesces concurrent logins into group commits.
         - The session ID and user ID are stored in the session object.
-        - The user's `is_active` flag is set to 1.
-        - The changes are committed to the database.
-    """
-    user = kwargs['user']
-    user_session = UserSession(
-                    id = str(uuid.uuid4()),
-                    user_id = user.id,
-                    session_id = str(uuid.uuid4()),
-                )
-    session['session_id'] = user_session.session_id
+    """
+    user = db.session.execute(
+        select(UserMaster.id, UserMaster.password, UserMaster.is_admin).where(UserMaster.username == kwargs['username'])
+    ).first()
+    valid, new_hash = verify_password(user.password if user else None, kwargs['password'])
+    if not valid:
+        return 0
+    operations = ((UPGRADE_PASSWORD, {'b_user_id': user.id, 'b_password': new_hash}),) if new_hash else ()
+    session_id = session_store.create(user, *operations)
+    session['session_id'] = session_id
     session['user_id'] = user.id
     session['is_admin'] = user.is_admin
-    user.is_active = 1
-    db.session.add(user_session)
+    return 1
+
+@exception_handler
+def end_session():
+    """
+    Ends the session of the current user: the session is revoked in the session store and
+    the user's `is_active` flag is set to 0.
+
+    Returns:
+        int: Returns 1 on success.
+    """
+    db.session.execute(update(UserMaster).where(UserMaster.id == session['user_id']).values(is_active=0))
+    session_store.revoke(session['session_id'])
+    db.session.commit()
+    return 1
+
+@exception_handler
+def revoke_user_sessions(**kwargs):
+    """
+    Revokes every session of a user, logging the user out everywhere.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the user_id.
+
+    Returns:
+        int: Returns 1 on success.
+    """
+    session_store.revoke_user(kwargs['user_id'])
     db.session.commit()
     return 1
 
+@exception_handler
+def set_user_role(**kwargs):
+    """
+    Grants or withdraws the admin role of a user. Live sessions of the user pick the change up
+    on their next request.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the user_id and the is_admin flag.
+
+    Returns:
+        int: 1 on success, 0 if the user does not exist.
+    """
+    updated = db.session.execute(
+        update(UserMaster).where(UserMaster.id == kwargs['user_id']).values(is_admin=kwargs['is_admin'])
+    ).rowcount
+    db.session.commit()
+    session_store.refresh_user(kwargs['user_id'])
+    return 1 if updated else 0
+
 @exception_handler
 def add_question(**kwargs):
     """
@@ -113,9 +205,13 @@ def add_question(**kwargs):
 
     Returns:
         int: The result of adding the question to the database. Returns 1 on success.
+
+    Notes:
+        - The question is added to the search index once committed.
     """
+    question_id = new_id()
     question = QuestionMaster(
-                    id=str(uuid.uuid4()),
+                    id=question_id,
                     question=kwargs['question'],
                     choice1=kwargs['choice1'],
                     choice2=kwargs['choice2'],
@@ -124,22 +220,67 @@ def add_question(**kwargs):
                     answer=kwargs['answer'],
                     marks=kwargs['marks'],
                     remarks=kwargs['remarks'],
+                    content_hash=question_hash(kwargs['question'], kwargs['choice1'], kwargs['choice2'],
+                                               kwargs['choice3'], kwargs['choice4']),
                 )
     db.session.add(question)
     db.session.commit()
+    question_search.add([dict(kwargs, id=question_id)])
     return 1
 
 @exception_handler
-def list_questions():
+def bulk_add_questions(**kwargs):
     """
-    Retrieve a list of questions from the QuestionMaster table.
+    Imports a csv question bank in chunks, upserting questions on their content hash.
+
+    Parameters:
+        **kwargs (dict): Keyword arguments containing the upload details.
+            - file (file): The csv file as an open text stream.
+            - chunk_size (int): The number of rows written per statement.
+            - mode (str): 'update' to overwrite existing questions, 'skip' to leave them.
 
     Returns:
-        List: A list of dictionaries containing the question details. Each dictionary
+        dict: The import report with the row counters, per-row errors and rows/sec.
+    """
+    report = import_questions(kwargs['file'], chunk_size=kwargs['chunk_size'], mode=kwargs['mode'])
+    return report.as_dict()
+
+def _apply_filters(statement, model, kwargs, columns):
+    """
+    Applies equality filters for the given columns which have a value in kwargs.
+
+    Args:
+        statement (Select): The select to filter.
+        model (BaseModel): The model owning the columns.
+        kwargs (dict): The request arguments.
+        columns (tuple): The names of the filterable columns.
+
+    Returns:
+        Select: The filtered select.
+    """
+    for column in columns:
+        if kwargs.get(column) is not None:
+            statement = statement.where(getattr(model, column) == kwargs[column])
+    return statement
+
+@exception_handler
+def list_questions(**kwargs):
+    """
+    Retrieve one page of questions from the QuestionMaster table in (created_ts, id) order.
+
+    Parameters:
+        **kwargs (dict): Optional keyword arguments.
+            - cursor (str): The next_cursor of the previous page, omitted for the first page.
+            - limit (int): The page size.
+            - is_active (int): Only list questions with this is_active flag.
+
+    Returns:
+        dict: 'response' holds a list of dictionaries containing the question details. Each dictionary
         contains the following keys: 'id', 'question', 'choice1', 'choice2',
-        'choice3', 'choice4', 'answer'.
+        'choice3', 'choice4', 'answer'. 'next_cursor' is None on the last page.
     """
-    questions = QuestionMaster.query.all()
+    statement = questions_page_statement(kwargs)
+    questions, next_cursor = split_page(db.session.execute(statement).scalars().all(), kwargs.get('limit'))
     question_list = list()
     for question in questions:
         question = {
@@ -152,6 +293,84 @@ def list_questions():
             'answer': question.answer,
         }
         question_list.append(question)
+    return {'response': question_list, 'next_cursor': next_cursor}
+
+def questions_page_statement(kwargs):
+    """
+    The keyset select of a page of `list_questions`.
+    """
+    statement = _apply_filters(select(QuestionMaster), QuestionMaster, kwargs, ('is_active',))
+    return paginate(statement, QuestionMaster, kwargs.get('cursor'), kwargs.get('limit'))
+
+@exception_handler
+def questions_version(**kwargs):
+    """
+    The version of a page of `list_questions`, for the validators of /list.questions, with one aggregate query.
+
+    Returns:
+        tuple: The newest updated_ts of the page's rows and their number.
+    """
+    return version_from_aggregate(db.session.execute(version_statement(questions_page_statement(kwargs))).one())
+
+@exception_handler
+def search_questions(**kwargs):
+    """
+    Searches the question bank through the in-process search index.
+
+    Parameters:
+        **kwargs (dict): Keyword arguments containing the search.
+            - query (str): The words to search in the question, its choices and remarks. Every word must
+              match, the last one also matches as a prefix.
+            - min_marks (int): Only match questions of at least these marks.
+            - max_marks (int): Only match questions of at most these marks.
+            - offset (int): The number of ranked matches to skip.
+            - limit (int): The page size.
+
+    Returns:
+        list: The matching questions, best first, with the keys of list_questions plus 'marks', 'remarks',
+              'score' and 'total', the number of matches.
+
+    Notes:
+        - The matches are ranked in process and the questions of the page fetched with one IN query.
+        - The index is rebuilt first when question_master changed in another process, see QuestionSearch.refresh.
+    """
+    question_search.refresh()
+    found = question_search.search(kwargs['query'], kwargs.get('min_marks'), kwargs.get('max_marks'),
+                                   kwargs['offset'], kwargs['limit'])
+    if not found['hits']:
+        return list()
+    return search_results_from_rows(found, db.session.execute(search_results_statement(found)).scalars())
+
+def search_results_statement(found):
+    """
+    The select of the questions of a page of search hits, used by `search_questions`.
+    """
+    return select(QuestionMaster).where(QuestionMaster.id.in_([question_id for question_id, score in found['hits']]))
+
+def search_results_from_rows(found, rows):
+    """
+    Shapes the questions of `search_results_statement` into the search_questions dictionaries, in the
+    order of the hits. A question deleted since it was indexed is left out.
+    """
+    questions = {question.id: question for question in rows}
+    question_list = list()
+    for question_id, score in found['hits']:
+        question = questions.get(question_id)
+        if question is None:
+            continue
+        question_list.append({
+            'id': question.id,
+            'question': question.question,
+            'choice1': question.choice1,
+            'choice2': question.choice2,
+            'choice3': question.choice3,
+            'choice4': question.choice4,
+            'answer': question.answer,
+            'marks': question.marks,
+            'remarks': question.remarks,
+            'score': round(score, 4),
+            'total': found['total'],
+        })
     return question_list
 
 @exception_handler
@@ -168,46 +387,105 @@ def add_quiz(**kwargs):
         int: The status code indicating the success of the operation. Returns 1 if the quiz was successfully added to the database.
     """
     quiz = QuizMaster(
-                    id=str(uuid.uuid4()),
+                    id=new_id(),
                     quiz_name=kwargs['quiz_name'],   
                 )
     for question_id in kwargs['question_ids']:
         quiz_question = QuizQuestions(
-            id=str(uuid.uuid4()),
+            id=new_id(),
             quiz_id=quiz.id,
             question_id=question_id,
         )
         db.session.add(quiz_question)
     db.session.add(quiz)
     db.session.commit()
+    invalidate_quiz(quiz.id)
+    quiz_list_cache.clear()
     return 1
 
 @exception_handler
 def assign_quiz(**kwargs):
     """
-    Assigns a quiz to one or more users.
+    Assigns quizzes to users with the set-based assignment engine.
 
     Args:
-        **kwargs (dict): A dictionary containing the quiz ID as the key and a list of user IDs as the value.
+        **kwargs (dict): Keyword arguments containing the assignment.
+            - instance (dict): The quiz ID as the key and a list of user IDs as the value.
+            - all_users (list): The IDs of the quizzes to assign to every non-admin user.
+            - groups (dict): The quiz ID as the key and a list of group IDs as the value.
+            - chunk_size (int): The number of users validated and written per statement.
 
     Returns:
-        int: Returns 1 if the quiz is successfully assigned to all users, otherwise returns 0.
+        dict: The assignment report. Unknown users and groups are counted as failed, users and groups
+              which already have the quiz as skipped.
+        int: 0 if one of the quizzes does not exist, nothing is assigned then.
     """
-    for quiz_id, user_ids in kwargs['instance'].items():
-        quiz = QuizMaster.query.filter_by(id=quiz_id).first()
-        if quiz:
-            for user_id in user_ids:
-                quiz_instance = QuizInstance(
-                    id=str(uuid.uuid4()),
-                    quiz_id=quiz.id,
-                    user_id=user_id,
-                )
-                db.session.add(quiz_instance)
-        else:
-            db.session.rollback()
-            return 0
-    db.session.commit()
-    return 1
+    report = assign_quizzes(kwargs.get('instance'), kwargs.get('all_users') or [], kwargs['chunk_size'],
+                            groups=kwargs.get('groups'))
+    return 0 if report is None else report.as_dict()
+
+@exception_handler
+def create_group(**kwargs):
+    """
+    Creates an empty group of users.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the group.
+            - group_name (str): The unique name of the group.
+
+    Returns:
+        str: The ID of the group.
+    """
+    return groups.create_group(kwargs['group_name'])
+
+@exception_handler
+def add_group_members(**kwargs):
+    """
+    Adds users to a group in chunks.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the members.
+            - group_id (str): The ID of the group.
+            - user_ids (list): The IDs of the users to add.
+            - chunk_size (int): The number of users validated and written per statement.
+
+    Returns:
+        dict: The report. Unknown users are counted as failed, users already in the group as skipped.
+        int: 0 if the group does not exist.
+    """
+    report = groups.add_members(kwargs['group_id'], kwargs.get('user_ids') or [], kwargs['chunk_size'])
+    return 0 if report is None else report.as_dict()
+
+@exception_handler
+def list_group_members(**kwargs):
+    """
+    Lists one page of the members of a group.
+
+    Args:
+        **kwargs (dict): Keyword arguments.
+            - group_id (str): The ID of the group.
+            - cursor (str): The next_cursor of the previous page, omitted for the first page.
+            - limit (int): The page size.
+
+    Returns:
+        dict: 'response' with the user_id, name, username and added_at of each member, 'next_cursor'.
+    """
+    return groups.list_members(kwargs['group_id'], kwargs.get('cursor'), kwargs.get('limit'))
+
+@exception_handler
+def list_groups(**kwargs):
+    """
+    Lists one page of the groups.
+
+    Args:
+        **kwargs (dict): Keyword arguments.
+            - cursor (str): The next_cursor of the previous page, omitted for the first page.
+            - limit (int): The page size.
+
+    Returns:
+        dict: 'response' with the id, group_name and created_at of each group, 'next_cursor'.
+    """
+    return groups.list_groups(kwargs.get('cursor'), kwargs.get('limit'))
 
 @exception_handler
 def view_quiz(**kwargs):
@@ -229,30 +507,170 @@ def view_quiz(**kwargs):
             - 'marks' (int): The marks assigned to the question.
             - 'remarks' (str): Remarks or additional information about the question.
 
-        int: 0 if the user is not authorized to view the quiz.
-    """
-    quiz = QuizMaster.query.filter_by(id=kwargs['quiz_id']).first()
-    quiz_question_ids = [quiz_question.question_id for quiz_question in QuizQuestions.query.filter_by(quiz_id=quiz.id).all()]
-    quiz_questions = [QuestionMaster.query.filter_by(id=question_id).first() for question_id in quiz_question_ids]
-    user_ids = [quiz_instance.user_id for quiz_instance in QuizInstance.query.filter_by(quiz_id=quiz.id).all()]
-    if (session['user_id'] in user_ids) or (session['is_admin'] == 1):
-        quiz_questions_list = list()
-        for question in quiz_questions:
-            question = {
-                'quiz_name': quiz.quiz_name,
-                'question_id': question.id,
-                'question': question.question,
-                'choice1': question.choice1,
-                'choice2': question.choice2,
-                'choice3': question.choice3,
-                'choice4': question.choice4,
-                'marks': question.marks,
-                'remarks': question.remarks
-            }
-            quiz_questions_list.append(question)
-        return quiz_questions_list
-    else:
+        int: 0 if the quiz does not exist or the user is not authorized to view the quiz.
+
+    Notes:
+        - The question list is assembled once with a joined query and then served from quiz_cache;
+          the requests missing it at the same time wait for one load.
+        - With the 'version' of `quiz_version`, a cached list of another version is loaded again, so that
+          the list answered is never older than the validators sent with it.
+    """
+    quiz_id = kwargs['quiz_id']
+    if session['is_admin'] != 1 and not is_assigned(quiz_id, session['user_id']):
         return 0
+    compiled = quiz_cache.get_or_load(quiz_id, lambda: _compile_quiz(quiz_id))
+    if compiled is not None and kwargs.get('version') is not None and compiled['version'] != kwargs['version']:
+        compiled = _compile_quiz(quiz_id)
+        if compiled is not None:
+            quiz_cache.set(quiz_id, compiled)
+    if compiled is None:
+        return 0
+    return list(compiled['questions'])
+
+@exception_handler
+def quiz_version(**kwargs):
+    """
+    The version of the questions of a quiz, for the validators of /view.quiz, with one aggregate query.
+
+    Returns:
+        tuple: The newest updated_ts of the quiz, its question links and its questions, and the number of questions.
+        int: 0 if the user is not an admin and the quiz is not assigned to them.
+    """
+    quiz_id = kwargs['quiz_id']
+    if session['is_admin'] != 1 and not is_assigned(quiz_id, session['user_id']):
+        return 0
+    return version_from_aggregate(db.session.execute(quiz_version_statement(quiz_id)).one())
+
+def is_assigned(quiz_id, user_id):
+    """
+    Checks whether a quiz is assigned to a user, directly or through one of the user's groups, with a
+    single query of two indexed EXISTS probes.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+        user_id (str): The ID of the user.
+
+    Returns:
+        bool: True if the quiz is assigned to the user.
+    """
+    return db.session.execute(assignment_statement(quiz_id, user_id)).scalar()
+
+def assignment_statement(quiz_id, user_id):
+    """
+    The EXISTS probe of `is_assigned`.
+    """
+    return select(or_(
+        exists().where(
+            QuizInstance.quiz_id == quiz_id,
+            QuizInstance.user_id == user_id,
+        ),
+        groups.group_assignment(quiz_id, user_id),
+    ))
+
+def answerable_statement(quiz_id, user_id):
+    """
+    The probe of whether a user may still answer a quiz: assigned, directly or through a group, and not
+    submitted, in one query of indexed EXISTS probes.
+    """
+    return select(and_(
+        or_(
+            exists().where(QuizInstance.quiz_id == quiz_id, QuizInstance.user_id == user_id),
+            groups.group_assignment(quiz_id, user_id),
+        ),
+        ~exists().where(QuizInstance.quiz_id == quiz_id, QuizInstance.user_id == user_id,
+                        QuizInstance.is_submitted == 1),
+    ))
+
+def assigned_quizzes_statement(user_id):
+    """
+    The quizzes of a user as (quiz_name, quiz_id, user_id, score_achieved, is_submitted): the quiz_instance
+    rows of the user and, unioned in, the quizzes of the user's groups which have no quiz_instance yet.
+    """
+    user_key = literal(user_id, QuizInstance.__table__.c.user_id.type)
+    direct = (
+        select(QuizMaster.quiz_name, QuizInstance.quiz_id, QuizInstance.user_id,
+               QuizInstance.score_achieved, QuizInstance.is_submitted)
+        .join(QuizMaster, QuizMaster.id == QuizInstance.quiz_id)
+        .where(QuizInstance.user_id == user_id)
+    )
+    through_groups = (
+        select(QuizMaster.quiz_name, GroupQuiz.quiz_id, user_key.label('user_id'),
+               literal(0).label('score_achieved'), literal(0).label('is_submitted'))
+        .join(QuizMaster, QuizMaster.id == GroupQuiz.quiz_id)
+        .join(GroupMember, GroupMember.group_id == GroupQuiz.group_id)
+        .where(GroupMember.user_id == user_id)
+        .where(~exists().where(QuizInstance.quiz_id == GroupQuiz.quiz_id, QuizInstance.user_id == user_id))
+        .distinct()
+    )
+    return direct.union_all(through_groups)
+
+def _compile_quiz(quiz_id):
+    """
+    Fetches a quiz together with all of its questions in one joined query.
+
+    Args:
+        quiz_id (str): The ID of the quiz.
+
+    Returns:
+        dict: 'questions' with the question dictionaries as returned by view_quiz and 'version' with their
+              version, or None if the quiz does not exist.
+    """
+    return quiz_questions_from_rows(db.session.execute(quiz_questions_statement(quiz_id)).all())
+
+def quiz_questions_statement(quiz_id):
+    """
+    The select of a quiz outer joined with its questions, used by `_compile_quiz`.
+    """
+    return (
+        select(QuizMaster.quiz_name, QuestionMaster, QuizMaster.updated_ts, QuizQuestions.updated_ts)
+        .select_from(QuizMaster)
+        .outerjoin(QuizQuestions, QuizQuestions.quiz_id == QuizMaster.id)
+        .outerjoin(QuestionMaster, QuestionMaster.id == QuizQuestions.question_id)
+        .where(QuizMaster.id == quiz_id)
+    )
+
+def quiz_version_statement(quiz_id):
+    """
+    The aggregate of the version of `quiz_questions_statement`'s rows, for `quiz_version`.
+    """
+    return (
+        select(func.max(QuizMaster.updated_ts), func.max(QuizQuestions.updated_ts),
+               func.max(QuestionMaster.updated_ts), func.count(QuestionMaster.id))
+        .select_from(QuizMaster)
+        .outerjoin(QuizQuestions, QuizQuestions.quiz_id == QuizMaster.id)
+        .outerjoin(QuestionMaster, QuestionMaster.id == QuizQuestions.question_id)
+        .where(QuizMaster.id == quiz_id)
+    )
+
+def quiz_questions_from_rows(rows):
+    """
+    Shapes the rows of `quiz_questions_statement` into the view_quiz question dictionaries.
+
+    Returns:
+        dict: 'questions' with the question dictionaries and 'version' with their settled version, None if
+              not settled; None if there is no row (the quiz does not exist).
+    """
+    if not rows:
+        return None
+    quiz_questions_list = list()
+    timestamps = list()
+    for quiz_name, question, quiz_ts, link_ts in rows:
+        timestamps.extend((quiz_ts, link_ts))
+        if question is None:
+            continue
+        timestamps.append(question.updated_ts)
+        quiz_questions_list.append({
+            'quiz_name': quiz_name,
+            'question_id': question.id,
+            'question': question.question,
+            'choice1': question.choice1,
+            'choice2': question.choice2,
+            'choice3': question.choice3,
+            'choice4': question.choice4,
+            'marks': question.marks,
+            'remarks': question.remarks
+        })
+    return {'questions': quiz_questions_list, 'version': settled_version(timestamps, len(quiz_questions_list))}
     
 @exception_handler
 def list_assigned_quizzes():
@@ -267,34 +685,79 @@ def list_assigned_quizzes():
             - 'user_id' (int): The ID of the user the quiz is assigned to.
             - 'score_achieved' (float): The score achieved by the user for the quiz.
             - 'is_submitted' (bool): Indicates whether the quiz has been submitted by the user.
+
+    Notes:
+        - The quiz names are joined in, one query whatever the number of assigned quizzes, including
+          the quizzes of the user's groups.
+        - The list is served from assigned_quizzes_cache, dropped on assignments and submissions.
     """
-    quiz_instances = QuizInstance.query.filter_by(user_id=session['user_id']).all()
-    quiz_instance_list = list()
-    for quiz_instance in quiz_instances:
-        quiz_instance = {
-            'quiz_name': QuizMaster.query.filter_by(id=quiz_instance.quiz_id).first().quiz_name,
-            'quiz_id': quiz_instance.quiz_id,
-            'user_id': quiz_instance.user_id,
-            'score_achieved': quiz_instance.score_achieved,
-            'is_submitted': quiz_instance.is_submitted,
-        }
-        quiz_instance_list.append(quiz_instance)
-    return quiz_instance_list
+    user_id = session['user_id']
+    return list(assigned_quizzes_cache.get_or_load(user_id, lambda: [
+        row._asdict() for row in db.session.execute(assigned_quizzes_statement(user_id))
+    ]))
 
 @exception_handler
-def list_quizzes():
+def list_quizzes(**kwargs):
     """
-    Function that lists all the quizzes.
-    
+    Function that lists one page of the quizzes in (created_ts, id) order.
+
+    Parameters:
+        **kwargs (dict): Optional keyword arguments.
+            - cursor (str): The next_cursor of the previous page, omitted for the first page.
+            - limit (int): The page size.
+            - is_active (int): Only list quizzes with this is_active flag.
+
     Returns:
-        list: A list of dictionaries containing the details of each quiz. Each dictionary has the following keys:
+        dict: 'response' holds a list of dictionaries containing the details of each quiz. Each dictionary has the following keys:
             - id (int): The unique identifier of the quiz.
             - quiz_name (str): The name of the quiz.
             - is_active (bool): Indicates whether the quiz is active or not.
             - created_at (datetime): The timestamp when the quiz was created.
             - updated_at (datetime): The timestamp when the quiz was last updated.
+        'next_cursor' is None on the last page.
+
+    Notes:
+        - The pages are served from quiz_list_cache, dropped when a quiz is added. With the 'version' of
+          `quizzes_version`, a cached page of another version is loaded again.
+    """
+    key = (kwargs.get('cursor'), kwargs.get('limit'), kwargs.get('is_active'))
+    page = quiz_list_cache.get_or_load(key, lambda: _load_quizzes(kwargs))
+    if kwargs.get('version') is not None and page['version'] != kwargs['version']:
+        page = _load_quizzes(kwargs)
+        quiz_list_cache.set(key, page)
+    return {'response': list(page['response']), 'next_cursor': page['next_cursor']}
+
+@exception_handler
+def quizzes_version(**kwargs):
+    """
+    The version of a page of `list_quizzes`, for the validators of /all.quizzes, with one aggregate query.
+
+    Returns:
+        tuple: The newest updated_ts of the page's rows and their number.
     """
-    quizzes = QuizMaster.query.all()
+    return version_from_aggregate(db.session.execute(version_statement(quizzes_page_statement(kwargs))).one())
+
+def quizzes_page_statement(kwargs):
+    """
+    The keyset select of a page of `list_quizzes`.
+    """
+    statement = _apply_filters(select(QuizMaster), QuizMaster, kwargs, ('is_active',))
+    return paginate(statement, QuizMaster, kwargs.get('cursor'), kwargs.get('limit'))
+
+def _load_quizzes(kwargs):
+    """
+    Load one page of the quizzes with one keyset query.
+    """
+    quizzes = db.session.execute(quizzes_page_statement(kwargs)).scalars().all()
+    return quizzes_page(quizzes, kwargs.get('limit'))
+
+def quizzes_page(quizzes, limit):
+    """
+    Shapes the rows of `quizzes_page_statement` into the page of `list_quizzes`, with the settled version
+    of the rows.
+    """
+    version = settled_version((quiz.updated_ts for quiz in quizzes), len(quizzes))
+    quizzes, next_cursor = split_page(quizzes, limit)
     quiz_list = list()
     for quiz in quizzes:
         quiz = {
@@ -305,12 +768,12 @@ def list_quizzes():
             'updated_at': quiz.updated_ts
         }
         quiz_list.append(quiz)
-    return quiz_list
+    return {'response': quiz_list, 'next_cursor': next_cursor, 'version': version}
 
 @exception_handler
 def attempt_quiz(**kwargs):
     """
-    Attempt a quiz and save the user's responses.
+    Attempt a quiz and save the user's responses. A submission is final.
 
     Args:
         **kwargs (dict): Keyword arguments containing the quiz ID and user's responses.
@@ -318,47 +781,216 @@ def attempt_quiz(**kwargs):
     Returns:
         QuizInstance: The updated QuizInstance object.
 
-        Int: 0 if the user is not authorized to attempt the quiz.
-    """
-    quiz = QuizMaster.query.filter_by(id=kwargs['quiz_id']).first()
-    quiz_instance = QuizInstance.query.filter_by(quiz_id=quiz.id).first()
-    if quiz_instance.user_id == session['user_id']:
-        responses = kwargs['responses'][0]
-        for question_id, choice in responses.items():
-            quiz_question = QuestionMaster.query.filter_by(id=question_id).first()
-            user_response = UserResponses(
-                id=str(uuid.uuid4()),
-                quiz_id=quiz.id,
-                user_id=session['user_id'], 
-                question_id=question_id,
-                response=int(choice)
-            )
-            db.session.add(user_response)
-            if int(quiz_question.answer) == int(choice):
-                quiz_instance.score_achieved += quiz_question.marks
-        quiz_instance.is_submitted = 1
-        quiz_instance.is_active = 0
-        quiz_instance.updated_ts = datetime.datetime.utcnow()
-    else:
+        Int: 0 if the user is not authorized to attempt the quiz or has already submitted it.
+
+    Notes:
+        - The answers autosaved and still buffered are stored with the responses of the request,
+          which win, in one executemany upsert; the submission is then scored from the stored
+          responses against the cached answer key of the quiz.
+        - A member of a group the quiz is assigned to gets a quiz instance on the first submission.
+        - The assignment is locked before its responses, like in the autosave flush, and marked
+          submitted only if it was not, in the same update as its score, so that a concurrent second
+          submission is rolled back with its responses.
+        - The statistics of the quiz are updated in the same transaction, with one upsert.
+        - The autosaved answers taken for the submission are buffered again if it is not recorded.
+    """
+    quiz_instance = QuizInstance.query.filter_by(quiz_id=kwargs['quiz_id'], user_id=session['user_id']) \
+        .with_for_update().first()
+    if quiz_instance is None:
+        quiz_instance = groups.instance_from_group(kwargs['quiz_id'], session['user_id'])
+    if quiz_instance is None or quiz_instance.is_submitted == 1:
         return 0
-    db.session.commit()
+    quiz_id, user_id = quiz_instance.quiz_id, quiz_instance.user_id
+    buffered = autosave_buffer.take(quiz_id, user_id)
+    responses = dict(buffered)
+    responses.update(kwargs['responses'][0] if kwargs.get('responses') else dict())
+    try:
+        score = grade_submission(quiz_instance, responses)
+        submitted_ts = datetime.datetime.utcnow()
+        recorded = mark_submitted(db.session, quiz_instance, score, submitted_ts)
+        if recorded:
+            quizstats.record(db.session, [(quiz_id, score)])
+            db.session.commit()
+    except Exception:
+        db.session.rollback()
+        autosave_buffer.restore(quiz_id, user_id, buffered)
+        raise
+    if not recorded:
+        db.session.rollback()
+        autosave_buffer.restore(quiz_id, user_id, buffered)
+        return 0
+    set_committed_value(quiz_instance, 'score_achieved', score)  # read by the response, without reloading the row
+    invalidate_assignments([user_id])
+    leaderboard.submit(quiz_id, user_id, score, submitted_ts)
     return quiz_instance
 
 @exception_handler
-def all_quiz_result():
+def submit_quiz(**kwargs):
+    """
+    Submits a quiz for asynchronous grading: the answer sheet, with the answers autosaved and still
+    buffered, is stored with one insert and graded by the workers of the grading queue. A submission
+    is final, the grading fails the receipts of an assignment submitted meanwhile.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the quiz ID and user's responses.
+
+    Returns:
+        SubmissionReceipt: The receipt of the submission, whose id reads its status.
+
+        Int: 0 if the quiz is not assigned to the user or is already submitted.
+    """
+    if not db.session.execute(answerable_statement(kwargs['quiz_id'], session['user_id'])).scalar():
+        return 0
+    buffered = autosave_buffer.take(kwargs['quiz_id'], session['user_id'])
+    responses = dict(buffered)
+    responses.update(kwargs['responses'][0] if kwargs.get('responses') else dict())
+    receipt = new_receipt(kwargs['quiz_id'], session['user_id'], responses)
+    try:
+        db.session.add(receipt)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        autosave_buffer.restore(kwargs['quiz_id'], session['user_id'], buffered)
+        raise
+    grading_queue.put(receipt.id)
+    return receipt
+
+@exception_handler
+def submission_status(**kwargs):
     """
-    Retrieves all quiz results from the database.
+    Reads the status of a submission sent for asynchronous grading, and its score once graded.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the receipt ID.
+
+    Returns:
+        list: The status of the receipt, with quiz_id, status (queued, grading, graded or failed), score_achieved,
+            error, submitted_ts and graded_ts.
+
+        Int: 0 if the receipt does not exist or, for a user, belongs to another user.
+    """
+    receipt = db.session.get(SubmissionReceipt, kwargs['receipt_id'])
+    if receipt is None or (session['is_admin'] != 1 and receipt.user_id != session['user_id']):
+        return 0
+    return [receipt_status(receipt)]
+
+@exception_handler
+def autosave_answers(**kwargs):
+    """
+    Saves answers of the user during an exam, one question or a few at a time. The answers are buffered
+    in process and written to user_responses in batches; the submission grades them.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the quiz ID and the answers, a mapping of
+            question id to the chosen option.
+
+    Returns:
+        list: The ids of the saved questions, answers to questions which are not part of the quiz left out.
+
+        Int: 0 if the quiz is not assigned to the user or is already submitted.
+    """
+    if not db.session.execute(answerable_statement(kwargs['quiz_id'], session['user_id'])).scalar():
+        return 0
+    answer_key = get_answer_key(kwargs['quiz_id'])
+    answers = {question_id: choice for question_id, choice in kwargs['answers'].items()
+               if question_id in answer_key.index}
+    autosave_buffer.save(kwargs['quiz_id'], session['user_id'], answers)
+    return list(answers)
+
+@exception_handler
+def regrade_quiz(**kwargs):
+    """
+    Re-grades every submission of a quiz, for instance after an answer correction.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the quiz ID.
 
     Returns:
-        list: A list of dictionaries containing detailed information about each quiz instance.
+        int: The number of re-graded submissions.
+    """
+    regraded = regrade_submissions(kwargs['quiz_id'])
+    invalidate_assignments()
+    leaderboard.refresh(kwargs['quiz_id'], interval=0)
+    return regraded
+
+@exception_handler
+def quiz_statistics(**kwargs):
+    """
+    Reads the statistics of the submissions of a quiz, kept up to date by the gradings: two indexed
+    lookups whatever the number of submissions, with the cached answer key for the total marks.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the quiz ID.
+
+    Returns:
+        list: The statistics with quiz_id, submitted_count, mean, variance, std_dev,
+              min_score, max_score, total_marks, pass_mark, pass_rate and the histogram of the scores
+              (min_score, max_score and count of every bucket).
+
+        int: 0 if the quiz does not exist.
+    """
+    if db.session.execute(quizstats.quiz_id_statement(kwargs['quiz_id'])).first() is None:
+        return 0
+    score_counts = db.session.execute(quizstats.score_counts_statement(kwargs['quiz_id'])).all()
+    return [quizstats.summary(kwargs['quiz_id'], score_counts, get_answer_key(kwargs['quiz_id']).total_marks)]
+
+@exception_handler
+def quiz_leaderboard(**kwargs):
+    """
+    Reads the leaderboard of a quiz, served from the in-process ordered board, rebuilt first if it is
+    older than LEADERBOARD_REFRESH_INTERVAL seconds.
+
+    Args:
+        **kwargs (dict): Keyword arguments containing the query.
+            - quiz_id (str): The ID of the quiz.
+            - mode (str): 'top' for the k best submissions, 'rank' for the rank and percentile of user_id,
+              'around' for the submissions within window ranks of rank, 'not_attempted' for the assigned
+              users without a submission, from offset on and at most limit of them.
+
+    Returns:
+        list: The leaderboard entries with rank, user_id, score_achieved and submitted_ts (plus total and
+              percentile in 'rank' mode), or the
+              user ids of the users who have not attempted the quiz.
+
+        int: 0 if the user has no submission in 'rank' mode.
+    """
+    quiz_id, mode = kwargs['quiz_id'], kwargs['mode']
+    leaderboard.refresh(quiz_id)
+    if mode == 'top':
+        return leaderboard.top(quiz_id, kwargs['k'])
+    if mode == 'rank':
+        entry = leaderboard.rank(quiz_id, kwargs.get('user_id') or session['user_id'])
+        return [entry] if entry else 0
+    if mode == 'around':
+        return leaderboard.around(quiz_id, kwargs['rank'], kwargs['window'])
+    pending = leaderboard.not_attempted(quiz_id, kwargs['offset'], kwargs['limit'])
+    return [{'user_id': user_id, 'total': pending['total']} for user_id in pending['user_ids']]
+
+@exception_handler
+def all_quiz_result(**kwargs):
+    """
+    Retrieves one page of quiz results from the database in (created_ts, id) order.
+
+    Parameters:
+        **kwargs (dict): Optional keyword arguments.
+            - cursor (str): The next_cursor of the previous page, omitted for the first page.
+            - limit (int): The page size.
+            - quiz_id, user_id, is_submitted, is_active: Only list quiz instances with these values.
+
+    Returns:
+        dict: 'response' holds a list of dictionaries containing detailed information about each quiz instance.
               Each dictionary contains the following keys:
               - id (int): The ID of the quiz instance.
               - quiz_id (int): The ID of the quiz associated with the instance.
               - user_id (int): The ID of the user who took the quiz.
               - score_achieved (int): The score achieved by the user in the quiz.
               - is_submitted (bool): Indicates whether the quiz was submitted by the user.
+              'next_cursor' is None on the last page.
     """
-    quiz_instances = QuizInstance.query.all()
+    statement = _apply_filters(select(QuizInstance), QuizInstance, kwargs,
+                               ('quiz_id', 'user_id', 'is_submitted', 'is_active'))
+    statement = paginate(statement, QuizInstance, kwargs.get('cursor'), kwargs.get('limit'))
+    quiz_instances, next_cursor = split_page(db.session.execute(statement).scalars().all(), kwargs.get('limit'))
     detailed_quiz_instance_list = list()
     for quiz_instance in quiz_instances:
         quiz_instance = {
@@ -369,6 +1001,22 @@ def all_quiz_result():
             'is_submitted': quiz_instance.is_submitted,
         }
         detailed_quiz_instance_list.append(quiz_instance)
-    return detailed_quiz_instance_list
+    return {'response': detailed_quiz_instance_list, 'next_cursor': next_cursor}
+
+@exception_handler
+def export_quiz_results(**kwargs):
+    """
+    Prepares a streamed export of the quiz results with quiz and user names.
 
-        
\ No newline at end of file
+    Parameters:
+        **kwargs (dict): Keyword arguments containing the export options.
+            - format (str): 'ndjson' or 'csv'.
+            - quiz_id (str): Optional, only export the results of this quiz.
+            - date_from (datetime): Optional, only export results updated at or after this time.
+            - date_to (datetime): Optional, only export results updated before this time.
+
+    Returns:
+        tuple: The mimetype of the export and the generator of its encoded chunks.
+    """
+    chunks = export_results(kwargs['format'], kwargs.get('quiz_id'), kwargs.get('date_from'), kwargs.get('date_to'))
+    return EXPORT_FORMATS[kwargs['format']], chunks
@@ -0,0 +1,234 @@
+import uuid
+from abc import ABC, abstractmethod
+
+from flask import session
+from sqlalchemy import bindparam, insert, select, update
+
+from app import application
+from app.cache import LRUCache
+from app.groupcommit import group_committer
+from app.keys import new_id
+from app.models import UserMaster, UserSession, db
+
+"""
+[Sessions Module] Server side session store. The signed cookie only carries the session id; on
+                    every request the id is validated against the store, which answers from a process
+                    local LRU cache with a TTL and only reads user_session (joined with user_master for
+                    the admin flag) on a miss. Logins and logouts write through to both. A revoked
+                    session or a demoted admin is therefore enforced at once in the process making the
+                    change and within SESSION_CACHE_TTL seconds everywhere else.
+                    The writes of a login (the session row and the user's is_active flag) go through
+                    the group committer unless LOGIN_GROUP_COMMIT is disabled.
+                    The *_async methods are the same operations on an AsyncSession for the ASGI mode,
+                    sharing the cache with the WSGI ones.
+"""
+
+SESSION_CACHE_SIZE = 10000
+SESSION_CACHE_TTL = 60
+
+"""
+Cached value of a session which is unknown or revoked, so that replays do not reach the database
+"""
+REVOKED = {'user_id': None, 'is_admin': 0, 'revoked': True}
+
+INSERT_SESSION = insert(UserSession.__table__)
+ACTIVATE_USER = (
+    update(UserMaster.__table__)
+    .where(UserMaster.__table__.c.id == bindparam('b_user_id'))
+    .values(is_active=1)
+)
+
+
+class SessionStore(ABC):
+    """
+    Interface of a session store. `get` returns a dictionary with user_id and is_admin, or None
+    if the session is unknown or revoked.
+    """
+
+    @abstractmethod
+    def create(self, user, *operations):
+        pass
+
+    @abstractmethod
+    def get(self, session_id):
+        pass
+
+    @abstractmethod
+    def revoke(self, session_id):
+        pass
+
+    @abstractmethod
+    def revoke_user(self, user_id):
+        pass
+
+    @abstractmethod
+    def refresh_user(self, user_id):
+        pass
+
+    @abstractmethod
+    async def create_async(self, db_session, user, *operations):
+        pass
+
+    @abstractmethod
+    async def get_async(self, db_session, session_id, cookie):
+        pass
+
+    @abstractmethod
+    async def revoke_async(self, db_session, session_id):
+        pass
+
+
+class CookieSessionStore(SessionStore):
+    """
+    The historical behaviour: sessions are recorded in user_session but never consulted,
+    the signed cookie alone is trusted.
+    """
+
+    def create(self, user, *operations):
+        """
+        Record a new session of the user, mark the user active and commit, together with the given
+        extra (statement, parameters) operations.
+
+        Returns:
+            str: The new session id.
+        """
+        session_id, operations = self._login_operations(user, operations)
+        if application.config.get('LOGIN_GROUP_COMMIT', True):
+            db.session.close()  # do not hold a read transaction the shared commit would wait on
+            group_committer.write(*operations)
+        else:
+            for statement, params in operations:
+                db.session.execute(statement, params)
+            db.session.commit()
+        return session_id
+
+    def _login_operations(self, user, operations):
+        session_id = str(uuid.uuid4())
+        return session_id, (
+            (INSERT_SESSION, {'id': new_id(), 'user_id': user.id, 'session_id': session_id, 'is_active': 1}),
+            (ACTIVATE_USER, {'b_user_id': user.id}),
+        ) + operations
+
+    def get(self, session_id):
+        return {'user_id': session.get('user_id'), 'is_admin': session.get('is_admin')}
+
+    def revoke(self, session_id):
+        db.session.execute(update(UserSession).where(UserSession.session_id == session_id).values(is_active=0))
+
+    def revoke_user(self, user_id):
+        db.session.execute(update(UserSession).where(UserSession.user_id == user_id).values(is_active=0))
+
+    def refresh_user(self, user_id):
+        pass
+
+    async def create_async(self, db_session, user, *operations):
+        session_id, operations = self._login_operations(user, operations)
+        for statement, params in operations:
+            await db_session.execute(statement, params)
+        await db_session.commit()
+        return session_id
+
+    async def get_async(self, db_session, session_id, cookie):
+        return {'user_id': cookie.get('user_id'), 'is_admin': cookie.get('is_admin')}
+
+    async def revoke_async(self, db_session, session_id):
+        await db_session.execute(update(UserSession).where(UserSession.session_id == session_id).values(is_active=0))
+
+
+class DatabaseSessionStore(CookieSessionStore):
+    """
+    Sessions validated against user_session through an LRU + TTL cache.
+    """
+
+    def __init__(self, maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL):
+        self.cache = LRUCache(maxsize, ttl)
+
+    def create(self, user, *operations):
+        session_id = super().create(user, *operations)
+        self.cache.set(session_id, {'user_id': user.id, 'is_admin': user.is_admin})
+        return session_id
+
+    def _lookup(self, session_id):
+        return (
+            select(UserSession.user_id, UserMaster.is_admin)
+            .join(UserMaster, UserMaster.id == UserSession.user_id)
+            .where(UserSession.session_id == session_id, UserSession.is_active == 1)
+        )
+
+    def _remember(self, session_id, row):
+        record = {'user_id': row.user_id, 'is_admin': row.is_admin} if row else REVOKED
+        self.cache.set(session_id, record)
+        return record
+
+    def get(self, session_id):
+        record = self.cache.get(session_id)
+        if record is None:
+            record = self._remember(session_id, db.session.execute(self._lookup(session_id)).first())
+        return None if record is REVOKED else record
+
+    def revoke(self, session_id):
+        super().revoke(session_id)
+        self.cache.set(session_id, REVOKED)
+
+    def revoke_user(self, user_id):
+        super().revoke_user(user_id)
+        self.cache.invalidate_where(lambda record: record['user_id'] == user_id)
+
+    def refresh_user(self, user_id):
+        self.cache.invalidate_where(lambda record: record['user_id'] == user_id)
+
+    async def create_async(self, db_session, user, *operations):
+        session_id = await super().create_async(db_session, user, *operations)
+        self.cache.set(session_id, {'user_id': user.id, 'is_admin': user.is_admin})
+        return session_id
+
+    async def get_async(self, db_session, session_id, cookie):
+        record = self.cache.get(session_id)
+        if record is None:
+            record = self._remember(session_id, (await db_session.execute(self._lookup(session_id))).first())
+        return None if record is REVOKED else record
+
+    async def revoke_async(self, db_session, session_id):
+        await super().revoke_async(db_session, session_id)
+        self.cache.set(session_id, REVOKED)
+
+
+SESSION_STORES = {
+    'database': DatabaseSessionStore,
+    'cookie': CookieSessionStore,
+}
+
+
+def make_session_store(name):
+    """
+    Build the session store registered under the given name.
+
+    Raises:
+        ValueError: If no store is registered under that name.
+    """
+    if name not in SESSION_STORES:
+        raise ValueError(f'SESSION_STORE must be one of {", ".join(SESSION_STORES)}')
+    if name == 'database':
+        return DatabaseSessionStore(application.config.get('SESSION_CACHE_SIZE', SESSION_CACHE_SIZE),
+                                    application.config.get('SESSION_CACHE_TTL', SESSION_CACHE_TTL))
+    return SESSION_STORES[name]()
+
+
+session_store = make_session_store(application.config.get('SESSION_STORE', 'database'))
+
+
+@application.before_request
+def validate_session():
+    """
+    Drop the login of a revoked session and refresh the admin flag of a live one.
+    """
+    session_id = session.get('session_id')
+    if not session_id:
+        return
+    record = session_store.get(session_id)
+    if record is None:
+        session.clear()
+        return
+    if session.get('user_id') != record['user_id'] or session.get('is_admin') != record['is_admin']:
+        session['user_id'] = record['user_id']
+        session['is_admin'] = record['is_admin']
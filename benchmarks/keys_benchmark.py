@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Index, Integer, MetaData, Table, UniqueConstraint, create_engine, insert, text
+
+from app.keys import KEY_MODES, Key, new_id
+
+"""
+[Keys Benchmark] Compares the key modes of app.keys on a table shaped like user_responses, the largest
+                    table: insert rate with the keys each mode generates, and the on-disk size of the
+                    table and of each of its indexes.
+
+                    usage: python benchmarks/keys_benchmark.py [--rows 100000] [--url DATABASE_URL] [--output FILE]
+                    Without --url every mode runs against a fresh SQLite file. A MySQL url reports the
+                    InnoDB data and index length from information_schema.
+"""
+
+
+def responses_table(metadata, mode):
+    return Table(
+        'bench_user_responses', metadata,
+        Column('id', Key(100, mode), primary_key=True),
+        Column('quiz_id', Key(200, mode), nullable=False),
+        Column('user_id', Key(200, mode), nullable=False),
+        Column('question_id', Key(200, mode), nullable=False),
+        Column('response', Integer, nullable=False),
+        UniqueConstraint('quiz_id', 'user_id', 'question_id', name='bench_unique_quiz_user_question'),
+        Index('bench_ix_quiz_user', 'quiz_id', 'user_id', 'question_id', 'response'),
+    )
+
+
+def sizes(engine, table):
+    with engine.connect() as connection:
+        if engine.dialect.name == 'sqlite':
+            rows = connection.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name'))
+            return {name: size for name, size in rows if name == table.name or name.startswith(('bench_', 'sqlite_autoindex_bench'))}
+        connection.execute(text(f'ANALYZE TABLE {table.name}'))
+        row = connection.execute(text(
+            'SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES '
+            'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name'), {'name': table.name}).one()
+        return {'data': row[0], 'indexes': row[1]}
+
+
+def run(mode, url, rows, batch):
+    engine = create_engine(url)
+    metadata = MetaData()
+    table = responses_table(metadata, mode)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    quizzes = [new_id(mode) for _ in range(20)]
+    questions = [new_id(mode) for _ in range(50)]
+    users = [new_id(mode) for _ in range(max(1, rows // len(questions)))]
+    started = time.perf_counter()
+    inserted = 0
+    with engine.connect() as connection:
+        while inserted < rows:
+            chunk = [
+                {'id': new_id(mode), 'quiz_id': random.choice(quizzes), 'user_id': users[(inserted + i) // len(questions)],
+                 'question_id': questions[(inserted + i) % len(questions)], 'response': random.randint(1, 4)}
+                for i in range(min(batch, rows - inserted))
+            ]
+            connection.execute(insert(table), chunk)
+            connection.commit()
+            inserted += len(chunk)
+    elapsed = time.perf_counter() - started
+    result = {'mode': mode, 'rows': rows, 'rows_per_sec': round(rows / elapsed, 1), 'bytes': sizes(engine, table)}
+    metadata.drop_all(engine)
+    engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the key modes of app.keys')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch', type=int, default=1000)
+    parser.add_argument('--url', default=None, help='Database url, a fresh SQLite file per mode by default')
+    parser.add_argument('--output', default=None, help='Write the results as json to this file')
+    args = parser.parse_args()
+    results = list()
+    for mode in KEY_MODES:
+        with tempfile.TemporaryDirectory() as directory:
+            url = args.url or f"sqlite:///{os.path.join(directory, 'bench.db')}"
+            result = run(mode, url, args.rows, args.batch)
+        results.append(result)
+        print(f"{mode:8} {result['rows_per_sec']:>10} rows/sec  " +
+              '  '.join(f'{name}={size}' for name, size in result['bytes'].items()))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, or_, select
+
+from app import application, passwords
+from app.keys import new_id
+from app.models import QuestionMaster, QuizInstance, QuizMaster, QuizQuestions, UserMaster, UserResponses, UserSession, db
+from app.provisioning import provision_users
+import app.apis  # registers the resources on the application
+
+"""
+[Load Test] Simulates an exam cohort end to end, in process through Flask test clients or over HTTP
+                against a running server (WSGI or ASGI mode):
+                    students   - /login, /assigned.quizzes, /view.quiz, /attempt.quiz and /logout, at most
+                                 --concurrency students at a time, their starts spread over --ramp-up seconds
+                    admins     - /create.quiz, /assign.quiz and /quiz.results in a loop while the students run
+
+                usage: python benchmarks/load_test.py [--students 200] [--concurrency 50] [--ramp-up 10]
+                                                      [--admins 2] [--url http://127.0.0.1:8000]
+                                                      [--hash-method pbkdf2:sha256:600000]
+                                                      [--output report.json] [--baseline old.json]
+                The users are provisioned in DATABASE_URL, which has to be the database of the server with --url,
+                and removed at the end together with the quizzes of the run. Their passwords are hashed with
+                --hash-method; a server configured with another PASSWORD_HASH_METHOD rehashes them on login. The report holds throughput and
+                p50/p95/p99 latency per endpoint as json with sorted keys, so the reports of two commits diff
+                cleanly; --baseline compares the p95 latencies with such a report and fails on a regression
+                above --max-regression percent.
+"""
+
+PREFIX = 'load_test_'
+
+
+class InProcessClient:
+    """
+    A Flask test client, with its own cookie jar.
+    """
+
+    def __init__(self):
+        self.client = application.test_client()
+
+    def post(self, path, body=None):
+        response = self.client.post(path, json=body or {})
+        return response.status_code, response.get_json(silent=True)
+
+
+class HttpClient:
+    """
+    An HTTP client of a running server, with its own cookie jar.
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def post(self, path, body=None):
+        request = urllib.request.Request(self.url + path, data=json.dumps(body or {}).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            response = self.opener.open(request, timeout=60)
+        except urllib.error.HTTPError as e:
+            response = e
+        with response:
+            payload = response.read()
+        try:
+            return response.status, json.loads(payload)
+        except ValueError:
+            return response.status, None
+
+
+class Recorder:
+    """
+    Latencies and failures per endpoint, shared by every simulated user.
+    """
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.failures = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def call(self, client, path, body=None, expected=(200,)):
+        started = time.perf_counter()
+        try:
+            status, payload = client.post(path, body)
+        except Exception as e:
+            status, payload = None, {'message': str(e)}
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[path].append(elapsed)
+            if status not in expected:
+                self.failures[path] += 1
+        return status, payload
+
+
+def percentile(values, fraction):
+    """
+    The nearest rank percentile of sorted values.
+    """
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))]
+
+
+def summarize(recorder, elapsed):
+    endpoints = dict()
+    for path, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        endpoints[path] = {
+            'requests': len(latencies),
+            'failures': recorder.failures[path],
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return endpoints
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def create_users(students, admins, run_id):
+    """
+    Provision the students and admins of the run.
+
+    Returns:
+        tuple: The student rows and the admin rows, with their ids and plain text passwords.
+    """
+    def user(kind, i, is_admin):
+        username = f'{PREFIX}{run_id}_{kind}{i}'
+        return {'id': new_id(), 'name': username, 'username': username, 'password': username,
+                'is_admin': is_admin}
+
+    student_rows = [user('student', i, 0) for i in range(students)]
+    admin_rows = [user('admin', i, 1) for i in range(max(1, admins))]
+    report = provision_users([dict(row) for row in student_rows + admin_rows])
+    if report.errors:
+        raise SystemExit(f'provisioning the users failed: {report.errors[:5]}')
+    return student_rows, admin_rows
+
+
+def remove_run():
+    """
+    Remove the users and quizzes of every run, with their sessions, assignments and responses.
+    """
+    user_ids = select(UserMaster.id).where(UserMaster.username.startswith(PREFIX))
+    quiz_ids = select(QuizMaster.id).where(QuizMaster.quiz_name.startswith(PREFIX))
+    for model in (UserResponses, QuizInstance):
+        db.session.execute(delete(model).where(or_(model.user_id.in_(user_ids), model.quiz_id.in_(quiz_ids))))
+    db.session.execute(delete(QuizQuestions).where(QuizQuestions.quiz_id.in_(quiz_ids)))
+    db.session.execute(delete(QuizMaster).where(QuizMaster.quiz_name.startswith(PREFIX)))
+    db.session.execute(delete(UserSession).where(UserSession.user_id.in_(user_ids)))
+    db.session.execute(delete(UserMaster).where(UserMaster.username.startswith(PREFIX)))
+    db.session.commit()
+
+
+def login(client, user):
+    status, payload = client.post('/login', {'username': user['username'], 'password': user['password']})
+    if status != 200:
+        raise SystemExit(f"{user['username']} could not log in: {payload}")
+    return client
+
+
+def create_quiz(client, quiz_name, question_ids, recorder=None):
+    """
+    Create a quiz through the API.
+
+    Returns:
+        str: The id of the quiz.
+    """
+    body = {'quiz_name': quiz_name, 'question_ids': question_ids}
+    status, payload = recorder.call(client, '/create.quiz', body) if recorder else client.post('/create.quiz', body)
+    if status != 200:
+        raise SystemExit(f'creating {quiz_name} failed: {payload}')
+    with application.app_context():
+        return db.session.execute(select(QuizMaster.id).where(QuizMaster.quiz_name == quiz_name)).scalar()
+
+
+def student_flow(client, recorder, student, quiz_id):
+    recorder.call(client, '/login', {'username': student['username'], 'password': student['password']})
+    recorder.call(client, '/assigned.quizzes')
+    status, payload = recorder.call(client, '/view.quiz', {'quiz_id': quiz_id})
+    questions = (payload or {}).get('response') or []
+    answers = {question['question_id']: str(random.randint(1, 4)) for question in questions}
+    recorder.call(client, '/attempt.quiz', {'quiz_id': quiz_id, 'responses': [answers]})
+    recorder.call(client, '/logout')
+
+
+def admin_loop(client, recorder, students, quiz_id, question_ids, stop, run_id, number):
+    iteration = 0
+    while not stop.is_set():
+        iteration += 1
+        new_quiz_id = create_quiz(client, f'{PREFIX}{run_id}_quiz{number}_{iteration}', question_ids, recorder)
+        sample = random.sample(students, min(10, len(students)))
+        recorder.call(client, '/assign.quiz', {'instance': {new_quiz_id: [student['id'] for student in sample]}})
+        recorder.call(client, '/quiz.results', {'quiz_id': quiz_id, 'limit': 100})
+
+
+def run(args):
+    """
+    Provision the cohort, create and assign the exam, run the students and admins and remove the run.
+
+    Returns:
+        dict: The report.
+    """
+    run_id = uuid.uuid4().hex[:8]
+    make_client = (lambda: HttpClient(args.url)) if args.url else InProcessClient
+    with application.app_context():
+        remove_run()
+        students, admins = create_users(args.students, args.admins, run_id)
+        question_ids = list(db.session.execute(
+            select(QuestionMaster.id).order_by(QuestionMaster.created_ts, QuestionMaster.id).limit(args.questions)
+        ).scalars())
+    if not question_ids:
+        raise SystemExit('the question bank is empty, import questions first (python main.py questions.csv)')
+
+    admin_clients = [login(make_client(), admin) for admin in admins]
+    quiz_id = create_quiz(admin_clients[0], f'{PREFIX}{run_id}_exam', question_ids)
+    status, payload = admin_clients[0].post('/assign.quiz', {'instance': {quiz_id: [row['id'] for row in students]}})
+    if status != 200:
+        raise SystemExit(f'assigning the exam failed: {payload}')
+
+    recorder = Recorder()
+    stop = threading.Event()
+    pending = list(enumerate(students))
+    lock = threading.Lock()
+    interval = args.ramp_up / max(1, len(students))
+
+    def student_worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                index, student = pending.pop(0)
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            student_flow(make_client(), recorder, student, quiz_id)
+
+    admin_threads = [threading.Thread(target=admin_loop, args=(client, recorder, students, quiz_id, question_ids,
+                                                               stop, run_id, number))
+                     for number, client in enumerate(admin_clients[:args.admins])]
+    workers = [threading.Thread(target=student_worker) for _ in range(max(1, min(args.concurrency, len(students))))]
+    started = time.perf_counter()
+    for thread in admin_threads + workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    stop.set()
+    for thread in admin_threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with application.app_context():
+        remove_run()
+    endpoints = summarize(recorder, elapsed)
+    requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'commit': git_commit(),
+        'transport': 'http' if args.url else 'in-process',
+        'students': args.students,
+        'concurrency': args.concurrency,
+        'ramp_up_s': args.ramp_up,
+        'admins': args.admins,
+        'questions': len(question_ids),
+        'elapsed_s': round(elapsed, 2),
+        'requests': requests,
+        'throughput_rps': round(requests / elapsed, 2),
+        'failures': sum(endpoint['failures'] for endpoint in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+def compare(report, baseline, max_regression):
+    """
+    Print the p95 change of every endpoint against a baseline report.
+
+    Returns:
+        list: The endpoints whose p95 latency regressed by more than max_regression percent.
+    """
+    regressions = list()
+    for path, endpoint in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(path)
+        if not before or not before['p95_ms']:
+            continue
+        change = (endpoint['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        print(f"{path:20} p95 {before['p95_ms']:>9} -> {endpoint['p95_ms']:>9} ms  ({change:+.1f}%)")
+        if change > max_regression:
+            regressions.append(path)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate an exam cohort against the quiz portal')
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50, help='Students running their flow at once')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which the students start')
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--questions', type=int, default=10, help='Questions in the exam quiz')
+    parser.add_argument('--url', default=None, help='Base url of a running server, in process by default')
+    parser.add_argument('--hash-method', default=passwords.HASH_METHOD)
+    parser.add_argument('--output', default=None, help='Write the report as json to this file')
+    parser.add_argument('--baseline', default=None, help='A previous report to compare the p95 latencies with')
+    parser.add_argument('--max-regression', type=float, default=20, help='Allowed p95 regression in percent')
+    args = parser.parse_args()
+    passwords.HASH_METHOD = args.hash_method
+    report = run(args)
+    print(f"{report['requests']} requests in {report['elapsed_s']}s, {report['throughput_rps']} req/s, "
+          f"{report['failures']} failures")
+    for path, endpoint in report['endpoints'].items():
+        print(f"{path:20} {endpoint['requests']:>7} req {endpoint['throughput_rps']:>9} req/s  "
+              f"p50={endpoint['p50_ms']}ms p95={endpoint['p95_ms']}ms p99={endpoint['p99_ms']}ms  "
+              f"failures={endpoint['failures']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(report, json.load(baseline), args.max_regression)
+        if regressions:
+            raise SystemExit(f"p95 latency regressed by more than {args.max_regression}% on {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, select
+
+from app import application, passwords
+from app.groupcommit import group_committer
+from app.keys import new_id
+from app.models import UserMaster, UserSession, db
+from app.provisioning import provision_users
+from app.services import login
+
+"""
+[Login Benchmark] Logins/sec of a login storm such as the start of an exam, against the configured database:
+                    legacy         - the former login: plain text username + password match in SQL and
+                                     one commit per login for the session row and is_active
+                    per-login      - hashed passwords verified on the password pool, one commit per login
+                    group-commit   - hashed passwords verified on the password pool, session rows and
+                                     is_active updates of concurrent logins committed together
+
+                    usage: python benchmarks/login_benchmark.py [--logins 1000] [--threads 32]
+                                                                [--hash-method pbkdf2:sha256:600000] [--output FILE]
+                    The benchmark users are created first and removed at the end. On a machine with few
+                    cores the hash cost dominates; a cheaper --hash-method isolates the database side.
+"""
+
+PREFIX = 'bench_login_'
+
+
+def legacy_login(username, password):
+    user = UserMaster.query.filter_by(username=username, password=password).first()
+    db.session.add(UserSession(id=new_id(), user_id=user.id, session_id=str(uuid.uuid4())))
+    user.is_active = 1
+    db.session.commit()
+    return 1
+
+
+def pipeline_login(username, password):
+    status, response = login(username=username, password=password)
+    return response
+
+
+def create_users(count, hashed):
+    users = ({'name': f'{PREFIX}{i}', 'username': f'{PREFIX}{i}', 'password': f'{PREFIX}{i}'} for i in range(count))
+    provision_users(users, hashed=hashed)
+
+
+def remove_users():
+    user_ids = select(UserMaster.id).where(UserMaster.username.startswith(PREFIX))
+    db.session.execute(delete(UserSession).where(UserSession.user_id.in_(user_ids)))
+    db.session.execute(delete(UserMaster).where(UserMaster.username.startswith(PREFIX)))
+    db.session.commit()
+
+
+def storm(func, logins, threads):
+    """
+    Log every benchmark user in once from `threads` concurrent threads.
+
+    Returns:
+        tuple: (elapsed seconds, per login latencies, failures)
+    """
+    latencies = list()
+    failures = list()
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(offset, logins, threads):
+            started = time.perf_counter()
+            with application.test_request_context():
+                try:
+                    ok = func(f'{PREFIX}{i}', f'{PREFIX}{i}') == 1
+                except Exception as e:
+                    ok = False
+                    with lock:
+                        failures.append(str(e))
+                finally:
+                    db.session.remove()
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    failures.append(f'{PREFIX}{i} was not logged in')
+
+    pool = [threading.Thread(target=worker, args=(offset,)) for offset in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return time.perf_counter() - started, latencies, failures
+
+
+def run(mode, logins, threads):
+    with application.app_context():
+        remove_users()
+        create_users(logins, hashed=mode != 'legacy')
+    application.config['LOGIN_GROUP_COMMIT'] = mode == 'group-commit'
+    batches = group_committer.batches
+    elapsed, latencies, failures = storm(legacy_login if mode == 'legacy' else pipeline_login, logins, threads)
+    with application.app_context():
+        remove_users()
+    latencies.sort()
+    return {
+        'mode': mode,
+        'logins': logins,
+        'threads': threads,
+        'logins_per_sec': round(logins / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        'group_commits': group_committer.batches - batches,
+        'failures': len(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the login pipeline')
+    parser.add_argument('--logins', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--hash-method', default=passwords.HASH_METHOD)
+    parser.add_argument('--output', default=None, help='Write the results as json to this file')
+    args = parser.parse_args()
+    passwords.HASH_METHOD = args.hash_method
+    results = list()
+    for mode in ('legacy', 'per-login', 'group-commit'):
+        result = run(mode, args.logins, args.threads)
+        results.append(result)
+        print(f"{mode:13} {result['logins_per_sec']:>9} logins/sec  p50={result['p50_ms']}ms  "
+              f"p99={result['p99_ms']}ms  group commits={result['group_commits']}  failures={result['failures']}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
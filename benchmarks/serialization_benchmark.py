@@ -0,0 +1,82 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import json as flask_json
+from marshmallow import Schema, fields
+
+from app import application
+from app.serialization import dumps
+
+"""
+[Serialization Benchmark] Cost of serializing list responses per 10k rows, for rows shaped like the
+                            responses of list_questions and all_quiz_result:
+                            schema per response   - a new schema per response stringifying every value,
+                                                    then flask.json (the former path)
+                            shared schema         - the same schema instantiated once, then flask.json
+                            shared encoder        - app.serialization.dumps, native types kept
+
+                    usage: python benchmarks/serialization_benchmark.py [--rows 10000] [--repeat 5] [--output FILE]
+                    The rows are synthetic; the database is only used by the application start up.
+"""
+
+
+def question_rows(count):
+    return [{'id': str(uuid.uuid4()), 'question': f'What is {i} + {i}?', 'choice1': str(i), 'choice2': str(2 * i),
+             'choice3': str(3 * i), 'choice4': str(4 * i), 'answer': 2} for i in range(count)]
+
+
+def result_rows(count):
+    now = datetime.datetime(2024, 1, 1, 9, 30)
+    return [{'id': str(uuid.uuid4()), 'quiz_id': str(uuid.uuid4()), 'user_id': str(10000 + i),
+             'score_achieved': i % 100, 'is_submitted': 1, 'created_ts': now, 'updated_ts': now} for i in range(count)]
+
+
+class FormerViewResponseSchema(Schema):
+    response = fields.List(fields.Dict(keys=fields.String(), values=fields.String()))
+    next_cursor = fields.String(allow_none=True)
+
+
+def schema_per_response(rows):
+    return flask_json.dumps(FormerViewResponseSchema().dump(dict(response=rows, next_cursor=None)))
+
+
+SHARED_SCHEMA = FormerViewResponseSchema()
+
+
+def shared_schema(rows):
+    return flask_json.dumps(SHARED_SCHEMA.dump(dict(response=rows, next_cursor=None)))
+
+
+def shared_encoder(rows):
+    return dumps(dict(response=rows, next_cursor=None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the serialization of list responses')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default=None, help='Write the results as json to this file')
+    args = parser.parse_args()
+    results = list()
+    with application.app_context():
+        for shape, rows in (('questions', question_rows(args.rows)), ('quiz results', result_rows(args.rows))):
+            for name, func in (('schema per response', schema_per_response), ('shared schema', shared_schema),
+                               ('shared encoder', shared_encoder)):
+                seconds = min(timeit.repeat(lambda: func(rows), number=1, repeat=args.repeat))
+                result = {'rows': shape, 'path': name, 'ms_per_10k_rows': round(seconds * 1000 * 10000 / args.rows, 2)}
+                results.append(result)
+                print(f"{shape:13} {name:20} {result['ms_per_10k_rows']:>9} ms per 10k rows")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
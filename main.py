@@ -2,14 +2,16 @@ from app import application
 from app.apis import (SignUpAPI, LoginAPI, LogoutAPI, AddQuestionAPI, ListQuestionAPI, CreateQuizAPI, 
                       AssignQuizAPI, ViewQuizAPI, ViewAssignedQuizAPI, ViewAllQuizAPI, AttemptQuizAPI, QuizResultAPI)
 from app.setup import add_questions
+import sys
 
 """
 [Driver Module] : It is responsible for stating the server for application for apis serving
+                  usage: python main.py [questions csv file, defaults to questions.csv]
 """
 if __name__ == "__main__":
     with application.app_context():
         try:
-            add_questions()
+            add_questions(*sys.argv[1:2])
         except Exception as e:
             print(f'{e} main file')
         
@@ -0,0 +1,12 @@
+import os
+
+import uvicorn
+
+from app.asgi import asgi_app
+
+"""
+[ASGI Driver Module] : It is responsible for starting the async server of the application, see app/asgi.py
+                       usage: python main_asgi.py   (PORT and HOST from the environment, 8000 on 127.0.0.1 by default)
+"""
+if __name__ == "__main__":
+    uvicorn.run(asgi_app, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,15 @@
+import os
+import shutil
+import tempfile
+
+"""
+The tests run against a throwaway SQLite database in a temporary directory, never the configured one:
+DATABASE_URL is overridden here, before any test module imports the application.
+"""
+
+DATABASE_DIRECTORY = tempfile.mkdtemp(prefix='quiz_portal_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(DATABASE_DIRECTORY, 'quiz.db')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DATABASE_DIRECTORY, ignore_errors=True)
@@ -0,0 +1,285 @@
+import contextlib
+
+import pytest
+from flask import session
+from sqlalchemy import event, insert
+
+from app import application, quizstats, services
+from app.autosave import autosave_buffer
+from app.cache import invalidate_assignments, invalidate_quiz, quiz_list_cache
+from app.importer import question_hash
+from app.keys import new_id
+from app.migrations import migrate
+from app.models import (GroupMember, GroupQuiz, QuestionMaster, QuizInstance, QuizMaster, QuizQuestions, UserGroup,
+                        UserMaster, db)
+
+"""
+[Query Budget Tests] Check that the number of SQL statements of a service call does not grow with the data.
+                        Every scenario below seeds data of a given size (quizzes assigned to a user, questions
+                        in a quiz, answers in a submission, rows in a table) in an empty database and calls one
+                        function of services.py with a cold cache while counting the statements it executes.
+                        A scenario fails when a call exceeds its budget or when it executes more statements
+                        on the larger data than on the smallest, which is how an N+1 query shows up.
+                        The database is the throwaway SQLite one of conftest.py, dropped and migrated again
+                        before every size.
+
+                        usage: python -m pytest tests/test_query_budget.py
+"""
+
+SIZES = (10, 1000, 10000)
+SHOWN_STATEMENTS = 10
+SCENARIOS = dict()
+
+
+def scenario(name, budget):
+    """
+    Register the seed function of a scenario. It seeds data of the given size and returns the
+    service function to call, the session of the calling user and the keyword arguments.
+
+    Args:
+        name (str): The name of the scenario.
+        budget (int): The most statements one call may execute, whatever the size.
+    """
+    def decorator(seed):
+        SCENARIOS[name] = (seed, budget)
+        return seed
+    return decorator
+
+
+def _insert(model, rows):
+    if rows:
+        db.session.execute(insert(model.__table__), rows)  # executemany, whatever the number of rows
+
+
+def _user(is_admin=0):
+    user_id = new_id()
+    _insert(UserMaster, [{'id': user_id, 'name': user_id, 'username': user_id, 'password': user_id,
+                          'is_admin': is_admin, 'is_active': 1}])
+    return {'user_id': user_id, 'is_admin': is_admin}
+
+
+def _users(count):
+    rows = [{'id': new_id(), 'is_admin': 0, 'is_active': 1} for _ in range(count)]
+    for row in rows:
+        row['name'] = row['username'] = row['password'] = row['id']
+    _insert(UserMaster, rows)
+    return [row['id'] for row in rows]
+
+
+def _questions(count):
+    rows = list()
+    for i in range(count):
+        question = f'question {i}'
+        rows.append({'id': new_id(), 'question': question, 'choice1': 'a', 'choice2': 'b', 'choice3': 'c',
+                     'choice4': 'd', 'answer': 1 + i % 4, 'marks': 1, 'remarks': None, 'is_active': 1,
+                     'content_hash': question_hash(question, 'a', 'b', 'c', 'd')})
+    _insert(QuestionMaster, rows)
+    return [row['id'] for row in rows]
+
+
+def _quizzes(count, question_ids=()):
+    quiz_ids = [new_id() for _ in range(count)]
+    _insert(QuizMaster, [{'id': quiz_id, 'quiz_name': quiz_id, 'is_active': 1} for quiz_id in quiz_ids])
+    _insert(QuizQuestions, [{'id': new_id(), 'quiz_id': quiz_id, 'question_id': question_id, 'is_active': 1}
+                            for quiz_id in quiz_ids for question_id in question_ids])
+    return quiz_ids
+
+
+def _assign(quiz_ids, user_ids):
+    _insert(QuizInstance, [{'id': new_id(), 'quiz_id': quiz_id, 'user_id': user_id, 'is_active': 1,
+                            'score_achieved': 0, 'is_submitted': 0}
+                           for quiz_id in quiz_ids for user_id in user_ids])
+
+
+def _group(quiz_ids, user_ids):
+    group_id = new_id()
+    _insert(UserGroup, [{'id': group_id, 'group_name': group_id, 'is_active': 1}])
+    _insert(GroupMember, [{'id': new_id(), 'group_id': group_id, 'user_id': user_id, 'is_active': 1}
+                          for user_id in user_ids])
+    _insert(GroupQuiz, [{'id': new_id(), 'group_id': group_id, 'quiz_id': quiz_id, 'is_active': 1}
+                        for quiz_id in quiz_ids])
+
+
+@scenario('list_assigned_quizzes: quizzes assigned to the user', budget=1)
+def _list_assigned_quizzes(size):
+    user = _user()
+    _assign(_quizzes(size), [user['user_id']])
+    return services.list_assigned_quizzes, user, {}
+
+
+@scenario('list_assigned_quizzes: quizzes assigned to a group of the user', budget=1)
+def _list_group_quizzes(size):
+    user = _user()
+    _group(_quizzes(size), [user['user_id']])
+    return services.list_assigned_quizzes, user, {}
+
+
+@scenario('view_quiz: members of the group the quiz is assigned to', budget=2)
+def _view_group_quiz(size):
+    user = _user()
+    quiz_ids = _quizzes(1, _questions(1))
+    _group(quiz_ids, _users(size) + [user['user_id']])
+    return services.view_quiz, user, {'quiz_id': quiz_ids[0]}
+
+
+@scenario('view_quiz: questions in the quiz', budget=2)
+def _view_quiz(size):
+    user = _user()
+    quiz_ids = _quizzes(1, _questions(size))
+    _assign(quiz_ids, [user['user_id']])
+    return services.view_quiz, user, {'quiz_id': quiz_ids[0]}
+
+
+@scenario('quiz_version: questions in the quiz', budget=2)
+def _quiz_version(size):
+    user = _user()
+    quiz_ids = _quizzes(1, _questions(size))
+    _assign(quiz_ids, [user['user_id']])
+    return services.quiz_version, user, {'quiz_id': quiz_ids[0]}
+
+
+@scenario('attempt_quiz: answers in the submission', budget=6)
+def _attempt_quiz(size):
+    user = _user()
+    question_ids = _questions(size)
+    quiz_ids = _quizzes(1, question_ids)
+    _assign(quiz_ids, [user['user_id']])
+    answers = {question_id: str(1 + i % 4) for i, question_id in enumerate(question_ids)}
+    return services.attempt_quiz, user, {'quiz_id': quiz_ids[0], 'responses': [answers]}
+
+
+@scenario('autosave_answers: answers in the request', budget=2)
+def _autosave_answers(size):
+    user = _user()
+    question_ids = _questions(size)
+    quiz_ids = _quizzes(1, question_ids)
+    _assign(quiz_ids, [user['user_id']])
+    answers = {question_id: 1 + i % 4 for i, question_id in enumerate(question_ids)}
+    return services.autosave_answers, user, {'quiz_id': quiz_ids[0], 'answers': answers}
+
+
+@scenario('list_questions: questions in the bank', budget=1)
+def _list_questions(size):
+    _questions(size)
+    return services.list_questions, _user(is_admin=1), {'limit': 100}
+
+
+@scenario('questions_version: questions in the bank', budget=1)
+def _questions_version(size):
+    _questions(size)
+    return services.questions_version, _user(is_admin=1), {'limit': 100}
+
+
+@scenario('list_quizzes: quizzes', budget=1)
+def _list_quizzes(size):
+    _quizzes(size)
+    return services.list_quizzes, _user(is_admin=1), {'limit': 100}
+
+
+@scenario('quizzes_version: quizzes', budget=1)
+def _quizzes_version(size):
+    _quizzes(size)
+    return services.quizzes_version, _user(is_admin=1), {'limit': 100}
+
+
+@scenario('all_quiz_result: users assigned to the quiz', budget=1)
+def _all_quiz_result(size):
+    quiz_ids = _quizzes(1)
+    _assign(quiz_ids, _users(size))
+    return services.all_quiz_result, _user(is_admin=1), {'quiz_id': quiz_ids[0], 'limit': 100}
+
+
+@scenario('quiz_statistics: submissions of the quiz', budget=3)
+def _quiz_statistics(size):
+    quiz_ids = _quizzes(1, _questions(10))
+    _insert(QuizInstance, [{'id': new_id(), 'quiz_id': quiz_ids[0], 'user_id': user_id, 'is_active': 0,
+                            'score_achieved': i % 11, 'is_submitted': 1}
+                           for i, user_id in enumerate(_users(size))])
+    quizstats.rebuild(db.session, quiz_ids[0])
+    return services.quiz_statistics, _user(is_admin=1), {'quiz_id': quiz_ids[0]}
+
+
+@scenario('assign_quiz: every non-admin user', budget=4)
+def _assign_quiz(size):
+    quiz_ids = _quizzes(1)
+    _users(size)
+    return services.assign_quiz, _user(is_admin=1), {'all_users': quiz_ids, 'chunk_size': 500}
+
+
+def empty_database():
+    """
+    Drop every table of the throwaway database and migrate it again from scratch.
+    """
+    db.session.remove()
+    db.drop_all()
+    migrate()
+
+
+@contextlib.contextmanager
+def count_statements():
+    """
+    Collect the statements executed on the engine while the block runs.
+
+    Yields:
+        list: The SQL of every statement, an executemany counting once.
+    """
+    statements = list()
+
+    def record(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def measure(name, size):
+    """
+    Seed a scenario at a size in an empty database and count the statements of one cold call of its service.
+
+    Returns:
+        list: The SQL of the statements executed by the call.
+    """
+    seed, budget = SCENARIOS[name]
+    with application.app_context():
+        empty_database()
+        try:
+            service, user, kwargs = seed(size)
+            db.session.commit()
+            db.session.remove()
+            if 'quiz_id' in kwargs:
+                invalidate_quiz(kwargs['quiz_id'])
+            quiz_list_cache.clear()
+            invalidate_assignments()
+            with application.test_request_context():
+                session.update(user)
+                with count_statements() as statements:
+                    result = service(**kwargs)
+                db.session.remove()
+            assert isinstance(result, tuple), f'{name} failed at size {size}: {result}'
+            return statements
+        finally:
+            db.session.rollback()
+            autosave_buffer.flush()
+
+
+def describe(statements):
+    shown = [' '.join(statement.split())[:200] for statement in statements[:SHOWN_STATEMENTS]]
+    if len(statements) > SHOWN_STATEMENTS:
+        shown.append(f'... {len(statements) - SHOWN_STATEMENTS} more')
+    return '\n'.join(shown)
+
+
+@pytest.mark.parametrize('name', list(SCENARIOS))
+def test_query_budget(name):
+    seed, budget = SCENARIOS[name]
+    counts = dict()
+    for size in SIZES:
+        statements = measure(name, size)
+        counts[size] = len(statements)
+        assert len(statements) <= budget, \
+            f'{len(statements)} statements at size {size}, over the budget of {budget}:\n{describe(statements)}'
+    assert counts[SIZES[-1]] <= counts[SIZES[0]], \
+        f'the statements grow with the data {counts}:\n{describe(statements)}'